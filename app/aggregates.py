@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+from .models import ProductivityLog, Task, TaskCompletion
+
+def _count_where(condition):
+    """Portable conditional count: SUM(CASE WHEN ... THEN 1 ELSE 0 END)"""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def task_summary(db: Session, user_id: int, now: Optional[datetime] = None) -> Dict:
+    """Task counts and average priority for a user in a single aggregate query"""
+    now = now or datetime.utcnow()
+    row = db.query(
+        func.count(Task.id).label("total"),
+        _count_where(Task.completed == True).label("completed"),
+        _count_where(and_(Task.completed == False, Task.deadline < now)).label("overdue"),
+        func.avg(Task.priority).label("avg_priority")
+    ).filter(Task.user_id == user_id).one()
+
+    return {
+        "total": row.total,
+        "completed": row.completed,
+        "overdue": row.overdue,
+        "avg_priority": float(row.avg_priority or 0)
+    }
+
+def completion_summary(db: Session, user_id: int) -> Dict:
+    """Count and average of a user's logged completion hours, from the daily rollups"""
+    row = db.query(
+        func.sum(ProductivityLog.tasks_completed).label("count"),
+        func.sum(ProductivityLog.hours_worked).label("hours")
+    ).filter(ProductivityLog.user_id == user_id).one()
+
+    count = int(row.count or 0)
+    return {"count": count, "avg_hours": float(row.hours) / count if count else 0.0}
+
+def daily_completions(db: Session, user_id: int, since: datetime) -> List[Dict]:
+    """Per-day completion counts from the daily rollups, oldest first"""
+    rows = db.query(
+        ProductivityLog.date,
+        ProductivityLog.tasks_completed
+    ).filter(
+        ProductivityLog.user_id == user_id,
+        ProductivityLog.date >= since
+    ).order_by(ProductivityLog.date).all()
+
+    return [{"date": r.date.date().isoformat(), "completed": r.tasks_completed} for r in rows]
+
+def priority_distribution(db: Session, user_id: int) -> List[Dict]:
+    """Number of tasks per priority level for a user"""
+    rows = db.query(
+        Task.priority,
+        func.count(Task.id).label("count")
+    ).filter(
+        Task.user_id == user_id
+    ).group_by(Task.priority).all()
+
+    return [{"priority": r.priority, "count": r.count} for r in rows]
+
+def recent_completion_summary(db: Session, user_id: int, lookback: int) -> Dict:
+    """Hours logged for a user's most recently completed tasks, in one query
+
+    Each recent task contributes its first TaskCompletion via a correlated
+    subquery, so the cost is one round trip regardless of lookback.
+    """
+    first_completion_hours = select(TaskCompletion.actual_hours).where(
+        TaskCompletion.task_id == Task.id
+    ).order_by(TaskCompletion.id).limit(1).correlate(Task).scalar_subquery()
+
+    recent = select(
+        Task.id,
+        first_completion_hours.label("actual_hours")
+    ).where(
+        Task.user_id == user_id,
+        Task.completed == True
+    ).order_by(Task.completed_at.desc()).limit(lookback).subquery()
+
+    row = db.execute(select(
+        func.count(recent.c.id).label("tasks"),
+        func.count(recent.c.actual_hours).label("completions"),
+        func.avg(recent.c.actual_hours).label("avg_hours")
+    )).one()
+
+    return {
+        "tasks": row.tasks,
+        "completions": row.completions,
+        "avg_hours": float(row.avg_hours) if row.avg_hours is not None else None
+    }
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import re
+from itertools import islice
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+# Content types accepted by the bulk import endpoint
+FORMATS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+_WHITESPACE = re.compile(r"\s*")
+
+# A decode error this close to the end of the buffer may be a token cut by the read boundary
+_LONGEST_TOKEN = len("-Infinity")
+
+# (row number, record, error); exactly one of record/error is set
+Record = Tuple[int, Optional[Dict], Optional[str]]
+
+def upload_format(content_type: Optional[str]) -> Optional[str]:
+    """Map a Content-Type header to an upload format, ignoring parameters"""
+    return FORMATS.get((content_type or "").split(";")[0].strip().lower())
+
+def _record(row: int, value) -> Record:
+    if not isinstance(value, dict):
+        return row, None, "Expected a JSON object"
+    return row, value, None
+
+def _iter_json_array(text: IO[str], read_size: int = 1 << 16, max_element: int = 1 << 20) -> Iterator[Record]:
+    """Decode a top-level JSON array one element at a time
+
+    A structural error, or an element longer than max_element characters,
+    ends the upload with an error record for the row where parsing
+    stopped; the rows before it are still imported.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    expect = "["
+    row = 0
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos == len(buffer) and not eof:
+            buffer, pos = text.read(read_size), 0
+            eof = not buffer
+            continue
+
+        if expect == "[":
+            if not buffer.startswith("[", pos):
+                yield row + 1, None, "Expected a JSON array"
+                return
+            pos += 1
+            expect = "item"
+            continue
+        if buffer.startswith("]", pos):
+            return
+        if pos == len(buffer):
+            yield row + 1, None, "Unexpected end of JSON array"
+            return
+        if expect == ",":
+            if not buffer.startswith(",", pos):
+                yield row + 1, None, f"Expected ',' after row {row}"
+                return
+            pos += 1
+            expect = "item"
+            continue
+
+        try:
+            value, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as exc:
+            # Only an error at the end of the buffer can mean the element spans the read boundary;
+            # an unterminated string reports where the string started
+            cut = exc.pos >= len(buffer) - _LONGEST_TOKEN or exc.msg.startswith("Unterminated string")
+            if eof or not cut:
+                yield row + 1, None, f"Invalid JSON: {exc.msg}"
+                return
+            if len(buffer) - pos > max_element:
+                yield row + 1, None, f"Row is longer than {max_element} characters"
+                return
+            # Keep the tail and read more
+            more = text.read(read_size)
+            buffer, pos, eof = buffer[pos:] + more, 0, not more
+            continue
+
+        row += 1
+        yield _record(row, value)
+        expect = ","
+
+def _iter_ndjson(text: IO[str]) -> Iterator[Record]:
+    row = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield _record(row, json.loads(line))
+        except json.JSONDecodeError as exc:
+            yield row, None, f"Invalid JSON: {exc.msg}"
+
+def _iter_csv(text: IO[str]) -> Iterator[Record]:
+    for row, values in enumerate(csv.DictReader(text), start=1):
+        # Empty cells mean "not given"; cells past the header are ignored
+        yield row, {k: v for k, v in values.items() if k is not None and v not in ("", None)}, None
+
+def iter_records(upload: IO[bytes], fmt: str, max_element: int = 1 << 20) -> Iterator[Record]:
+    """Parse an uploaded file lazily, so memory does not grow with its size"""
+    text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+    if fmt == "json":
+        return _iter_json_array(text, max_element=max_element)
+    if fmt == "ndjson":
+        return _iter_ndjson(text)
+    return _iter_csv(text)
+
+def chunked(records: Iterator[Record], size: int) -> Iterator[List[Record]]:
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,44 @@
+from celery import Celery
+from .config import settings
+
+celery_app = Celery("app", broker=settings.redis_url, backend=settings.redis_url)
+
+celery_app.conf.beat_schedule = {
+    "train-models": {
+        "task": "app.celery.train_models",
+        "schedule": settings.model_update_frequency * 24 * 60 * 60,
+    },
+    "rescore-tasks": {
+        "task": "app.celery.rescore_tasks",
+        "schedule": settings.rescore_interval,
+    },
+}
+if settings.learning_mode == "online":
+    celery_app.conf.beat_schedule["online-update"] = {
+        "task": "app.celery.online_update",
+        "schedule": settings.online_update_interval,
+    }
+
+@celery_app.task(name="app.celery.train_models")
+def train_models():
+    """Retrain both models and publish them to the model registry (per shard when sharded)"""
+    from .ml_models.training import run_training
+    from .sharding import run_on_each_shard
+
+    return run_on_each_shard(run_training)
+
+@celery_app.task(name="app.celery.rescore_tasks")
+def rescore_tasks():
+    """Refresh stored predictions for tasks whose inputs or model changed"""
+    from .ml_models.scoring import rescore_stale_tasks
+    from .sharding import run_on_each_shard
+
+    return run_on_each_shard(rescore_stale_tasks)
+
+@celery_app.task(name="app.celery.online_update")
+def online_update():
+    """Learn completions logged since the last published versions, without a full retrain"""
+    from .ml_models.online import run_online_update
+    from .sharding import run_on_each_shard
+
+    return run_on_each_shard(run_online_update)
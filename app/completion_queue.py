@@ -0,0 +1,538 @@
+"""Write-behind task completions
+
+With settings.completion_queue enabled, PUT /api/tasks/{id}/complete
+appends the completion to a durable queue and answers 202 right away. A
+CompletionWriter claims queued completions in batches and applies each
+batch in one transaction per shard: the Task updates, one executemany of
+TaskCompletion rows and one rollup upsert per user and day.
+
+Every completion carries an idempotency key (the request's Idempotency-Key
+header, or a generated one) stored on its TaskCompletion row, so retried
+requests and batches replayed after a crash are applied once. Completions
+still failing after completion_max_attempts claims are moved to the dead
+letters (a table or stream next to the queue) instead of being retried forever.
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from .config import settings
+from .models import Task, TaskCompletion
+from .response_cache import invalidate_user
+from .rollups import day_start, record_daily_completion
+from .sharding import UserMovingError, get_shards
+
+logger = logging.getLogger(__name__)
+
+def completion_event(
+    task_id: int,
+    user_id: int,
+    actual_hours: float,
+    idempotency_key: Optional[str] = None,
+    completed_at: Optional[datetime] = None
+) -> Dict:
+    """A queued completion; completed_at is taken when the request is acknowledged"""
+    return {
+        "key": idempotency_key or uuid.uuid4().hex,
+        "task_id": task_id,
+        "user_id": user_id,
+        "actual_hours": actual_hours,
+        "completed_at": (completed_at or datetime.utcnow()).isoformat(),
+    }
+
+# Queued completion as claimed by a writer: (queue id, event, delivery attempts including this one)
+Claimed = Tuple[object, Dict, int]
+
+# What append did: queued the event, found its key already queued (a retry),
+# or found another completion of the same task still queued
+QUEUED, DUPLICATE, TASK_PENDING = "queued", "duplicate", "task_pending"
+
+class SQLiteCompletionQueue:
+    """Completions queued in a local SQLite file in WAL mode
+
+    Appends are one short write each, with no fsync unless synchronous is
+    FULL. Any process on the host may run a writer: batches are claimed
+    for claim_timeout seconds, after which another writer retries them.
+    Dead letters go to the completion_dead_letters table in the same file.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, synchronous: str = "NORMAL", claim_timeout: float = 30.0):
+        self.claim_timeout = claim_timeout
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completion_queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " event TEXT NOT NULL,"
+            " claimed_until REAL NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " task_id INTEGER)"
+        )
+        # Queue files written before attempts were counted and task ids kept
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(completion_queue)")}
+        if "attempts" not in columns:
+            self._conn.execute("ALTER TABLE completion_queue ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        if "task_id" not in columns:
+            self._conn.execute("ALTER TABLE completion_queue ADD COLUMN task_id INTEGER")
+            self._conn.execute("UPDATE completion_queue SET task_id = json_extract(event, '$.task_id')")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_completion_queue_task_id ON completion_queue (task_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completion_dead_letters ("
+            " id INTEGER PRIMARY KEY,"
+            " key TEXT NOT NULL,"
+            " event TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " error TEXT,"
+            " failed_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def append(self, event: Dict) -> str:
+        """Queue a completion unless its key, or another completion of its task, is already queued"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                queued = self._conn.execute(
+                    "SELECT key FROM completion_queue WHERE key = ? OR task_id = ?", (event["key"], event["task_id"])
+                ).fetchall()
+                if not queued:
+                    self._conn.execute(
+                        "INSERT INTO completion_queue (key, event, task_id) VALUES (?, ?, ?)",
+                        (event["key"], json.dumps(event), event["task_id"])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if not queued:
+            return QUEUED
+        return DUPLICATE if any(key == event["key"] for key, in queued) else TASK_PENDING
+
+    def claim(self, limit: int) -> List[Claimed]:
+        """Oldest unclaimed (or expired) completions, as (id, event, attempts)"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE completion_queue SET claimed_until = ?, attempts = attempts + 1 WHERE id IN ("
+                " SELECT id FROM completion_queue WHERE claimed_until < ? ORDER BY id LIMIT ?"
+                ") RETURNING id, event, attempts",
+                (now + self.claim_timeout, now, limit)
+            ).fetchall()
+        return sorted((queue_id, json.loads(event), attempts) for queue_id, event, attempts in rows)
+
+    def ack(self, entries: Sequence[Claimed]):
+        if entries:
+            with self._lock:
+                self._conn.executemany(
+                    "DELETE FROM completion_queue WHERE id = ?", [(queue_id,) for queue_id, _, _ in entries]
+                )
+
+    def release(self, entries: Sequence[Claimed]):
+        """Make claimed completions available again before their claim expires, without counting the attempt"""
+        if entries:
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE completion_queue SET claimed_until = 0, attempts = attempts - 1 WHERE id = ?",
+                    [(queue_id,) for queue_id, _, _ in entries]
+                )
+
+    def dead_letter(self, entries: Sequence[Claimed], error: str):
+        """Move claimed completions out of the queue into completion_dead_letters"""
+        if entries:
+            now = time.time()
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany(
+                        "INSERT INTO completion_dead_letters (key, event, attempts, error, failed_at)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        [(event["key"], json.dumps(event), attempts, error, now) for _, event, attempts in entries]
+                    )
+                    self._conn.executemany(
+                        "DELETE FROM completion_queue WHERE id = ?", [(queue_id,) for queue_id, _, _ in entries]
+                    )
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM completion_queue").fetchone()[0]
+
+    def dead_letters(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM completion_dead_letters").fetchone()[0]
+
+# Queue a completion unless its key was seen or its task has one queued:
+# the checks, the stream entry and both keys in one step
+_APPEND_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 'duplicate'
+end
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 'task_pending'
+end
+redis.call('XADD', KEYS[2], '*', 'event', ARGV[2])
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[1])
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[1])
+return 'queued'
+"""
+
+class RedisCompletionQueue:
+    """Completions queued in a Redis stream, read through a consumer group
+
+    Keys are remembered for idempotency_ttl seconds so a retried request is
+    not queued twice, and tasks with a completion queued are marked until
+    it leaves the stream. Entries claimed by a writer that died are taken
+    over by another after claim_timeout. Dead letters go to the <stream>:dead stream.
+    """
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        redis_url: str,
+        stream: str = "task-completions",
+        claim_timeout: float = 30.0,
+        idempotency_ttl: int = 86400
+    ):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.stream = stream
+        self.group = stream
+        self.dead_stream = f"{stream}:dead"
+        self.consumer = f"writer-{uuid.uuid4().hex[:8]}"
+        self.claim_timeout = claim_timeout
+        self.idempotency_ttl = idempotency_ttl
+        try:
+            self.client.xgroup_create(stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._append = self.client.register_script(_APPEND_SCRIPT)
+
+    def _task_key(self, task_id: int) -> str:
+        return f"{self.stream}:task:{task_id}"
+
+    def append(self, event: Dict) -> str:
+        return self._append(
+            keys=[f"{self.stream}:key:{event['key']}", self.stream, self._task_key(event["task_id"])],
+            args=[self.idempotency_ttl, json.dumps(event)]
+        ).decode()
+
+    def claim(self, limit: int) -> List[Claimed]:
+        # Entries another writer claimed and never acknowledged come first
+        _, reclaimed, *_ = self.client.xautoclaim(
+            self.stream, self.group, self.consumer, int(self.claim_timeout * 1000), "0-0", count=limit
+        )
+        attempts = {}
+        if reclaimed:
+            attempts = {
+                entry["message_id"]: entry["times_delivered"]
+                for entry in self.client.xpending_range(
+                    self.stream, self.group, reclaimed[0][0], reclaimed[-1][0], len(reclaimed)
+                )
+            }
+        entries = list(reclaimed)
+        if len(entries) < limit:
+            for _, new_entries in self.client.xreadgroup(
+                self.group, self.consumer, {self.stream: ">"}, count=limit - len(entries)
+            ):
+                entries.extend(new_entries)
+        return [
+            (entry_id, json.loads(fields[b"event"]), attempts.get(entry_id, 1))
+            for entry_id, fields in entries if fields
+        ]
+
+    def ack(self, entries: Sequence[Claimed]):
+        if entries:
+            pipeline = self.client.pipeline()
+            self._remove(pipeline, entries)
+            pipeline.execute()
+
+    def _remove(self, pipeline, entries: Sequence[Claimed]):
+        ids = [entry_id for entry_id, _, _ in entries]
+        pipeline.xack(self.stream, self.group, *ids)
+        pipeline.xdel(self.stream, *ids)
+        pipeline.delete(*{self._task_key(event["task_id"]) for _, event, _ in entries})
+
+    def release(self, entries: Sequence[Claimed]):
+        """Make claimed completions available to the next claim, without counting the attempt
+
+        Each entry is claimed back with its idle time at claim_timeout, so
+        XAUTOCLAIM takes it at once, and its delivery count put back to
+        what it was before this claim.
+        """
+        if entries:
+            pipeline = self.client.pipeline()
+            for entry_id, _, attempts in entries:
+                pipeline.xclaim(
+                    self.stream, self.group, self.consumer, 0, [entry_id],
+                    idle=int(self.claim_timeout * 1000), retrycount=attempts - 1, justid=True
+                )
+            pipeline.execute()
+
+    def dead_letter(self, entries: Sequence[Claimed], error: str):
+        """Copy claimed completions to the dead-letter stream, then drop them from the queue"""
+        if entries:
+            pipeline = self.client.pipeline()
+            for _, event, attempts in entries:
+                pipeline.xadd(self.dead_stream, {"event": json.dumps(event), "attempts": attempts, "error": error})
+            self._remove(pipeline, entries)
+            pipeline.execute()
+
+    def pending(self) -> int:
+        return self.client.xlen(self.stream)
+
+    def dead_letters(self) -> int:
+        return self.client.xlen(self.dead_stream)
+
+_completion_queue = None
+_completion_queue_lock = threading.Lock()
+
+def get_completion_queue():
+    """Return the process-wide completion queue, or None when completions are written synchronously"""
+    global _completion_queue
+    if settings.completion_queue == "off":
+        return None
+    if _completion_queue is None:
+        with _completion_queue_lock:
+            if _completion_queue is None:
+                if settings.completion_queue == "redis":
+                    _completion_queue = RedisCompletionQueue(
+                        settings.redis_url,
+                        stream=settings.completion_queue_stream,
+                        claim_timeout=settings.completion_claim_timeout,
+                        idempotency_ttl=settings.completion_idempotency_ttl
+                    )
+                else:
+                    _completion_queue = SQLiteCompletionQueue(
+                        settings.completion_queue_path,
+                        synchronous=settings.completion_queue_synchronous,
+                        claim_timeout=settings.completion_claim_timeout
+                    )
+    return _completion_queue
+
+def apply_completions(db: Session, events: Sequence[Dict]) -> Dict:
+    """Apply queued completions in the caller's transaction, skipping keys already applied
+
+    Returns the applied events and, per (user, day), the rollup write-through
+    values for the history cache, and the events skipped because their task
+    was already completed. Completions of tasks that no longer exist, or
+    that were already completed, are dropped with a warning.
+    """
+    keys = [event["key"] for event in events]
+    applied_keys = set(db.scalars(
+        select(TaskCompletion.idempotency_key).where(TaskCompletion.idempotency_key.in_(keys))
+    ))
+    tasks = {
+        task.id: task
+        for task in db.scalars(select(Task).where(Task.id.in_({event["task_id"] for event in events})))
+    }
+
+    applied, skipped = [], []
+    days = defaultdict(lambda: [0.0, 0, 0])  # (user, day) -> hours, on time, completions
+    for event in events:
+        if event["key"] in applied_keys:
+            continue
+        applied_keys.add(event["key"])
+        task = tasks.get(event["task_id"])
+        if task is None or task.user_id != event["user_id"]:
+            logger.warning("Dropping queued completion of unknown task %s", event["task_id"])
+            continue
+        if task.completed:
+            # Completed again under another key: logging it would count the task twice
+            logger.warning(
+                "Dropping queued completion %s of task %s, already completed", event["key"], event["task_id"]
+            )
+            skipped.append(event)
+            continue
+
+        completed_at = datetime.fromisoformat(event["completed_at"])
+        task.completed = True
+        task.completed_at = completed_at
+        day = days[(event["user_id"], day_start(completed_at))]
+        day[0] += event["actual_hours"]
+        day[1] += task.deadline is None or completed_at <= task.deadline
+        day[2] += 1
+        applied.append(event)
+
+    if applied:
+        db.execute(insert(TaskCompletion), [
+            {
+                "task_id": event["task_id"],
+                "user_id": event["user_id"],
+                "actual_hours": event["actual_hours"],
+                "completion_date": datetime.fromisoformat(event["completed_at"]),
+                "idempotency_key": event["key"],
+            }
+            for event in applied
+        ])
+    rollups = {
+        (user_id, day): record_daily_completion(db, user_id, day, hours, on_time, count)
+        for (user_id, day), (hours, on_time, count) in days.items()
+    }
+    return {"applied": applied, "rollups": rollups, "skipped": skipped}
+
+class CompletionWriter:
+    """Drains the completion queue on a daemon thread, one transaction per shard and batch"""
+
+    def __init__(
+        self,
+        queue,
+        max_batch: Optional[int] = None,
+        interval: Optional[float] = None,
+        max_attempts: Optional[int] = None
+    ):
+        self.queue = queue
+        self.max_batch = max_batch or settings.completion_flush_max
+        self.interval = interval if interval is not None else settings.completion_flush_interval
+        self.max_attempts = max_attempts or settings.completion_max_attempts
+        self.flushed = 0
+        self.duplicates = 0
+        self.already_completed = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.dead_lettered = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="completion-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, drain: bool = True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while drain and self.flush():
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                flushed = self.flush()
+            except Exception:
+                logger.exception("Flushing queued completions failed; they are retried after the claim expires")
+                flushed = 0
+            if flushed < self.max_batch:
+                self._stop.wait(self.interval)
+
+    def flush(self) -> int:
+        """Apply one claimed batch; returns the number of queued completions it covered"""
+        claimed = self.queue.claim(self.max_batch)
+        if not claimed:
+            return 0
+
+        shards = get_shards()
+        by_shard = defaultdict(list)
+        moving = []
+        for entry in claimed:
+            try:
+                by_shard[shards.for_user(entry[1]["user_id"]).name].append(entry)
+            except UserMovingError:
+                moving.append(entry)
+        self.queue.release(moving)
+
+        for name, entries in by_shard.items():
+            try:
+                self._apply(shards[name], entries)
+            except Exception as exc:
+                self.failed_batches += 1
+                logger.exception("Flushing %s queued completions to shard %s failed", len(entries), name)
+                self._retry_or_dead_letter(shards[name], entries, exc)
+        return len(claimed) - len(moving)
+
+    def _apply(self, shard, entries: Sequence[Claimed]):
+        from .ml_models.history_cache import get_history_cache
+
+        with shard.session() as db:
+            result = apply_completions(db, [event for _, event, _ in entries])
+            db.commit()
+        self.queue.ack(entries)
+
+        self.flushed += len(result["applied"])
+        self.already_completed += len(result["skipped"])
+        self.duplicates += len(entries) - len(result["applied"]) - len(result["skipped"])
+        self.batches += 1
+        cache = get_history_cache()
+        for event in result["applied"]:
+            cache.record_completion(event["user_id"], event["actual_hours"])
+        for (user_id, _), rollup in result["rollups"].items():
+            cache.record_productivity(user_id, *rollup)
+        for user_id in {event["user_id"] for event in result["applied"]}:
+            invalidate_user(user_id)
+
+    def _retry_or_dead_letter(self, shard, entries: Sequence[Claimed], error: Exception):
+        """After a failed batch: completions on their last attempt are applied one at a time
+
+        The rest stay claimed and are retried as a batch when the claim
+        expires. Applying the last attempts alone keeps one bad completion
+        from taking its batch to the dead letters; those still failing go there.
+        """
+        last = [entry for entry in entries if entry[2] >= self.max_attempts]
+        for entry in last:
+            if len(entries) > 1:
+                try:
+                    self._apply(shard, [entry])
+                    continue
+                except Exception as exc:
+                    error = exc
+            logger.error(
+                "Dead-lettering completion %s of task %s after %s attempts: %r",
+                entry[1]["key"], entry[1]["task_id"], entry[2], error
+            )
+            self.queue.dead_letter([entry], repr(error))
+            self.dead_lettered += 1
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.queue.backend,
+            "pending": self.queue.pending(),
+            "flushed": self.flushed,
+            "duplicates": self.duplicates,
+            "already_completed": self.already_completed,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "dead_letters": self.queue.dead_letters(),
+            "dead_lettered": self.dead_lettered,
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flush queued task completions to the database")
+    parser.add_argument("--once", action="store_true", help="drain the queue and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    queue = get_completion_queue()
+    if queue is None:
+        parser.exit(1, "settings.completion_queue is off\n")
+    writer = CompletionWriter(queue)
+    if args.once:
+        writer.stop(drain=True)
+        print(json.dumps(writer.stats()))
+    else:
+        writer.start()
+        try:
+            while True:
+                time.sleep(60)
+                logger.info("Completion writer: %s", json.dumps(writer.stats()))
+        except KeyboardInterrupt:
+            writer.stop(drain=True)
@@ -1,8 +1,24 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     database_url: str = "sqlite:///./taskmanager.db"
+    async_database_url: Optional[str] = None  # derived from database_url when unset
+    db_echo: bool = False  # logs every statement; use the /metrics DB timings instead
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_recycle: int = 1800  # seconds
+    db_pool_timeout: int = 30  # seconds
+    
+    # Sharding by user: {"name": url, ...} as JSON; shard numbers follow this order, so only append
+    shard_urls: Dict[str, str] = {}  # empty keeps everything in database_url
+    shard_directory_url: Optional[str] = None  # where moved users are recorded; defaults to the first shard
+    shard_router: str = "hash"  # or "module:Class", a ShardRouter subclass (e.g. keyed by team)
+    shard_directory_ttl: float = 2.0  # seconds a process caches a user's placement
+    shard_directory_cache_size: int = 100000
+    shard_move_grace: float = 5.0  # seconds in-flight requests get to finish before a move copies rows
+    shard_id_stride: int = 64  # ids on shard n are n + stride * k, so at most this many shards
+    
     redis_url: str = "redis://localhost:6379"
     secret_key: str = "your-secret-key-here"
     algorithm: str = "HS256"
@@ -11,8 +27,107 @@ class Settings(BaseSettings):
     # ML Model settings
     model_update_frequency: int = 7  # days
     min_data_points: int = 10
+    model_dir: str = "./model_store"
+    inference_backend: str = "compiled"  # flat NumPy node tables, memory-mapped and shared by workers; or "sklearn"
+    compiled_max_batch: int = 256  # Larger batches go to scikit-learn's C traversal once the forest is in memory
+    model_reload_interval: int = 60  # seconds between checks for a new version
+    training_chunk_size: int = 5000
+    training_snapshot_dir: Optional[str] = None  # columns written here are memory-mapped by the fit processes
+    training_snapshot_format: str = "npy"  # or "parquet" (requires pyarrow)
+    
+    # Online learning: "batch" publishes random forests retrained from scratch, "online" publishes
+    # SGD linear models that learn new completions with partial_fit between full trainings
+    learning_mode: str = "batch"
+    online_update_interval: int = 60  # seconds between incremental updates
+    online_min_rows: int = 20  # new completions needed to publish a version; fewer wait for the next run
+    online_watermark_overlap: float = 3600.0  # seconds re-read before the watermark; must exceed how late a completion commits
+    online_batch_size: int = 256  # rows per partial_fit call
+    online_learning_rate: float = 0.01  # constant, so the models keep tracking drift
+    online_residual_decay: float = 0.1  # weight of a user's newest completion in their correction
+    online_residual_prior: float = 5.0  # completions after which a user's correction counts half
+    online_keep_versions: int = 20  # older versions are pruned from the model store
+    
+    # Optional model-server sidecar (python -m app.ml_models.model_server) shared by all workers
+    model_server_socket: Optional[str] = None  # Unix socket path; unset scores in-process
+    model_server_max_batch: int = 256  # rows coalesced into one scoring call
+    model_server_max_wait_us: int = 500  # how long a batch waits for more requests
+    model_server_timeout: float = 2.0  # seconds, then the worker scores with the rules
+    model_server_local_fallback: bool = False  # load the forests in every worker while the server is down
+    
+    # Write-behind task completions: "off" commits each completion in its request; "sqlite" (a WAL file
+    # per host) or "redis" (a stream) queues it durably, answers 202, and a writer flushes batches
+    completion_queue: str = "off"
+    completion_queue_path: str = "./completion_queue.db"
+    completion_queue_synchronous: str = "NORMAL"  # SQLite: survives process crashes; "FULL" also survives power loss
+    completion_queue_stream: str = "task-completions"  # Redis stream and consumer group
+    completion_writer: bool = True  # flush from each web process; disable when `python -m app.completion_queue` runs
+    completion_flush_max: int = 500  # completions per transaction
+    completion_flush_interval: float = 0.05  # seconds the writer waits when the queue is empty
+    completion_claim_timeout: float = 30.0  # seconds before a batch claimed but not flushed is retried
+    completion_max_attempts: int = 5  # claims of a completion that keeps failing before it is dead-lettered
+    completion_idempotency_ttl: int = 86400  # seconds a queued Idempotency-Key is remembered (Redis)
+    
+    # Startup
+    migrate_on_startup: bool = True  # disable when `python -m app.migrations` runs as a deploy step
+    model_warmup: str = "background"  # "background" (after startup), "blocking" or "off" (first prediction)
+    
+    # Background jobs (training, rescoring): "celery", "local" (in-process threads) or "off"
+    scheduler: str = "off"
+    
+    # Rescoring of stored task predictions
+    rescore_interval: int = 300  # seconds between runs
+    rescore_batch_size: int = 500
+    rescore_max_per_run: int = 20000
+    rescore_batch_pause: float = 0.05  # seconds slept between batches
+    
+    # Instrumentation: /metrics histograms, plus folded stacks for requests slower than the threshold
+    metrics_enabled: bool = True
+    profile_slow_requests_ms: int = 0  # 0 disables the sampling profiler
+    profile_interval_ms: int = 5
+    profile_dir: str = "./profiles"
+    
+    # Weekly planning
+    plan_hours_per_day: float = 8.0  # matches the 40-hour week behind predicted_weekly_capacity
+    plan_workday_start: int = 9  # UTC hour
+    plan_horizon_days: int = 7
+    plan_search_budget_per_task: int = 5  # local-search checks per task when building a plan
+    plan_edit_search_budget: int = 2000  # local-search checks around one incremental edit
+    plan_cache_max_entries: int = 1000
+    
+    # Task listing
+    task_page_size: int = 100  # used when only a cursor is given
+    task_stream_chunk_size: int = 200
+    
+    # Bulk task import
+    bulk_chunk_size: int = 1000  # rows inserted, scored and committed together
+    bulk_spool_max_memory: int = 1 << 20  # bytes of upload kept in memory before spilling to disk
+    bulk_max_row_chars: int = 1 << 20  # longest single JSON array element; a longer one ends the upload
+    
+    # Natural-language task parsing (POST /api/tasks/parse)
+    task_parser_model_dir: Optional[str] = None  # local token-classification model (needs torch); unset parses with rules only
+    task_parser_model_threshold: float = 0.6  # rule parses below this confidence also go through the model
+    task_parser_batch_size: int = 32  # sentences per forward pass
+    task_parser_cache_size: int = 10000
+    task_parser_max_texts: int = 1000  # per request
+    
+    # Analytics settings
+    analytics_lookback: int = 20  # recent completed tasks used for capacity predictions
+    analytics_max_lookback: int = 1000
+    
+    # User history feature cache ("memory" or "redis"); use redis with several workers, since a
+    # completion is written through to the cache of the worker that handled it only
+    history_cache_backend: str = "memory"
+    history_cache_max_entries: int = 10000  # per worker, or in Redis, least recently used evicted first
+    history_cache_ttl: int = 3600  # seconds, redis
+    history_cache_local_ttl: int = 30  # seconds, memory; bounds how stale another worker's completions leave it
+    
+    # Analytics/insights response cache ("memory", "redis" or "off"); use redis with several workers
+    response_cache_backend: str = "memory"
+    response_cache_max_entries: int = 10000
+    response_cache_ttl: int = 300  # seconds; also bounds staleness of time-dependent fields like overdue counts
     
     class Config:
         env_file = ".env"
+        protected_namespaces = ("settings_",)
 
 settings = Settings()
\ No newline at end of file
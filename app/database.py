@@ -1,20 +1,96 @@
+from fastapi import Request
 from sqlalchemy import create_engine, MetaData
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .metrics import instrument_engine
 
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    echo=True
-)
+def _pool_options(url: str) -> dict:
+    """Pool sizing from settings
+
+    In-memory SQLite uses a single-connection pool and aiosqlite uses
+    NullPool, neither of which accepts sizing arguments.
+    """
+    if url.startswith("sqlite+aiosqlite") or (
+        url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":"))
+    ):
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+
+def _async_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver"""
+    for sync_prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+def create_db_engine(url: str):
+    """Engine with the pool and instrumentation settings every database gets"""
+    db_engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        echo=settings.db_echo,
+        **_pool_options(url)
+    )
+    if settings.metrics_enabled:
+        instrument_engine(db_engine)
+    return db_engine
+
+def create_async_db_engine(url: str):
+    """asyncio engine and session factory for a database URL (needs aiosqlite or asyncpg)"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        url,
+        pool_pre_ping=True,
+        echo=settings.db_echo,
+        **_pool_options(url)
+    )
+    if settings.metrics_enabled:
+        instrument_engine(async_engine.sync_engine)
+    return async_engine, async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+engine = create_db_engine(settings.database_url)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    """Session on the database holding the request's user (user_id in the path or query)"""
+    from .sharding import get_shards, request_user_id
+
+    db = get_shards().session(request_user_id(request))
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+_async_engine = None
+_AsyncSessionLocal = None
+
+def get_async_engine():
+    """Create the asyncio engine on first use (needs aiosqlite or asyncpg)"""
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        url = settings.async_database_url or _async_url(settings.database_url)
+        _async_engine, _AsyncSessionLocal = create_async_db_engine(url)
+    return _async_engine
+
+def get_async_sessionmaker():
+    get_async_engine()
+    return _AsyncSessionLocal
+
+async def get_async_db(request: Request):
+    from .sharding import get_shards, request_user_id
+
+    async with get_shards().async_session(request_user_id(request)) as db:
+        yield db
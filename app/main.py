@@ -1,16 +1,96 @@
-from fastapi import FastAPI, HTTPException, Depends
+import logging
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from .database import get_db, engine, Base
+from .database import get_db
 from .routers import tasks, users, analytics
-from .ml_models import TaskPrioritizer, DeadlinePredictor
+from .completion_queue import CompletionWriter, get_completion_queue
+from .config import settings
+from .metrics import MetricsMiddleware, SlowRequestProfiler, render_metrics
+from .ml_models.history_cache import get_history_cache
+from .response_cache import get_response_cache
+from .scheduler import PeriodicJob
+from .sharding import UserMovingError, get_shards, run_on_each_shard
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Readiness, reported by /ready; /health only says the process is up
+readiness = {"schema": False, "models": False}
+
+def warm_up():
+    """Load the models and score once, importing scikit-learn off the request path"""
+    from .ml_models.scoring import warm_up_models
+
+    try:
+        logger.info("Models warmed up, serving %s", warm_up_models())
+    except Exception:
+        logger.exception("Model warm-up failed; models load on first prediction instead")
+    readiness["models"] = True
+
+def start_background_jobs(app: FastAPI):
+    app.state.jobs = []
+    if settings.scheduler == "local":
+        from .ml_models.scoring import rescore_stale_tasks
+        from .ml_models.training import run_training
+
+        # Each run covers every shard in turn, with that shard's models
+        app.state.jobs = [
+            PeriodicJob(
+                "train-models",
+                settings.model_update_frequency * 24 * 60 * 60,
+                lambda: run_on_each_shard(run_training)
+            ),
+            PeriodicJob("rescore-tasks", settings.rescore_interval, lambda: run_on_each_shard(rescore_stale_tasks)),
+        ]
+        if settings.learning_mode == "online":
+            from .ml_models.online import run_online_update
+
+            app.state.jobs.append(PeriodicJob(
+                "online-update", settings.online_update_interval, lambda: run_on_each_shard(run_online_update)
+            ))
+        for job in app.state.jobs:
+            job.start()
+
+def start_completion_writer(app: FastAPI):
+    app.state.completion_writer = None
+    queue = get_completion_queue()
+    if queue is not None and settings.completion_writer:
+        app.state.completion_writer = CompletionWriter(queue)
+        app.state.completion_writer.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes run here (or as a separate `python -m app.migrations` step), not at import
+    if settings.migrate_on_startup:
+        get_shards().upgrade()
+    readiness["schema"] = True
+
+    start_background_jobs(app)
+    start_completion_writer(app)
+
+    if settings.model_warmup == "blocking":
+        warm_up()
+    elif settings.model_warmup == "background":
+        # Startup completes right away; /ready turns 200 once the models are loaded
+        threading.Thread(target=warm_up, name="model-warmup", daemon=True).start()
+    else:
+        readiness["models"] = True  # loaded by the first prediction
+
+    yield
+
+    for job in app.state.jobs:
+        job.stop()
+    if app.state.completion_writer is not None:
+        app.state.completion_writer.stop(drain=True)  # acknowledged completions are written before exit
 
 app = FastAPI(
     title="Smart Task Manager AI",
     description="An intelligent task management system with ML-powered prioritization",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -21,7 +101,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.metrics_enabled:
+    profiler = None
+    if settings.profile_slow_requests_ms > 0:
+        profiler = SlowRequestProfiler(
+            settings.profile_slow_requests_ms,
+            interval_ms=settings.profile_interval_ms,
+            output_dir=settings.profile_dir
+        )
+        profiler.start()
+    app.add_middleware(MetricsMiddleware, profiler=profiler)
+
+@app.exception_handler(UserMovingError)
+def user_moving_handler(request: Request, exc: UserMovingError):
+    """A user is briefly unavailable while their rows move to another shard"""
+    retry_after = settings.shard_directory_ttl + settings.shard_move_grace
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(max(1, round(retry_after)))}
+    )
+
 app.include_router(tasks.router, prefix="/api/tasks", tags=["tasks"])
+app.include_router(tasks.async_router, prefix="/api/async/tasks", tags=["tasks (async)"])
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
 
@@ -31,4 +133,26 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "ai_status": "active"}
\ No newline at end of file
+    """Liveness: answers as soon as the process serves requests"""
+    return {"status": "healthy", "ai_status": "active" if readiness["models"] else "warming_up"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness: 503 until the schema is migrated and the models are warmed up"""
+    ready = all(readiness.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "starting", **readiness},
+        status_code=200 if ready else 503
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of request, query and model timings"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "history_cache": get_history_cache().stats(),
+        "response_cache": get_response_cache().stats()
+    }
\ No newline at end of file
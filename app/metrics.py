@@ -0,0 +1,240 @@
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from .config import settings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+_INF = 'le="+Inf"'
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Prometheus histogram with a fixed label set, safe to observe from any thread"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}  # labels -> [per-bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:.9g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route",
+    ("method", "route", "status")
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request",
+    ("method", "route"), buckets=COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per request",
+    ("method", "route")
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Latency of individual SQL statements",
+    ("operation",)
+)
+MODEL_STAGE_SECONDS = Histogram(
+    "model_stage_duration_seconds", "Time spent per model inference stage",
+    ("model", "stage")
+)
+
+METRICS = [REQUEST_SECONDS, REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, DB_QUERY_SECONDS, MODEL_STAGE_SECONDS]
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+class RequestStats:
+    """Per-request DB counters, shared with threadpool workers through a context variable"""
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+@contextmanager
+def model_stage(model: str, stage: str) -> Iterator[None]:
+    """Time one inference stage (extract_features, transform, predict...)"""
+    if not settings.metrics_enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        MODEL_STAGE_SECONDS.observe((model, stage), time.perf_counter() - started)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    DB_QUERY_SECONDS.observe((operation,), elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+def instrument_engine(engine):
+    """Time every statement run through a (sync) Engine"""
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class SlowRequestProfiler:
+    """Sampling profiler that keeps recent stacks and dumps them for slow requests
+
+    A daemon thread samples every thread's stack each interval into a ring
+    buffer. When a request exceeds the threshold, the samples taken during
+    it from threads running application code are written in the collapsed
+    ("folded") format read by flamegraph.pl and speedscope. Requests running
+    concurrently in that window contribute samples too.
+    """
+
+    def __init__(self, threshold_ms: int, interval_ms: int = 5, output_dir: str = "./profiles", window_seconds: int = 60):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self.app_root = os.path.dirname(os.path.abspath(__file__))
+        self._samples: deque = deque(maxlen=max(1, int(window_seconds / self.interval)))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _collapse(self, frame) -> Optional[str]:
+        names = []
+        in_app = False
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename.startswith(self.app_root):
+                in_app = True
+                filename = os.path.relpath(code.co_filename, os.path.dirname(self.app_root))
+            else:
+                filename = os.path.basename(code.co_filename)
+            names.append(f"{code.co_name} ({filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names)) if in_app else None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = self._collapse(frame)
+                if stack is not None:
+                    self._samples.append((now, stack))
+
+    def request_finished(self, route: str, started: float, elapsed: float):
+        if elapsed < self.threshold:
+            return
+        stacks = Counter(stack for at, stack in list(self._samples) if at >= started)
+        if not stacks:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{int(elapsed * 1000)}ms.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and DB usage per route"""
+
+    def __init__(self, app, profiler: Optional[SlowRequestProfiler] = None):
+        self.app = app
+        self.profiler = profiler
+        self._route_paths: Optional[Dict] = None
+
+    def _route(self, scope) -> str:
+        # Label by route template, not raw path, to keep label cardinality bounded
+        if self._route_paths is None and "app" in scope:
+            self._route_paths = {
+                getattr(route, "endpoint", None): route.path for route in scope["app"].routes
+            }
+        return (self._route_paths or {}).get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = self._route(scope)
+            method = scope["method"]
+            REQUEST_SECONDS.observe((method, route, str(status)), elapsed)
+            REQUEST_DB_QUERIES.observe((method, route), stats.queries)
+            REQUEST_DB_SECONDS.observe((method, route), stats.db_seconds)
+            if self.profiler is not None:
+                self.profiler.request_finished(f"{method} {route}", started, elapsed)
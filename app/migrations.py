@@ -0,0 +1,51 @@
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from . import models  # noqa: F401 - registers the tables on Base.metadata
+from .database import Base
+
+logger = logging.getLogger(__name__)
+
+# Indexes an older schema created that a declared index now replaces
+SUPERSEDED_INDEXES = {
+    "productivity_logs": ["ix_productivity_logs_user_date"],  # by ux_productivity_logs_user_date
+}
+
+def upgrade(engine: Engine):
+    """Bring an existing database up to the current schema
+
+    create_all only creates missing tables, so columns and indexes added to
+    tables that already exist are created here individually, and
+    superseded indexes are dropped. New columns must be nullable.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=engine.dialect)
+                logger.info("Adding column %s.%s", table.name, column.name)
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    ))
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info("Creating index %s", index.name)
+                index.create(bind=engine)
+        for name in SUPERSEDED_INDEXES.get(table.name, ()):
+            if name in existing:
+                # Otherwise every write to the table keeps maintaining it
+                logger.info("Dropping index %s", name)
+                with engine.begin() as conn:
+                    conn.execute(text(f"DROP INDEX {name}"))
+
+if __name__ == "__main__":
+    from .sharding import get_shards
+
+    logging.basicConfig(level=logging.INFO)
+    get_shards().upgrade()  # every shard when sharded
@@ -1 +1,23 @@
-"""Machine Learning Models for Smart Task Manager"""
\ No newline at end of file
+"""Machine Learning Models for Smart Task Manager
+
+The predictors pull in scikit-learn and NumPy, so they are imported on
+first attribute access rather than with the package.
+"""
+
+_EXPORTS = {
+    "TaskPrioritizer": ".prioritizer",
+    "DeadlinePredictor": ".deadline_predictor",
+    "ModelRegistry": ".registry",
+    "get_model_registry": ".registry",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Union
+import numpy as np
+from sqlalchemy import ColumnElement, func, select
+from sqlalchemy.orm import Session
+from ..models import Task, TaskCompletion
+from .history_cache import UserHistoryStats
+
+TRAINING_COLUMNS = {
+    "user_id": np.int64,
+    "completion_id": np.int64,  # what online learning records as learned, not a feature
+    # TaskPrioritizer features
+    "days_to_deadline": np.float64,
+    "task_age": np.float64,
+    "estimated_hours": np.float64,
+    "avg_completion_time": np.float64,
+    "productivity_score": np.float64,
+    "tasks_per_day": np.float64,
+    # DeadlinePredictor features
+    "task_length": np.float64,
+    "title_length": np.float64,
+    "completion_variance": np.float64,
+    # Labels
+    "was_completed_on_time": np.bool_,
+    "actual_hours_taken": np.float64,
+}
+
+class ColumnSet:
+    """Equal-length, named NumPy columns: the columnar stand-in for a list of row dicts"""
+
+    def __init__(self, columns: Mapping[str, np.ndarray]):
+        self.columns = dict(columns)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def matrix(self, names: Sequence[str]) -> np.ndarray:
+        """2-D float64 feature matrix with one column per name"""
+        X = np.empty((len(self), len(names)))
+        for i, name in enumerate(names):
+            X[:, i] = self.columns[name]
+        return X
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict], names: Optional[Iterable[str]] = None) -> "ColumnSet":
+        names = list(names or (rows[0] if rows else []))
+        return cls({name: np.array([row[name] for row in rows]) for name in names})
+
+def as_columns(data: Union[ColumnSet, Sequence[Dict]]) -> ColumnSet:
+    """Accept training data as columns, or as row dicts from older callers"""
+    return data if isinstance(data, ColumnSet) else ColumnSet.from_rows(data)
+
+def _training_query(completions: Optional[ColumnElement] = None):
+    query = (
+        select(
+            Task.user_id,
+            TaskCompletion.id,
+            Task.deadline,
+            Task.created_at,
+            Task.completed_at,
+            Task.estimated_hours,
+            # Lengths are computed by the database, so the text never crosses the wire
+            func.coalesce(func.length(Task.description), 0),
+            func.coalesce(func.length(Task.title), 0),
+            TaskCompletion.actual_hours
+        )
+        .join(TaskCompletion, TaskCompletion.task_id == Task.id)
+        .where(Task.completed == True, TaskCompletion.actual_hours.isnot(None))
+        .order_by(TaskCompletion.id)  # completion order, which online learning depends on
+    )
+    if completions is not None:
+        query = query.where(completions)
+    return query
+
+def _history_lookup(user_ids: np.ndarray, history: Dict[int, UserHistoryStats]) -> Dict[str, np.ndarray]:
+    """Per-row history features, gathered from per-user arrays with one searchsorted"""
+    fields = ("avg_completion_time", "productivity_score", "tasks_per_day", "completion_variance")
+    default = UserHistoryStats()
+    users = np.array(sorted(history), dtype=np.int64)
+    table = {
+        field: np.array([getattr(history[u], field) for u in users.tolist()] + [getattr(default, field)])
+        for field in fields
+    }
+    index = np.searchsorted(users, user_ids)
+    missing = index >= len(users)
+    missing[~missing] = users[index[~missing]] != user_ids[~missing]
+    index[missing] = len(users)  # the default row
+    return {field: values[index] for field, values in table.items()}
+
+def load_training_columns(
+    db: Session,
+    chunk_size: int = 5000,
+    completions: Optional[ColumnElement] = None
+) -> ColumnSet:
+    """Training features and labels for completed tasks, read into typed NumPy columns
+
+    Rows are fetched from the DBAPI cursor in chunk_size batches and written into
+    preallocated arrays column by column, so no per-row dict is created and
+    peak memory is the arrays plus one chunk. Task features are taken as of
+    task creation, so nothing about how the task finished leaks into them;
+    history features use the user's current aggregates, matching serving.
+
+    completions, a condition on TaskCompletion, limits rows to the
+    completions it matches, and history aggregates to the users those rows
+    belong to, so an incremental load costs what the new rows cost.
+    """
+    from .training import load_history_stats_by_user
+
+    user_ids = None
+    if completions is not None:
+        user_ids = select(TaskCompletion.user_id).where(completions).distinct()
+    history = load_history_stats_by_user(db, user_ids)
+    query = _training_query(completions)
+    total = db.execute(select(func.count()).select_from(query.subquery())).scalar_one()
+
+    user_id = np.empty(total, dtype=np.int64)
+    completion_id = np.empty(total, dtype=np.int64)
+    deadline = np.empty(total, dtype="datetime64[us]")
+    created_at = np.empty(total, dtype="datetime64[us]")
+    completed_at = np.empty(total, dtype="datetime64[us]")
+    estimated = np.empty(total)
+    task_length = np.empty(total)
+    title_length = np.empty(total)
+    actual = np.empty(total)
+    targets = (user_id, completion_id, deadline, created_at, completed_at, estimated, task_length, title_length, actual)
+
+    filled = 0
+    # Raw DBAPI tuples: skipping SQLAlchemy's per-row processing is most of the win.
+    # Datetimes arrive as ISO strings (SQLite) or datetime objects, both of which
+    # NumPy converts to datetime64 in bulk.
+    cursor = db.connection().execute(query).cursor
+    while filled < total:
+        partition = cursor.fetchmany(chunk_size)
+        if not partition:
+            break
+        end = min(filled + len(partition), total)  # rows committed since the count are dropped
+        for target, values in zip(targets, zip(*partition)):
+            # None becomes NaN / NaT
+            target[filled:end] = np.array(values[:end - filled], dtype=target.dtype)
+        filled = end
+    cursor.close()
+    if filled < total:
+        targets = tuple(target[:filled] for target in targets)
+        user_id, completion_id, deadline, created_at, completed_at, estimated, task_length, title_length, actual = targets
+
+    has_deadline = ~np.isnat(deadline)
+    days = np.full(len(user_id), 30.0)
+    days[has_deadline] = (deadline[has_deadline] - created_at[has_deadline]) // np.timedelta64(1, "D")
+    finished = np.where(np.isnat(completed_at), created_at, completed_at)
+
+    columns = {
+        "user_id": user_id,
+        "completion_id": completion_id,
+        "days_to_deadline": days,
+        "task_age": np.zeros(len(user_id)),
+        "estimated_hours": np.where(np.isnan(estimated) | (estimated == 0), 1.0, estimated),
+        "task_length": task_length,
+        "title_length": title_length,
+        "was_completed_on_time": ~has_deadline | (finished <= deadline),
+        "actual_hours_taken": actual,
+    }
+    columns.update(_history_lookup(user_id, history))
+    return ColumnSet({name: columns[name] for name in TRAINING_COLUMNS})
+
+def save_snapshot(columns: ColumnSet, path: str, fmt: str = "npy") -> str:
+    """Write columns to a directory that load_snapshot reopens without copying
+
+    "npy" writes one .npy file per column, memory-mapped on load; "parquet"
+    writes one Parquet file (requires pyarrow). The directory is replaced
+    atomically-ish: written beside it, then swapped in.
+    """
+    staging = f"{path.rstrip(os.sep)}.staging-{os.getpid()}"
+    os.makedirs(staging)
+    if fmt == "npy":
+        for name, values in columns.columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(values))
+    elif fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.table(columns.columns), os.path.join(staging, "columns.parquet"))
+    else:
+        raise ValueError(f"Unknown snapshot format {fmt!r}")
+
+    meta = {
+        "format": fmt,
+        "rows": len(columns),
+        "columns": {name: str(values.dtype) for name, values in columns.columns.items()},
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(staging, path)
+    return path
+
+def load_snapshot(path: str, mmap_mode: Optional[str] = "r") -> ColumnSet:
+    """Reopen a snapshot; .npy columns are memory-mapped, Parquet is read through a memory map"""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta["format"] == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(os.path.join(path, "columns.parquet"), memory_map=True)
+        return ColumnSet({name: table.column(name).to_numpy() for name in meta["columns"]})
+    return ColumnSet({
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in meta["columns"]
+    })
+
+if __name__ == "__main__":
+    from ..config import settings
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Snapshot training columns for offline training and analytics")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["npy", "parquet"], default=settings.training_snapshot_format)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        columns = load_training_columns(db, settings.training_chunk_size)
+    finally:
+        db.close()
+    save_snapshot(columns, args.path, args.format)
+    print(json.dumps({"path": args.path, "rows": len(columns), "format": args.format}))
@@ -0,0 +1,197 @@
+import json
+import os
+from typing import Optional, Tuple
+import numpy as np
+
+ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "scaler_mean", "scaler_scale")
+
+class CompiledForest:
+    """A fitted random forest (plus its StandardScaler) as flat node tables
+
+    Every tree's nodes are concatenated into contiguous arrays (feature,
+    threshold, left, right, value) and a batch is evaluated by advancing all
+    (row, tree) pairs one level per step with NumPy gathers, with no
+    scikit-learn dispatch per call. Leaves point at themselves, which is how
+    a pair is recognised as finished and dropped from the next step.
+
+    Arithmetic mirrors scikit-learn exactly: the scaler subtracts the mean
+    and divides by the scale in float64, rows are compared in float32
+    against float64 thresholds, and per-tree outputs are accumulated in
+    estimator order before dividing by the number of trees.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        is_classifier: bool,
+        scaler_mean: Optional[np.ndarray] = None,
+        scaler_scale: Optional[np.ndarray] = None
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value  # (n_nodes, n_classes) probabilities or (n_nodes, 1) regression values
+        self.roots = roots
+        self.max_depth = max_depth
+        self.is_classifier = is_classifier
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+
+    @classmethod
+    def from_sklearn(cls, forest, scaler=None) -> "CompiledForest":
+        """Flatten a fitted RandomForestClassifier/Regressor and StandardScaler"""
+        is_classifier = hasattr(forest, "classes_")
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            value = tree.value[:, 0, :]
+            if is_classifier:
+                value = value[:, :forest.n_classes_]
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            values.append(value)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        with_scaler = scaler is not None
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=int(max_depth),
+            is_classifier=is_classifier,
+            scaler_mean=np.array(scaler.mean_, dtype=np.float64) if with_scaler and scaler.with_mean else None,
+            scaler_scale=np.array(scaler.scale_, dtype=np.float64) if with_scaler and scaler.with_std else None
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """StandardScaler.transform"""
+        X = np.array(X, dtype=np.float64)
+        if self.scaler_mean is not None:
+            X -= self.scaler_mean
+        if self.scaler_scale is not None:
+            X /= self.scaler_scale
+        return X
+
+    def apply(self, X_scaled: np.ndarray, contributions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Leaf node index reached by every row in every tree, shape (n_rows, n_trees)
+
+        With contributions, an (n_rows * n_features, n_values) array, each
+        split also adds the change in node value it causes to the row and
+        feature it tested, summed over trees (the path decomposition).
+        """
+        X32 = np.ascontiguousarray(X_scaled, dtype=np.float32)
+        n_rows, n_features = X32.shape
+        n_trees = self.n_trees
+        flat_x = X32.ravel()
+
+        # One entry per (row, tree) pair; pairs drop out as soon as they hit a leaf
+        leaves = np.tile(self.roots, n_rows)
+        pending = np.flatnonzero(self.left[leaves] != leaves)
+        nodes = leaves[pending]
+        row_base = (pending // n_trees) * n_features
+
+        while pending.size:
+            tested = row_base + self.feature[nodes]  # (row, feature) of each split
+            go_left = flat_x[tested] <= self.threshold[nodes]
+            children = np.where(go_left, self.left[nodes], self.right[nodes])
+            if contributions is not None:
+                # Class probabilities sum to 1, so the last class's change is minus the others'
+                accumulated = contributions.shape[1] - 1 if self.is_classifier else contributions.shape[1]
+                delta = self.value[children, :accumulated] - self.value[nodes, :accumulated]
+                for k in range(accumulated):
+                    contributions[:, k] += np.bincount(tested, weights=delta[:, k], minlength=len(contributions))
+            nodes = children
+            at_leaf = self.left[nodes] == nodes
+            if at_leaf.any():
+                leaves[pending[at_leaf]] = nodes[at_leaf]
+                inner = ~at_leaf
+                pending, nodes, row_base = pending[inner], nodes[inner], row_base[inner]
+
+        return leaves.reshape(n_rows, n_trees)
+
+    def explain(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per-tree outputs, per-feature contributions and the bias, from one traversal
+
+        Returns (n_rows, n_trees, n_values) tree outputs, (n_rows, n_features,
+        n_values) contributions and the (n_values,) mean root value. For every
+        row, bias plus the summed contributions equals the forest's output.
+        """
+        X_scaled = self.transform(X)
+        n_rows, n_features = X_scaled.shape
+        contributions = np.zeros((n_rows * n_features, self.value.shape[1]))
+        per_tree = self.value[self.apply(X_scaled, contributions)]
+        if self.is_classifier:
+            contributions[:, -1] = -contributions[:, :-1].sum(axis=1)
+        contributions = contributions.reshape(n_rows, n_features, -1) / self.n_trees
+        return per_tree, contributions, self.value[self.roots].mean(axis=0)
+
+    def tree_values(self, X: np.ndarray) -> np.ndarray:
+        """Per-tree outputs, shape (n_rows, n_trees, n_values)"""
+        return self.value[self.apply(self.transform(X))]
+
+    @staticmethod
+    def _average(per_tree: np.ndarray) -> np.ndarray:
+        # Accumulate in estimator order, like scikit-learn, for bit-identical sums
+        out = np.zeros((per_tree.shape[0], per_tree.shape[2]), dtype=np.float64)
+        for t in range(per_tree.shape[1]):
+            out += per_tree[:, t]
+        out /= per_tree.shape[1]
+        return out
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """RandomForestClassifier.predict_proba on unscaled features"""
+        return self._average(self.tree_values(X))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """RandomForestRegressor.predict on unscaled features"""
+        return self._average(self.tree_values(X))[:, 0]
+
+    def save(self, path: str):
+        """Write each table as a .npy file so it can be memory-mapped on load"""
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(path, f"{name}.npy"), array)
+        with open(os.path.join(path, "forest.json"), "w") as f:
+            json.dump({"max_depth": self.max_depth, "is_classifier": self.is_classifier}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "CompiledForest":
+        with open(os.path.join(path, "forest.json")) as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in ARRAYS:
+            array_path = os.path.join(path, f"{name}.npy")
+            arrays[name] = np.load(array_path, mmap_mode=mmap_mode) if os.path.exists(array_path) else None
+        return cls(**arrays, **meta)
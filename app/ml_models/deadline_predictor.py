@@ -1,86 +1,183 @@
-import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
-from ..database import SessionLocal
-from ..models import Task, TaskCompletion
+from typing import List, Dict, Tuple, Sequence, Optional, Union
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models import Task
+from ..metrics import model_stage
+from .columnar import ColumnSet, as_columns
+from .compiled_forest import CompiledForest
+from .history_cache import UserHistoryStats, get_user_history_stats
+
+def _std_confidence(std, predicted_hours: np.ndarray) -> np.ndarray:
+    """1 / (1 + the coefficient of variation): 1 without spread, 0.5 when the spread equals the prediction"""
+    # Floored at half an hour, so short tasks are not penalised for minutes of disagreement
+    return 1.0 / (1.0 + std / np.maximum(predicted_hours, 0.5))
+
+def _spread_confidence(per_tree: np.ndarray, predicted_hours: np.ndarray) -> np.ndarray:
+    """Confidence from how far the trees disagree"""
+    return _std_confidence(per_tree.std(axis=1), predicted_hours)
 
 class DeadlinePredictor:
+    LEARNING_MODE = "batch"  # retrained from scratch by run_training
+    FEATURES = [
+        "task_length", "title_length", "estimated_hours",
+        "avg_completion_time", "completion_variance"
+    ]
+    
     def __init__(self):
         self.model = RandomForestRegressor(n_estimators=100, random_state=42)
         self.scaler = StandardScaler()
         self.is_trained = False
+        self.version = None  # Set when loaded from the model registry
+        self.base_version = None  # Full fit this version descends from; online updates keep it
+        self.compiled = None  # Optional CompiledForest used instead of sklearn for scoring
+        self.remote = None  # Optional model-server scorer used instead of local models
+        self.model_loader = None  # Unpickles the forest on first use of model; set by the model registry
+        self._explainer = None  # Node tables built for explanations when not compiled
         
-    def extract_features(self, task: Task, user_history: List[Dict]) -> np.ndarray:
+    @property
+    def model(self):
+        """The scikit-learn forest; a registry-loaded version unpickles it on first use"""
+        if self._model is None and self.model_loader is not None:
+            self._model = self.model_loader()
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
+    def extract_features(self, task: Task, history: UserHistoryStats) -> np.ndarray:
         """Extract features for deadline prediction"""
-        now = datetime.utcnow()
+        return self.extract_feature_matrix([task], history)[0]
+    
+    def extract_feature_matrix(self, tasks: Sequence[Task], history: UserHistoryStats) -> np.ndarray:
+        """Extract one feature row per task, sharing the user history features"""
+        X = np.empty((len(tasks), len(self.FEATURES)))
         
         # Task features
-        task_length = len(task.description) if task.description else 0
-        title_length = len(task.title)
-        estimated_hours = task.estimated_hours or 1.0
+        X[:, 0] = [len(t.description) if t.description else 0 for t in tasks]
+        X[:, 1] = [len(t.title) for t in tasks]
+        X[:, 2] = [t.estimated_hours or 1.0 for t in tasks]
         
         # User performance features
-        avg_completion_time = np.mean([h.get("actual_hours", 1.0) for h in user_history]) if user_history else 1.0
-        completion_variance = np.var([h.get("actual_hours", 1.0) for h in user_history]) if user_history and len(user_history) > 1 else 0.5
-        
-        return np.array([
-            task_length,
-            title_length,
-            estimated_hours,
-            avg_completion_time,
-            completion_variance
-        ])
+        X[:, 3] = history.avg_completion_time
+        X[:, 4] = history.completion_variance
+        return X
     
-    def train(self, training_data: List[Dict]):
+    def train(self, training_data: Union[ColumnSet, List[Dict]]):
         """Train the deadline prediction model"""
-        if len(training_data) < 10:
+        if len(training_data) < settings.min_data_points:
             return False
             
-        df = pd.DataFrame(training_data)
-        
-        features = [
-            "task_length", "title_length", "estimated_hours",
-            "avg_completion_time", "completion_variance"
-        ]
-        
-        X = df[features].values
-        y = df["actual_hours_taken"].values
+        data = as_columns(training_data)
+        X = data.matrix(self.FEATURES)
+        y = data["actual_hours_taken"]
         
         X_scaled = self.scaler.fit_transform(X)
         self.model.fit(X_scaled, y)
         self.is_trained = True
+        if settings.inference_backend == "compiled":
+            self.compile()
         return True
     
-    def predict_deadline(self, task: Task, user_id: int) -> Tuple[float, float]:
+    def compile(self):
+        """Switch scoring to flat node tables built from the trained forest"""
+        self.compiled = CompiledForest.from_sklearn(self.model, self.scaler)
+    
+    def predict_deadline(self, task: Task, user_id: int, db: Optional[Session] = None) -> Tuple[float, float]:
         """Predict hours needed and confidence score"""
+        return self.predict_deadlines([task], user_id, db=db)[0]
+    
+    def predict_deadlines(
+        self,
+        tasks: Sequence[Task],
+        user_id: int,
+        db: Optional[Session] = None,
+        history: Optional[UserHistoryStats] = None
+    ) -> List[Tuple[float, float]]:
+        """Predict hours needed and confidence for a batch of tasks owned by one user"""
+        if not tasks:
+            return []
         if not self.is_trained:
-            return self._calculate_estimated_hours(task), 0.6
-            
-        db = SessionLocal()
-        try:
-            # Get user completion history
-            completions = db.query(TaskCompletion).filter(TaskCompletion.user_id == user_id).all()
-            user_history = [
-                {
-                    "actual_hours": c.actual_hours,
-                    "completion_date": c.completion_date
-                } for c in completions
-            ]
-        finally:
-            db.close()
+            return [(self._calculate_estimated_hours(task), 0.6) for task in tasks]
+        
+        # History comes from the cache, or from the caller's session on a miss
+        if history is None:
+            history = get_user_history_stats(user_id, db)
+        with model_stage("deadline_predictor", "extract_features"):
+            features = self.extract_feature_matrix(tasks, history)
+        return self._score_matrix(features)
+    
+    def _score_matrix(self, features: np.ndarray) -> List[Tuple[float, float]]:
+        """Score a feature matrix with one transform and one pass over the trees"""
+        if self.remote is not None:
+            with model_stage("deadline_predictor", "remote_predict"):
+                return self.remote(features)
+        # Without the forest in memory, stay on the shared tables rather than unpickle a private copy
+        if self.compiled is not None and (len(features) <= settings.compiled_max_batch or self._model is None):
+            with model_stage("deadline_predictor", "compiled_predict"):
+                per_tree = self.compiled.tree_values(features)[:, :, 0]
+        else:
+            with model_stage("deadline_predictor", "transform"):
+                features_scaled = self.scaler.transform(features)
+            with model_stage("deadline_predictor", "predict"):
+                per_tree = self._tree_predictions(features_scaled)
+        predicted_hours = CompiledForest._average(per_tree[:, :, np.newaxis])[:, 0]
         
-        features = self.extract_features(task, user_history)
-        features_scaled = self.scaler.transform([features])
+        # Confidence from how much the trees disagree
+        confidences = _spread_confidence(per_tree, predicted_hours)
         
-        predicted_hours = float(self.model.predict(features_scaled)[0])
+        return [(float(h), float(c)) for h, c in zip(predicted_hours, confidences)]
+    
+    def _tree_predictions(self, features_scaled: np.ndarray) -> np.ndarray:
+        """Every tree's hours, shape (n_rows, n_trees); RandomForestRegressor.predict is their mean"""
+        X32 = np.asarray(features_scaled, dtype=np.float32)
+        return np.column_stack([tree.predict(X32, check_input=False) for tree in self.model.estimators_])
+    
+    def explain_matrix(self, features: np.ndarray, user_id: Optional[int] = None) -> List[Optional[Dict]]:
+        """Per-feature contributions to each row's predicted hours, and the spread of the trees
         
-        # Calculate confidence based on model prediction variance
-        confidence = 0.8 if self.is_trained else 0.6
+        base plus the contributions is the prediction (the path decomposition
+        of every tree, averaged). None per row while the rules are in use.
+        """
+        if not self.is_trained:
+            return [None] * len(features)
+        if self.remote is not None:
+            return self.remote.explain(features)
+        with model_stage("deadline_predictor", "explain"):
+            per_tree, contributions, bias = self._explain_tables().explain(features)
+        per_tree = per_tree[:, :, 0]
+        predicted_hours = CompiledForest._average(per_tree[:, :, np.newaxis])[:, 0]
+        confidences = _spread_confidence(per_tree, predicted_hours)
+        low, high = np.percentile(per_tree, [10, 90], axis=1)
         
-        return predicted_hours, confidence
+        # Rounded as whole arrays; only the dicts are built per row
+        base = round(float(bias[0]), 4)
+        rows = zip(
+            np.round(predicted_hours, 4).tolist(),
+            np.round(contributions[:, :, 0], 4).tolist(),
+            np.round(np.column_stack([per_tree.std(axis=1), low, high, confidences]), 4).tolist()
+        )
+        return [
+            {
+                "unit": "hours",
+                "base": base,
+                "value": value,
+                "contributions": dict(zip(self.FEATURES, terms)),
+                "uncertainty": {"std": std, "p10": p10, "p90": p90, "confidence": confidence},
+            }
+            for value, terms, (std, p10, p90, confidence) in rows
+        ]
+    
+    def _explain_tables(self) -> CompiledForest:
+        """The compiled forest, or node tables built from the sklearn model on first use"""
+        if self.compiled is not None:
+            return self.compiled
+        if self._explainer is None:
+            self._explainer = CompiledForest.from_sklearn(self.model, self.scaler)
+        return self._explainer
     
     def _calculate_estimated_hours(self, task: Task) -> float:
         """Fallback estimated hours calculation"""
@@ -99,4 +196,4 @@ class DeadlinePredictor:
             title_words = len(task.title.split())
             base_hours += max(0, title_words / 10)
         
-        return min(40, base_hours)  # Cap at 40 hours
\ No newline at end of file
+        return min(40, base_hours)  # Cap at 40 hours
@@ -0,0 +1,351 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..sharding import session_for_user
+from ..models import TaskCompletion, ProductivityLog
+
+class UserHistoryStats:
+    """Running aggregates over a user's completions and productivity logs"""
+
+    FIELDS = (
+        "completion_count", "completion_mean", "completion_m2",
+        "log_count", "productivity_sum", "tasks_completed_sum"
+    )
+
+    def __init__(
+        self,
+        completion_count: int = 0,
+        completion_mean: float = 0.0,
+        completion_m2: float = 0.0,
+        log_count: int = 0,
+        productivity_sum: float = 0.0,
+        tasks_completed_sum: float = 0.0
+    ):
+        self.completion_count = int(completion_count)
+        self.completion_mean = float(completion_mean)
+        self.completion_m2 = float(completion_m2)  # Sum of squared deviations (Welford)
+        self.log_count = int(log_count)
+        self.productivity_sum = float(productivity_sum)
+        self.tasks_completed_sum = float(tasks_completed_sum)
+
+    def add_completion(self, actual_hours: float):
+        """Fold one completion into the running mean/variance (Welford update)"""
+        self.completion_count += 1
+        delta = actual_hours - self.completion_mean
+        self.completion_mean += delta / self.completion_count
+        self.completion_m2 += delta * (actual_hours - self.completion_mean)
+
+    def add_productivity(
+        self,
+        productivity_score: float,
+        tasks_completed: int,
+        replaces: Optional[Tuple[float, int]] = None
+    ):
+        """Fold a new productivity log in, or an update of an existing one"""
+        if replaces is None:
+            self.log_count += 1
+        else:
+            productivity_score -= replaces[0]
+            tasks_completed -= replaces[1]
+        self.productivity_sum += productivity_score
+        self.tasks_completed_sum += tasks_completed
+
+    @property
+    def avg_completion_time(self) -> float:
+        return self.completion_mean if self.completion_count else 1.0
+
+    @property
+    def completion_variance(self) -> float:
+        if self.completion_count > 1:
+            return max(0.0, self.completion_m2 / self.completion_count)
+        return 0.5
+
+    @property
+    def productivity_score(self) -> float:
+        return self.productivity_sum / self.log_count if self.log_count else 0.5
+
+    @property
+    def tasks_per_day(self) -> float:
+        return self.tasks_completed_sum / self.log_count if self.log_count else 1.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UserHistoryStats":
+        return cls(**{field: data[field] for field in cls.FIELDS})
+
+    def copy(self) -> "UserHistoryStats":
+        return UserHistoryStats(**self.to_dict())
+
+def load_user_history_stats(db: Session, user_id: int) -> UserHistoryStats:
+    """Build a user's history aggregates with two SQL aggregate queries"""
+    count, total, total_sq = db.query(
+        func.count(TaskCompletion.actual_hours),
+        func.sum(TaskCompletion.actual_hours),
+        func.sum(TaskCompletion.actual_hours * TaskCompletion.actual_hours)
+    ).filter(TaskCompletion.user_id == user_id).one()
+
+    log_count, productivity_sum, tasks_completed_sum = db.query(
+        func.count(ProductivityLog.id),
+        func.sum(ProductivityLog.productivity_score),
+        func.sum(ProductivityLog.tasks_completed)
+    ).filter(ProductivityLog.user_id == user_id).one()
+
+    mean = (total / count) if count else 0.0
+    m2 = max(0.0, (total_sq or 0.0) - count * mean * mean) if count else 0.0
+
+    return UserHistoryStats(
+        completion_count=count,
+        completion_mean=mean,
+        completion_m2=m2,
+        log_count=log_count,
+        productivity_sum=productivity_sum or 0.0,
+        tasks_completed_sum=tasks_completed_sum or 0
+    )
+
+class InMemoryHistoryCache:
+    """Process-local LRU cache of UserHistoryStats with a TTL
+
+    Completions are written through to this worker's copy only; other
+    workers see them when their entry expires, so the TTL is kept short
+    (settings.history_cache_local_ttl). Use the Redis backend with more
+    than one worker.
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: int = 30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, Tuple[float, UserHistoryStats]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[UserHistoryStats]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1].copy()
+
+    def set(self, user_id: int, stats: UserHistoryStats):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, stats.copy())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_completion(self, user_id: int, actual_hours: float):
+        """Write-through a new completion; only cached users are updated"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry[1].add_completion(actual_hours)
+
+    def record_productivity(
+        self,
+        user_id: int,
+        productivity_score: float,
+        tasks_completed: int,
+        replaces: Optional[Tuple[float, int]] = None
+    ):
+        """Write-through a new or updated productivity log"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry[1].add_productivity(productivity_score, tasks_completed, replaces)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": size
+        }
+
+# Welford update applied atomically inside Redis, skipped when the key is not cached
+_REDIS_ADD_COMPLETION = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+local n = tonumber(redis.call('HGET', KEYS[1], 'completion_count')) + 1
+local mean = tonumber(redis.call('HGET', KEYS[1], 'completion_mean'))
+local m2 = tonumber(redis.call('HGET', KEYS[1], 'completion_m2'))
+local x = tonumber(ARGV[1])
+local delta = x - mean
+mean = mean + delta / n
+m2 = m2 + delta * (x - mean)
+redis.call('HSET', KEYS[1], 'completion_count', n,
+    'completion_mean', string.format('%.17g', mean),
+    'completion_m2', string.format('%.17g', m2))
+return 1
+"""
+
+_REDIS_ADD_PRODUCTIVITY = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HINCRBY', KEYS[1], 'log_count', ARGV[1])
+redis.call('HINCRBYFLOAT', KEYS[1], 'productivity_sum', ARGV[2])
+redis.call('HINCRBYFLOAT', KEYS[1], 'tasks_completed_sum', ARGV[3])
+return 1
+"""
+
+# Drop index entries past the TTL, then the least recently used users over max_entries
+_REDIS_TRIM = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[2])
+if excess <= 0 then return 0 end
+local evicted = redis.call('ZPOPMIN', KEYS[1], excess)
+for i = 1, #evicted, 2 do redis.call('DEL', ARGV[3] .. evicted[i]) end
+return excess
+"""
+
+class RedisHistoryCache:
+    """UserHistoryStats shared across workers in Redis hashes with a TTL
+
+    A sorted set of user ids by last access bounds the cache to
+    max_entries, evicting the least recently used.
+    """
+
+    backend = "redis"
+
+    def __init__(self, redis_url: str, ttl_seconds: int = 3600, max_entries: int = 10000, prefix: str = "history:"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.index = f"{prefix}lru"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._add_completion = self.client.register_script(_REDIS_ADD_COMPLETION)
+        self._add_productivity = self.client.register_script(_REDIS_ADD_PRODUCTIVITY)
+        self._trim = self.client.register_script(_REDIS_TRIM)
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def get(self, user_id: int) -> Optional[UserHistoryStats]:
+        pipe = self.client.pipeline()
+        pipe.hgetall(self._key(user_id))
+        pipe.zadd(self.index, {user_id: time.time()}, xx=True)
+        data = pipe.execute()[0]
+        if not data:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return UserHistoryStats.from_dict({k.decode(): float(v) for k, v in data.items()})
+
+    def set(self, user_id: int, stats: UserHistoryStats):
+        key = self._key(user_id)
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={k: repr(v) for k, v in stats.to_dict().items()})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.zadd(self.index, {user_id: now})
+        pipe.execute()
+        self.evictions += self._trim(keys=[self.index], args=[now - self.ttl_seconds, self.max_entries, self.prefix])
+
+    def record_completion(self, user_id: int, actual_hours: float):
+        self._add_completion(keys=[self._key(user_id)], args=[actual_hours])
+
+    def record_productivity(
+        self,
+        user_id: int,
+        productivity_score: float,
+        tasks_completed: int,
+        replaces: Optional[Tuple[float, int]] = None
+    ):
+        new_log = 1
+        if replaces is not None:
+            new_log = 0
+            productivity_score -= replaces[0]
+            tasks_completed -= replaces[1]
+        self._add_productivity(
+            keys=[self._key(user_id)],
+            args=[new_log, productivity_score, tasks_completed]
+        )
+
+    def invalidate(self, user_id: int):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(user_id))
+        pipe.zrem(self.index, user_id)
+        pipe.execute()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": self.client.zcard(self.index)
+        }
+
+_history_cache = None
+
+def get_history_cache():
+    """Return the process-wide history cache for the configured backend"""
+    global _history_cache
+    if _history_cache is None:
+        if settings.history_cache_backend == "redis":
+            _history_cache = RedisHistoryCache(
+                settings.redis_url,
+                ttl_seconds=settings.history_cache_ttl,
+                max_entries=settings.history_cache_max_entries
+            )
+        else:
+            _history_cache = InMemoryHistoryCache(
+                max_entries=settings.history_cache_max_entries,
+                ttl_seconds=settings.history_cache_local_ttl
+            )
+    return _history_cache
+
+def get_user_history_stats(user_id: int, db: Optional[Session] = None) -> UserHistoryStats:
+    """Cached history aggregates for a user; queries the database only on a miss"""
+    cache = get_history_cache()
+    stats = cache.get(user_id)
+    if stats is not None:
+        return stats
+
+    if db is not None:
+        stats = load_user_history_stats(db, user_id)
+    else:
+        session = session_for_user(user_id)
+        try:
+            stats = load_user_history_stats(session, user_id)
+        finally:
+            session.close()
+    cache.set(user_id, stats)
+    return stats
+
+async def get_user_history_stats_async(user_id: int, db) -> UserHistoryStats:
+    """get_user_history_stats for an AsyncSession"""
+    cache = get_history_cache()
+    stats = cache.get(user_id)
+    if stats is None:
+        stats = await db.run_sync(load_user_history_stats, user_id)
+        cache.set(user_id, stats)
+    return stats
@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from ..config import settings
+from .registry import MODEL_CLASSES, ModelRegistry, get_model_registry, model_class
+
+logger = logging.getLogger(__name__)
+
+# Frame: JSON header length, payload length, JSON header, raw payload (float64 features)
+_HEADER = struct.Struct(">II")
+
+def _frame(header: Dict, payload: bytes = b"") -> bytes:
+    body = json.dumps(header, separators=(",", ":")).encode()
+    return _HEADER.pack(len(body), len(payload)) + body + payload
+
+class ModelServerError(RuntimeError):
+    """The model server answered a request with an error"""
+
+class ModelServerUnavailable(ModelServerError):
+    """The model server could not be reached; the worker switches to rule-based predictors"""
+
+class ModelServer:
+    """Sidecar holding the models once and scoring coalesced micro-batches for all workers
+
+    Scoring requests for the same model that arrive within max_wait_us of the
+    first are concatenated (up to max_batch rows) and scored with a single
+    _score_matrix call on one scoring thread, then split back per request.
+    Requests queued while a batch is scoring join the next one.
+    """
+
+    def __init__(self, registry: ModelRegistry, max_batch: int = 256, max_wait_us: int = 500):
+        self.registry = registry
+        self.max_batch = max_batch
+        self.max_wait = max_wait_us / 1e6
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-server")
+        self._tasks = set()
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_rows": round(self.rows / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _info(self) -> Dict:
+        models = {}
+        for name in MODEL_CLASSES:
+            predictor = self.registry.get(name)
+            models[name] = {
+                "version": predictor.version,
+                "trained": predictor.is_trained,
+                "learning_mode": predictor.LEARNING_MODE,
+            }
+        return models
+
+    def _score(self, name: str, matrices: List[np.ndarray]) -> Tuple[Optional[str], List]:
+        predictor = self.registry.get(name)
+        if not predictor.is_trained:
+            raise ModelServerError(f"{name} has no trained version to serve")
+        return predictor.version, predictor._score_matrix(np.vstack(matrices))
+
+    def _explain(self, name: str, features: np.ndarray) -> Tuple[Optional[str], List]:
+        predictor = self.registry.get(name)
+        if not predictor.is_trained:
+            raise ModelServerError(f"{name} has no trained version to serve")
+        return predictor.version, predictor.explain_matrix(features)
+
+    async def serve(self, path: str):
+        if os.path.exists(path):
+            os.unlink(path)
+        self._queues = {name: asyncio.Queue() for name in MODEL_CLASSES}
+        for name in self._queues:
+            self._spawn(self._batcher(name))
+
+        server = await asyncio.start_unix_server(self._handle, path=path)
+        os.chmod(path, 0o660)
+        logger.info("Model server listening on %s", path)
+        async with server:
+            await server.serve_forever()
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header_len, payload_len = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                header = json.loads(await reader.readexactly(header_len))
+                payload = await reader.readexactly(payload_len) if payload_len else b""
+                # Answer out of order, so one connection can have many requests in flight
+                self._spawn(self._respond(writer, header, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, header: Dict, payload: bytes):
+        loop = asyncio.get_running_loop()
+        try:
+            if header["op"] == "info":
+                models = await loop.run_in_executor(self._executor, self._info)
+                body = {"models": models, "stats": self.stats()}
+            elif header["op"] == "score":
+                features = np.frombuffer(payload, dtype=np.float64).reshape(header["rows"], -1)
+                future = loop.create_future()
+                self.requests += 1
+                await self._queues[header["model"]].put((features, future))
+                version, results = await future
+                body = {"version": version, "results": results}
+            elif header["op"] == "explain":
+                # Rarer and costlier than scoring, so not coalesced
+                features = np.frombuffer(payload, dtype=np.float64).reshape(header["rows"], -1)
+                version, results = await loop.run_in_executor(
+                    self._executor, self._explain, header["model"], features
+                )
+                body = {"version": version, "results": results}
+            else:
+                raise ModelServerError(f"Unknown operation {header['op']!r}")
+        except Exception as exc:
+            logger.exception("Model server request failed")
+            body = {"error": str(exc)}
+        body["id"] = header["id"]
+        if not writer.is_closing():
+            writer.write(_frame(body))
+
+    async def _batcher(self, name: str):
+        queue = self._queues[name]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            rows = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = queue.get_nowait()
+                batch.append(item)
+                rows += len(item[0])
+
+            try:
+                version, results = await loop.run_in_executor(
+                    self._executor, self._score, name, [features for features, _ in batch]
+                )
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+
+            self.batches += 1
+            self.rows += rows
+            offset = 0
+            for features, future in batch:
+                future.set_result((version, results[offset:offset + len(features)]))
+                offset += len(features)
+
+class _Connection:
+    """One socket to the server; a reader thread resolves futures by request id"""
+
+    def __init__(self, path: str, timeout: float):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.sock.settimeout(None)
+        self.pending: Dict[int, Future] = {}
+        self.closed = False
+        threading.Thread(target=self._read, name="model-server-client", daemon=True).start()
+
+    def _read(self):
+        stream = self.sock.makefile("rb")
+        try:
+            while True:
+                sizes = stream.read(_HEADER.size)
+                if len(sizes) < _HEADER.size:
+                    break
+                header_len, payload_len = _HEADER.unpack(sizes)
+                header = json.loads(stream.read(header_len))
+                stream.read(payload_len)
+                future = self.pending.pop(header["id"], None)
+                if future is not None:
+                    future.set_result(header)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.closed = True
+            for request_id in list(self.pending):
+                future = self.pending.pop(request_id, None)
+                if future is not None:
+                    future.set_exception(ConnectionError("model server connection closed"))
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class ModelServerClient:
+    """Thin client: one multiplexed connection per process, safe to share between threads"""
+
+    def __init__(self, path: str, timeout: float = 2.0):
+        self.path = path
+        self.timeout = timeout
+        self._connection: Optional[_Connection] = None
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _request(self, header: Dict, payload: bytes = b"") -> Dict:
+        with self._lock:
+            if self._connection is None or self._connection.closed:
+                self._connection = _Connection(self.path, self.timeout)
+            connection = self._connection
+            request_id = next(self._ids)
+            future = Future()
+            connection.pending[request_id] = future
+            try:
+                connection.sock.sendall(_frame({**header, "id": request_id}, payload))
+            except OSError:
+                connection.pending.pop(request_id, None)
+                connection.close()
+                raise
+
+        try:
+            response = future.result(self.timeout)
+        except TimeoutError:
+            connection.pending.pop(request_id, None)
+            raise
+        if "error" in response:
+            raise ModelServerError(response["error"])
+        return response
+
+    def info(self) -> Dict:
+        return self._request({"op": "info"})
+
+    def score(self, name: str, features: np.ndarray) -> Tuple[Optional[str], List]:
+        return self._features_request("score", name, features)
+
+    def explain(self, name: str, features: np.ndarray) -> Tuple[Optional[str], List]:
+        return self._features_request("explain", name, features)
+
+    def _features_request(self, op: str, name: str, features: np.ndarray) -> Tuple[Optional[str], List]:
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        response = self._request({"op": op, "model": name, "rows": len(features)}, features.tobytes())
+        return response["version"], response["results"]
+
+class RemoteScorer:
+    """Stands in for a predictor's local models inside _score_matrix and explain_matrix"""
+
+    def __init__(self, registry: "RemoteModelRegistry", name: str):
+        self.registry = registry
+        self.name = name
+
+    def __call__(self, features: np.ndarray) -> List[Tuple]:
+        return [tuple(result) for result in self._request("score", features)]
+
+    def explain(self, features: np.ndarray) -> List[Optional[Dict]]:
+        return self._request("explain", features)
+
+    def _request(self, op: str, features: np.ndarray) -> List:
+        try:
+            _, results = getattr(self.registry.client, op)(self.name, features)
+        except (OSError, TimeoutError, ModelServerError) as exc:
+            if settings.model_server_local_fallback:
+                logger.warning("Model server %s failed, running %s in-process", op, self.name, exc_info=True)
+                local = self.registry.fallback.get(self.name)
+                if not local.is_trained:
+                    raise
+                return local._score_matrix(features) if op == "score" else local.explain_matrix(features)
+            self.registry.mark_unavailable()
+            raise ModelServerUnavailable(f"Model server {op} of {self.name} failed: {exc}") from exc
+        return results
+
+class RemoteModelRegistry:
+    """Serving registry backed by the sidecar: predictors without forests that score remotely
+
+    Versions are re-read from the server every reload_interval. While the
+    server is unreachable, batch models are served by their rules, so
+    workers never load the forests; settings.model_server_local_fallback
+    loads them from the in-process registry instead. Online models are a
+    few coefficients and always come from the in-process registry.
+    """
+
+    def __init__(self, client: ModelServerClient, fallback: ModelRegistry, reload_interval: float = 60.0):
+        self.client = client
+        self.fallback = fallback
+        self.reload_interval = reload_interval
+        self._predictors: Dict[str, object] = {}
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _offline_predictors(self) -> Dict[str, object]:
+        """Untrained, rule-based predictors for the batch models, while the server is unreachable"""
+        if settings.model_server_local_fallback:
+            return {}
+        predictors = {}
+        for name in MODEL_CLASSES:
+            meta = self.fallback.metadata(name)
+            if meta is None or meta.get("learning_mode", "batch") == "batch":
+                predictors[name] = model_class(name, "batch")()
+        return predictors
+
+    def mark_unavailable(self):
+        """Serve offline predictors until the next refresh, after a failed request"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._predictors = self._offline_predictors()
+
+    def _refresh(self):
+        for name, model in self.client.info()["models"].items():
+            if model.get("learning_mode") == "online":
+                # A dot product plus a per-user correction: cheaper in-process than a round trip
+                self._predictors.pop(name, None)
+                continue
+            current = self._predictors.get(name)
+            if current is not None and current.version == model["version"]:
+                continue
+            predictor = model_class(name, "batch")()
+            if model["trained"]:
+                predictor.is_trained = True
+                predictor.version = model["version"]
+                predictor.remote = RemoteScorer(self, name)
+            self._predictors[name] = predictor
+
+    def get(self, name: str):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    try:
+                        self._refresh()
+                    except (OSError, TimeoutError, ModelServerError):
+                        logger.warning("Model server unavailable, serving without it", exc_info=True)
+                        self._predictors = self._offline_predictors()
+        predictor = self._predictors.get(name)
+        return predictor if predictor is not None else self.fallback.get(name)
+
+    def versions(self) -> Dict[str, Optional[str]]:
+        return {name: predictor.version for name, predictor in self._predictors.items()}
+
+_remote_registry = None
+
+def get_remote_registry() -> RemoteModelRegistry:
+    """Return the process-wide sidecar-backed registry (connects on first use)"""
+    global _remote_registry
+    if _remote_registry is None:
+        _remote_registry = RemoteModelRegistry(
+            ModelServerClient(settings.model_server_socket, timeout=settings.model_server_timeout),
+            get_model_registry(),
+            reload_interval=settings.model_reload_interval
+        )
+    return _remote_registry
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the current models to web workers over a Unix socket")
+    parser.add_argument("--socket", default=settings.model_server_socket, required=not settings.model_server_socket)
+    parser.add_argument("--max-batch", type=int, default=settings.model_server_max_batch)
+    parser.add_argument("--max-wait-us", type=int, default=settings.model_server_max_wait_us)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = ModelServer(get_model_registry(), max_batch=args.max_batch, max_wait_us=args.max_wait_us)
+    try:
+        asyncio.run(server.serve(args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,454 @@
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from sklearn.base import clone
+from sklearn.linear_model import SGDClassifier, SGDRegressor
+from sklearn.preprocessing import StandardScaler
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..metrics import model_stage
+from ..models import Task, TaskCompletion
+from .columnar import ColumnSet, as_columns, load_training_columns
+from .deadline_predictor import DeadlinePredictor, _std_confidence
+from .history_cache import UserHistoryStats, get_user_history_stats
+from .prioritizer import TaskPrioritizer
+from .registry import MODEL_CLASSES, ModelRegistry, get_model_registry, model_class
+
+logger = logging.getLogger(__name__)
+
+class UserResiduals:
+    """Per-user correction: a moving average of observed minus predicted
+
+    The average is shrunk toward zero by n / (n + prior), so a user's first
+    few completions move their predictions only a little. The spread of the
+    residuals is kept too, per user and over everyone, as the uncertainty of
+    a prediction.
+    """
+
+    def __init__(self, decay: float = 0.1, prior: float = 5.0):
+        self.decay = decay
+        self.prior = prior
+        self.mean: Dict[int, float] = {}
+        self.var: Dict[int, float] = {}
+        self.count: Dict[int, int] = {}
+        self.total_count = 0
+        self.total_mean = 0.0
+        self.total_m2 = 0.0
+
+    def __setstate__(self, state: Dict):
+        # Versions published before the spread was kept have no variances yet
+        self.__init__(state["decay"], state["prior"])
+        self.__dict__.update(state)
+
+    def __len__(self) -> int:
+        return len(self.mean)
+
+    def update(self, user_ids: np.ndarray, residuals: np.ndarray):
+        for user_id, residual in zip(user_ids.tolist(), residuals.tolist()):
+            count = self.count.get(user_id, 0) + 1
+            mean = self.mean.get(user_id, 0.0)
+            # A plain mean and variance over the first 1 / decay completions, exponentially weighted after
+            weight = max(self.decay, 1.0 / count)
+            delta = residual - mean
+            self.mean[user_id] = mean + weight * delta
+            self.var[user_id] = (1 - weight) * (self.var.get(user_id, 0.0) + weight * delta * delta)
+            self.count[user_id] = count
+
+            self.total_count += 1
+            total_delta = residual - self.total_mean
+            self.total_mean += total_delta / self.total_count
+            self.total_m2 += total_delta * (residual - self.total_mean)
+
+    def correction(self, user_id: int) -> float:
+        count = self.count.get(user_id, 0)
+        return self.mean[user_id] * count / (count + self.prior) if count else 0.0
+
+    def variance(self, user_id: Optional[int] = None) -> Optional[float]:
+        """Variance of residuals around the correction; None until any have been seen
+
+        A user's own variance is blended with everyone's by the same
+        n / (n + prior) weight as their correction.
+        """
+        if not self.total_count:
+            return None
+        overall = self.total_m2 / self.total_count
+        count = self.count.get(user_id, 0) if user_id is not None else 0
+        if not count:
+            return overall
+        weight = count / (count + self.prior)
+        return weight * self.var[user_id] + (1 - weight) * overall
+
+def _new_residuals() -> UserResiduals:
+    return UserResiduals(settings.online_residual_decay, settings.online_residual_prior)
+
+def _linear_terms(model, scaler) -> Tuple[np.ndarray, float]:
+    """Fold the scaler into the coefficients, so scoring is features @ weights + bias"""
+    weights = np.ravel(model.coef_) / scaler.scale_
+    return weights, float(np.ravel(model.intercept_)[0] - scaler.mean_ @ weights)
+
+def _linear_explanations(
+    features: np.ndarray, weights: np.ndarray, bias: float, scaler, names: Sequence[str], unit: str
+) -> List[Dict]:
+    """Exact per-feature terms of a linear score, measured from the average training row"""
+    base = float(bias + scaler.mean_ @ weights)
+    contributions = (features - scaler.mean_) * weights
+    values = np.round(base + contributions.sum(axis=1), 4).tolist()
+    return [
+        {
+            "unit": unit,
+            "base": round(base, 4),
+            "value": value,
+            "contributions": dict(zip(names, terms)),
+            "uncertainty": None,
+        }
+        for value, terms in zip(values, np.round(contributions, 4).tolist())
+    ]
+
+def _mini_batches(data: ColumnSet, features: Sequence[str], label: str) -> Iterator[Tuple]:
+    """(X, y, user_ids) slices of settings.online_batch_size rows; user_ids is None without that column"""
+    X = data.matrix(features)
+    y = np.asarray(data[label])
+    user_ids = data.columns.get("user_id")
+    size = settings.online_batch_size
+    for start in range(0, len(data), size):
+        end = start + size
+        yield X[start:end], y[start:end], None if user_ids is None else user_ids[start:end]
+
+class OnlinePrioritizer(TaskPrioritizer):
+    """TaskPrioritizer backed by logistic regression fitted with SGD
+
+    New completions are learned with partial_fit instead of a full retrain,
+    and each user's probability of finishing on time is shifted by how far
+    their recent completions landed from the model's predictions.
+    """
+    LEARNING_MODE = "online"
+
+    def __init__(self):
+        super().__init__()
+        self.model = SGDClassifier(
+            loss="log_loss", learning_rate="constant", eta0=settings.online_learning_rate, random_state=42
+        )
+        self.residuals = _new_residuals()
+
+    def train(self, training_data: Union[ColumnSet, List[Dict]]):
+        """Fit from scratch by streaming every row through partial_fit"""
+        if len(training_data) < settings.min_data_points:
+            return False
+        self.model = clone(self.model)
+        self.scaler = StandardScaler()
+        self.residuals = _new_residuals()
+        self.is_trained = False
+        self.base_version = None
+        self.partial_fit(training_data)
+        return True
+
+    def partial_fit(self, training_data: Union[ColumnSet, List[Dict]]) -> int:
+        """Learn from new labelled rows, in completion order; returns the number of rows
+
+        The scaler is fitted on the first rows only and then frozen until the
+        next full train: moving it would silently rescale every coefficient
+        learned so far.
+        """
+        data = as_columns(training_data)
+        if not self.is_trained and len(data):
+            self.scaler.fit(data.matrix(self.FEATURES))
+        for X, y, user_ids in _mini_batches(data, self.FEATURES, "was_completed_on_time"):
+            if self.is_trained and user_ids is not None:
+                # Residuals against the model as it was before seeing these rows
+                self.residuals.update(user_ids, y - self._probability(X))
+            self.model.partial_fit(self.scaler.transform(X), y, classes=[False, True])
+            self.is_trained = True
+        return len(data)
+
+    def compile(self):
+        """Nothing to compile: scoring is already a single dot product"""
+        self.compiled = None
+
+    def _probability(self, features: np.ndarray) -> np.ndarray:
+        """Probability of timely completion, before the user's correction"""
+        weights, bias = _linear_terms(self.model, self.scaler)
+        return 1.0 / (1.0 + np.exp(-(features @ weights + bias)))
+
+    def predict_priorities(
+        self,
+        tasks: Sequence[Task],
+        user_id: int,
+        db: Optional[Session] = None,
+        history: Optional[UserHistoryStats] = None
+    ) -> List[Tuple[int, float]]:
+        """Predict priority and confidence for a batch of tasks owned by one user"""
+        if not tasks:
+            return []
+        if not self.is_trained:
+            return [self._calculate_priority_rules(task) for task in tasks]
+
+        if history is None:
+            history = get_user_history_stats(user_id, db)
+        with model_stage("prioritizer", "extract_features"):
+            features = self.extract_feature_matrix(tasks, history)
+        return self._score_matrix(features, user_id)
+
+    def _score_matrix(self, features: np.ndarray, user_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Score a feature matrix, shifted by the user's correction when one is given"""
+        with model_stage("prioritizer", "online_predict_proba"):
+            proba = self._probability(features)
+        if user_id is not None:
+            proba = np.clip(proba + self.residuals.correction(user_id), 0.0, 1.0)
+
+        # Same scale as TaskPrioritizer: probability of timely completion to 1-10 priority (inverse);
+        # corrections clip proba to exactly 0 far more often than a forest's vote does
+        priorities = np.minimum((10 * (1 - proba)).astype(int) + 1, 10)
+        confidences = np.maximum(proba, 1 - proba)
+
+        return [(int(p), float(c)) for p, c in zip(priorities, confidences)]
+
+    def explain_matrix(self, features: np.ndarray, user_id: Optional[int] = None) -> List[Optional[Dict]]:
+        """Per-feature terms of the log-odds of timely completion; the user's correction is in probability"""
+        if not self.is_trained:
+            return [None] * len(features)
+        weights, bias = _linear_terms(self.model, self.scaler)
+        explanations = _linear_explanations(features, weights, bias, self.scaler, self.FEATURES, "log_odds_on_time")
+        correction = self.residuals.correction(user_id) if user_id is not None else 0.0
+        for explanation in explanations:
+            explanation["user_correction"] = round(correction, 4)
+        return explanations
+
+class OnlineDeadlinePredictor(DeadlinePredictor):
+    """DeadlinePredictor backed by linear regression fitted with SGD
+
+    New completions are learned with partial_fit instead of a full retrain,
+    and each user's predicted hours are shifted by how far their recent
+    completions landed from the model's predictions.
+    """
+    LEARNING_MODE = "online"
+
+    def __init__(self):
+        super().__init__()
+        self.model = SGDRegressor(
+            learning_rate="constant", eta0=settings.online_learning_rate, random_state=42
+        )
+        self.residuals = _new_residuals()
+
+    def train(self, training_data: Union[ColumnSet, List[Dict]]):
+        """Fit from scratch by streaming every row through partial_fit"""
+        if len(training_data) < settings.min_data_points:
+            return False
+        self.model = clone(self.model)
+        self.scaler = StandardScaler()
+        self.residuals = _new_residuals()
+        self.is_trained = False
+        self.base_version = None
+        self.partial_fit(training_data)
+        return True
+
+    def partial_fit(self, training_data: Union[ColumnSet, List[Dict]]) -> int:
+        """Learn from new labelled rows, in completion order; returns the number of rows
+
+        The scaler is fitted on the first rows only and then frozen until the
+        next full train: moving it would silently rescale every coefficient
+        learned so far.
+        """
+        data = as_columns(training_data)
+        if not self.is_trained and len(data):
+            self.scaler.fit(data.matrix(self.FEATURES))
+        for X, y, user_ids in _mini_batches(data, self.FEATURES, "actual_hours_taken"):
+            if self.is_trained and user_ids is not None:
+                # Residuals against the model as it was before seeing these rows
+                self.residuals.update(user_ids, y - self._hours(X))
+            self.model.partial_fit(self.scaler.transform(X), y)
+            self.is_trained = True
+        return len(data)
+
+    def compile(self):
+        """Nothing to compile: scoring is already a single dot product"""
+        self.compiled = None
+
+    def _hours(self, features: np.ndarray) -> np.ndarray:
+        """Predicted hours, before the user's correction"""
+        weights, bias = _linear_terms(self.model, self.scaler)
+        return features @ weights + bias
+
+    def predict_deadlines(
+        self,
+        tasks: Sequence[Task],
+        user_id: int,
+        db: Optional[Session] = None,
+        history: Optional[UserHistoryStats] = None
+    ) -> List[Tuple[float, float]]:
+        """Predict hours needed and confidence for a batch of tasks owned by one user"""
+        if not tasks:
+            return []
+        if not self.is_trained:
+            return [(self._calculate_estimated_hours(task), 0.6) for task in tasks]
+
+        if history is None:
+            history = get_user_history_stats(user_id, db)
+        with model_stage("deadline_predictor", "extract_features"):
+            features = self.extract_feature_matrix(tasks, history)
+        return self._score_matrix(features, user_id)
+
+    def _served_hours(self, features: np.ndarray, user_id: Optional[int]) -> np.ndarray:
+        """Predicted hours with the user's correction when one is given"""
+        predicted_hours = self._hours(features)
+        if user_id is not None:
+            predicted_hours = predicted_hours + self.residuals.correction(user_id)
+        # A linear model can extrapolate below zero
+        return np.maximum(predicted_hours, 0.0)
+
+    def _score_matrix(self, features: np.ndarray, user_id: Optional[int] = None) -> List[Tuple[float, float]]:
+        """Score a feature matrix, shifted by the user's correction when one is given
+
+        Confidence comes from the spread of past residuals, like the forest's
+        from the spread of its trees; before any residual is known (a fit on
+        a single mini-batch) it is the rules' 0.6.
+        """
+        with model_stage("deadline_predictor", "online_predict"):
+            predicted_hours = self._served_hours(features, user_id)
+        variance = self.residuals.variance(user_id)
+        if variance is None:
+            return [(float(h), 0.6) for h in predicted_hours]
+        confidences = _std_confidence(np.sqrt(variance), predicted_hours)
+        return [(float(h), float(c)) for h, c in zip(predicted_hours, confidences)]
+
+    def explain_matrix(self, features: np.ndarray, user_id: Optional[int] = None) -> List[Optional[Dict]]:
+        """Per-feature terms of the predicted hours, before the user's correction and the clip at zero
+
+        uncertainty describes the served prediction, from the residual
+        variance: None until any residual is known.
+        """
+        if not self.is_trained:
+            return [None] * len(features)
+        weights, bias = _linear_terms(self.model, self.scaler)
+        explanations = _linear_explanations(features, weights, bias, self.scaler, self.FEATURES, "hours")
+        correction = self.residuals.correction(user_id) if user_id is not None else 0.0
+        for explanation in explanations:
+            explanation["user_correction"] = round(correction, 4)
+
+        variance = self.residuals.variance(user_id)
+        if variance is not None:
+            std = float(np.sqrt(variance))
+            predicted_hours = self._served_hours(features, user_id)
+            # Normal residuals: the 10th and 90th percentiles are 1.28 standard deviations out
+            low = np.maximum(predicted_hours - 1.2816 * std, 0.0)
+            high = predicted_hours + 1.2816 * std
+            confidences = _std_confidence(std, predicted_hours)
+            rows = np.round(np.column_stack([low, high, confidences]), 4).tolist()
+            for explanation, (p10, p90, confidence) in zip(explanations, rows):
+                explanation["uncertainty"] = {"std": round(std, 4), "p10": p10, "p90": p90, "confidence": confidence}
+        return explanations
+
+def _unlearned(training: Dict, upto: datetime):
+    """Condition on TaskCompletion for the rows a version has not learned, up to upto
+
+    Completion times are taken before the row commits, and rows do not commit
+    in time or id order (queued completions, reserved id blocks), so a run
+    also re-reads the online_watermark_overlap before the watermark and skips
+    the ids the version already learned there.
+    """
+    condition = TaskCompletion.completion_date <= upto
+    if "learned_until" in training:
+        since = datetime.fromisoformat(training["learned_until"]) - timedelta(seconds=settings.online_watermark_overlap)
+        condition &= (TaskCompletion.completion_date > since) & TaskCompletion.id.notin_(training["learned_ids"])
+    elif "last_completion_id" in training:
+        # Versions published before the time watermark
+        condition &= TaskCompletion.id > training["last_completion_id"]
+    return condition
+
+def _learned_ids(db: Session, training: Dict, rows: ColumnSet, upto: datetime) -> List[int]:
+    """Ids learned so far that the next run's overlap re-reads, for it to skip"""
+    learned = set(training.get("learned_ids", ())) | set(rows["completion_id"].tolist())
+    overlap = db.scalars(select(TaskCompletion.id).where(
+        TaskCompletion.completion_date > upto - timedelta(seconds=settings.online_watermark_overlap),
+        TaskCompletion.completion_date <= upto
+    ))
+    return sorted(learned.intersection(overlap))
+
+def run_online_update(
+    db: Optional[Session] = None,
+    registry: Optional[ModelRegistry] = None,
+    chunk_size: Optional[int] = None
+) -> Dict:
+    """Learn completions logged since the published versions with partial_fit, and publish the result
+
+    Each version records the completion time it has learned up to, so a run
+    reads only newer rows and costs what they cost, not the whole history
+    (see _unlearned for completions that commit late). A model without an online version yet is first fitted on all rows, once.
+    Workers pick the new versions up within model_reload_interval. Open tasks
+    of the users whose completions were learned are flagged for rescoring;
+    everyone else's scores are refreshed at the day rollover.
+    """
+    registry = registry or get_model_registry()
+    chunk_size = chunk_size or settings.training_chunk_size
+    report = {"started_at": datetime.utcnow().isoformat(), "models": {}}
+    started = time.perf_counter()
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        upto = datetime.utcnow()
+        loaded: Dict[Tuple, ColumnSet] = {}
+        learned_users = set()
+        for name in MODEL_CLASSES:
+            meta = registry.metadata(name)
+            if meta is not None and meta.get("learning_mode") == "online":
+                predictor = registry.load(name, meta["version"])
+                training = meta["training"]
+            else:
+                predictor, training = model_class(name, "online")(), {}
+
+            # Both models usually share a watermark, and so one load
+            watermark = (
+                training.get("learned_until"), tuple(training.get("learned_ids", ())),
+                training.get("last_completion_id")
+            )
+            if watermark not in loaded:
+                loaded[watermark] = load_training_columns(db, chunk_size, _unlearned(training, upto))
+            rows = loaded[watermark]
+            model_report = {"learned_until": training.get("learned_until"), "rows": len(rows), "status": "skipped"}
+            report["models"][name] = model_report
+
+            # Too few rows leaves the watermark where it is, so they are learned next run
+            if len(rows) < (settings.online_min_rows if predictor.is_trained else settings.min_data_points):
+                continue
+
+            fit_started = time.perf_counter()
+            predictor.partial_fit(rows)
+            model_report["fit_seconds"] = round(time.perf_counter() - fit_started, 4)
+            model_report["version"] = registry.save(name, predictor, {
+                "rows": len(rows),
+                "fit_seconds": model_report["fit_seconds"],
+                "learned_until": upto.isoformat(),
+                "learned_ids": _learned_ids(db, training, rows, upto),
+                "previous_version": predictor.version,
+            })
+            model_report["status"] = "published"
+            model_report["pruned"] = registry.prune(name, settings.online_keep_versions)
+            learned_users.update(np.unique(rows["user_id"]).tolist())
+
+        if learned_users:
+            db.execute(
+                update(Task)
+                .where(Task.user_id.in_(learned_users), Task.completed == False)
+                .values(needs_rescore=True)
+            )
+            db.commit()
+        report["flagged_users"] = len(learned_users)
+    finally:
+        if own_session:
+            db.close()
+
+    report["total_seconds"] = round(time.perf_counter() - started, 3)
+    if any(model["status"] == "published" for model in report["models"].values()):
+        logger.info("Online update: %s", json.dumps(report))
+    return report
+
+if __name__ == "__main__":
+    from ..sharding import run_on_each_shard
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run_on_each_shard(run_online_update), indent=2))
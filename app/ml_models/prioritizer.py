@@ -1,99 +1,172 @@
-import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
-from ..database import SessionLocal
-from ..models import Task, TaskCompletion, ProductivityLog
+from datetime import datetime
+from typing import List, Dict, Tuple, Sequence, Optional, Union
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models import Task
+from ..metrics import model_stage
+from .columnar import ColumnSet, as_columns
+from .compiled_forest import CompiledForest
+from .history_cache import UserHistoryStats, get_user_history_stats
 
 class TaskPrioritizer:
+    LEARNING_MODE = "batch"  # retrained from scratch by run_training
+    FEATURES = [
+        "days_to_deadline", "task_age", "estimated_hours",
+        "avg_completion_time", "productivity_score", "tasks_per_day"
+    ]
+    
     def __init__(self):
         self.model = RandomForestClassifier(n_estimators=100, random_state=42)
         self.scaler = StandardScaler()
         self.is_trained = False
+        self.version = None  # Set when loaded from the model registry
+        self.base_version = None  # Full fit this version descends from; online updates keep it
+        self.compiled = None  # Optional CompiledForest used instead of sklearn for scoring
+        self.remote = None  # Optional model-server scorer used instead of local models
+        self.model_loader = None  # Unpickles the forest on first use of model; set by the model registry
+        self._explainer = None  # Node tables built for explanations when not compiled
         
-    def extract_features(self, task: Task, user_history: List[Dict]) -> np.ndarray:
+    @property
+    def model(self):
+        """The scikit-learn forest; a registry-loaded version unpickles it on first use"""
+        if self._model is None and self.model_loader is not None:
+            self._model = self.model_loader()
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
+    def extract_features(self, task: Task, history: UserHistoryStats) -> np.ndarray:
         """Extract features from task and user history"""
+        return self.extract_feature_matrix([task], history)[0]
+    
+    def extract_feature_matrix(self, tasks: Sequence[Task], history: UserHistoryStats) -> np.ndarray:
+        """Extract one feature row per task, sharing the user history features"""
         now = datetime.utcnow()
+        X = np.empty((len(tasks), len(self.FEATURES)))
         
         # Task features
-        days_to_deadline = (task.deadline - now).days if task.deadline else 30
-        task_age = (now - task.created_at).days
-        estimated_hours = task.estimated_hours or 1.0
+        X[:, 0] = [(t.deadline - now).days if t.deadline else 30 for t in tasks]
+        X[:, 1] = [(now - t.created_at).days for t in tasks]
+        X[:, 2] = [t.estimated_hours or 1.0 for t in tasks]
         
         # User performance features
-        avg_completion_time = np.mean([h.get("actual_hours", 1.0) for h in user_history]) if user_history else 1.0
-        productivity_score = np.mean([h.get("productivity_score", 0.5) for h in user_history]) if user_history else 0.5
-        tasks_per_day = np.mean([h.get("tasks_completed", 1) for h in user_history]) if user_history else 1.0
-        
-        return np.array([
-            days_to_deadline,
-            task_age,
-            estimated_hours,
-            avg_completion_time,
-            productivity_score,
-            tasks_per_day
-        ])
+        X[:, 3] = history.avg_completion_time
+        X[:, 4] = history.productivity_score
+        X[:, 5] = history.tasks_per_day
+        return X
     
-    def train(self, training_data: List[Dict]):
+    def train(self, training_data: Union[ColumnSet, List[Dict]]):
         """Train the prioritization model"""
-        if len(training_data) < 10:
+        if len(training_data) < settings.min_data_points:
             return False
             
-        df = pd.DataFrame(training_data)
-        
-        features = [
-            "days_to_deadline", "task_age", "estimated_hours",
-            "avg_completion_time", "productivity_score", "tasks_per_day"
-        ]
-        
-        X = df[features].values
-        y = df["was_completed_on_time"].values
+        data = as_columns(training_data)
+        X = data.matrix(self.FEATURES)
+        y = data["was_completed_on_time"]
         
         X_scaled = self.scaler.fit_transform(X)
         self.model.fit(X_scaled, y)
         self.is_trained = True
+        if settings.inference_backend == "compiled":
+            self.compile()
         return True
     
-    def predict_priority(self, task: Task, user_id: int) -> Tuple[int, float]:
+    def compile(self):
+        """Switch scoring to flat node tables built from the trained forest"""
+        self.compiled = CompiledForest.from_sklearn(self.model, self.scaler)
+    
+    def predict_priority(self, task: Task, user_id: int, db: Optional[Session] = None) -> Tuple[int, float]:
         """Predict task priority and confidence score"""
+        return self.predict_priorities([task], user_id, db=db)[0]
+    
+    def predict_priorities(
+        self,
+        tasks: Sequence[Task],
+        user_id: int,
+        db: Optional[Session] = None,
+        history: Optional[UserHistoryStats] = None
+    ) -> List[Tuple[int, float]]:
+        """Predict priority and confidence for a batch of tasks owned by one user"""
+        if not tasks:
+            return []
         if not self.is_trained:
-            return self._calculate_priority_rules(task)
-            
-        db = SessionLocal()
-        try:
-            # Get user history
-            completions = db.query(TaskCompletion).filter(TaskCompletion.user_id == user_id).all()
-            user_history = [
-                {
-                    "actual_hours": c.actual_hours,
-                    "completion_date": c.completion_date
-                } for c in completions
-            ]
-            
-            productivity_logs = db.query(ProductivityLog).filter(ProductivityLog.user_id == user_id).all()
-            user_history.extend([
-                {
-                    "productivity_score": p.productivity_score,
-                    "tasks_completed": p.tasks_completed
-                } for p in productivity_logs
-            ])
-            
-        finally:
-            db.close()
+            return [self._calculate_priority_rules(task) for task in tasks]
         
-        features = self.extract_features(task, user_history)
-        features_scaled = self.scaler.transform([features])
+        # History comes from the cache, or from the caller's session on a miss
+        if history is None:
+            history = get_user_history_stats(user_id, db)
+        with model_stage("prioritizer", "extract_features"):
+            features = self.extract_feature_matrix(tasks, history)
+        return self._score_matrix(features)
+    
+    def _score_matrix(self, features: np.ndarray) -> List[Tuple[int, float]]:
+        """Score a feature matrix with one transform and one predict_proba call"""
+        if self.remote is not None:
+            with model_stage("prioritizer", "remote_predict_proba"):
+                return self.remote(features)
+        # Without the forest in memory, stay on the shared tables rather than unpickle a private copy
+        if self.compiled is not None and (len(features) <= settings.compiled_max_batch or self._model is None):
+            with model_stage("prioritizer", "compiled_predict_proba"):
+                proba = self.compiled.predict_proba(features)
+        else:
+            with model_stage("prioritizer", "transform"):
+                features_scaled = self.scaler.transform(features)
+            with model_stage("prioritizer", "predict_proba"):
+                proba = self.model.predict_proba(features_scaled)
         
-        # Predict probability of timely completion
-        priority_score = self.model.predict_proba(features_scaled)[0][1]
+        # Convert probability of timely completion to 1-10 priority scale (inverse)
+        priorities = (10 * (1 - proba[:, 1])).astype(int) + 1
+        confidences = proba.max(axis=1)
         
-        # Convert to 1-10 priority scale (inverse of completion probability)
-        priority = int(10 * (1 - priority_score)) + 1
-        confidence = float(np.max(self.model.predict_proba(features_scaled)))
+        return [(int(p), float(c)) for p, c in zip(priorities, confidences)]
+    
+    def explain_matrix(self, features: np.ndarray, user_id: Optional[int] = None) -> List[Optional[Dict]]:
+        """Per-feature contributions to each row's priority, and the spread of the trees
         
-        return priority, confidence
+        Priority is 10 * (1 - P(on time)) + 1 before rounding down, so the
+        path decomposition of P(on time) is scaled by -10 into priority
+        points: base plus the contributions is the unrounded priority. None
+        per row while the rules are in use.
+        """
+        if not self.is_trained:
+            return [None] * len(features)
+        if self.remote is not None:
+            return self.remote.explain(features)
+        with model_stage("prioritizer", "explain"):
+            per_tree, contributions, bias = self._explain_tables().explain(features)
+        proba = CompiledForest._average(per_tree)
+        
+        # Rounded as whole arrays; only the dicts are built per row
+        base = round(10 * (1 - float(bias[1])) + 1, 4)
+        rows = zip(
+            np.round(10 * (1 - proba[:, 1]) + 1, 4).tolist(),
+            np.round(-10 * contributions[:, :, 1], 4).tolist(),
+            np.round(10 * per_tree[:, :, 1].std(axis=1), 4).tolist(),
+            np.round(proba.max(axis=1), 4).tolist()
+        )
+        return [
+            {
+                "unit": "priority_points",
+                "base": base,
+                "value": value,
+                "contributions": dict(zip(self.FEATURES, terms)),
+                "uncertainty": {"std": std, "confidence": confidence},
+            }
+            for value, terms, std, confidence in rows
+        ]
+    
+    def _explain_tables(self) -> CompiledForest:
+        """The compiled forest, or node tables built from the sklearn model on first use"""
+        if self.compiled is not None:
+            return self.compiled
+        if self._explainer is None:
+            self._explainer = CompiledForest.from_sklearn(self.model, self.scaler)
+        return self._explainer
     
     def _calculate_priority_rules(self, task: Task) -> Tuple[int, float]:
         """Fallback rule-based priority calculation"""
@@ -113,4 +186,4 @@ class TaskPrioritizer:
         if task.estimated_hours and task.estimated_hours > 8:
             base_priority = min(10, base_priority + 2)
         
-        return base_priority, confidence
\ No newline at end of file
+        return base_priority, confidence
@@ -0,0 +1,254 @@
+import importlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from typing import Dict, Optional, Tuple
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Module and class per model name; resolved on first use so that importing
+# the registry does not pull in scikit-learn, joblib and NumPy
+MODEL_CLASSES = {
+    "prioritizer": ("app.ml_models.prioritizer", "TaskPrioritizer"),
+    "deadline_predictor": ("app.ml_models.deadline_predictor", "DeadlinePredictor"),
+}
+
+# Same interface, linear models updated incrementally (settings.learning_mode == "online")
+ONLINE_MODEL_CLASSES = {
+    "prioritizer": ("app.ml_models.online", "OnlinePrioritizer"),
+    "deadline_predictor": ("app.ml_models.online", "OnlineDeadlinePredictor"),
+}
+
+def model_class(name: str, learning_mode: Optional[str] = None):
+    """Predictor class for a model name, importing its module on first use
+
+    learning_mode defaults to settings.learning_mode, the kind of model that
+    training publishes; loading uses the mode recorded with each version.
+    """
+    classes = ONLINE_MODEL_CLASSES if (learning_mode or settings.learning_mode) == "online" else MODEL_CLASSES
+    module, attribute = classes[name]
+    return getattr(importlib.import_module(module), attribute)
+
+class ModelRegistry:
+    """Versioned on-disk store for trained models, loaded lazily and hot-swapped
+
+    Layout: <root>/<name>/<version>/{model.joblib, scaler.joblib, meta.json,
+    compiled/*.npy or residuals.joblib} plus <root>/<name>/CURRENT naming the
+    version to serve.
+    """
+
+    def __init__(self, root: str, reload_interval: float = 60.0):
+        self.root = root
+        self.reload_interval = reload_interval
+        self._loaded: Dict[str, Tuple[Optional[str], object]] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _model_dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def save(self, name: str, predictor, metadata: Optional[Dict] = None) -> str:
+        """Persist a trained predictor as a new version and make it current"""
+        import joblib
+        from .compiled_forest import CompiledForest
+
+        if not predictor.is_trained:
+            raise ValueError(f"Refusing to publish untrained model '{name}'")
+
+        version = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        model_dir = self._model_dir(name)
+        staging_dir = os.path.join(model_dir, f".staging-{version}")
+        os.makedirs(staging_dir)
+
+        # Uncompressed. Only the compiled .npy tables are shared when memory-mapped:
+        # unpickling a forest copies its node arrays into memory each tree owns
+        joblib.dump(predictor.model, os.path.join(staging_dir, "model.joblib"))
+        joblib.dump(predictor.scaler, os.path.join(staging_dir, "scaler.joblib"))
+        if predictor.LEARNING_MODE == "online":
+            joblib.dump(predictor.residuals, os.path.join(staging_dir, "residuals.joblib"))
+        else:
+            CompiledForest.from_sklearn(predictor.model, predictor.scaler).save(
+                os.path.join(staging_dir, "compiled")
+            )
+
+        meta = {
+            "name": name,
+            "version": version,
+            "learning_mode": predictor.LEARNING_MODE,
+            "model_class": type(predictor.model).__name__,
+            "features": list(predictor.FEATURES),
+            "base_version": predictor.base_version or version,
+            "created_at": datetime.utcnow().isoformat(),
+            "training": metadata or {},
+        }
+        with open(os.path.join(staging_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2, default=str)
+
+        os.rename(staging_dir, os.path.join(model_dir, version))
+        self._write_current(name, version)
+        return version
+
+    def _write_current(self, name: str, version: str):
+        """Atomically point CURRENT at a version"""
+        current_path = os.path.join(self._model_dir(name), "CURRENT")
+        tmp_path = f"{current_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, current_path)
+
+    def current_version(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self._model_dir(name), "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def metadata(self, name: str, version: Optional[str] = None) -> Optional[Dict]:
+        version = version or self.current_version(name)
+        if version is None:
+            return None
+        with open(os.path.join(self._model_dir(name), version, "meta.json")) as f:
+            return json.load(f)
+
+    def load(self, name: str, version: Optional[str] = None):
+        """Load a version (default: current)
+
+        Forests are served from their compiled node tables, memory-mapped so
+        every worker on the host shares one copy of the pages. The forest
+        pickle is not shared (scikit-learn copies the node arrays out of a
+        memory map when it unpickles a tree), so it is only loaded on first
+        use of predictor.model: with inference_backend="sklearn", or for a
+        version saved without compiled tables.
+        """
+        import joblib
+        from .compiled_forest import CompiledForest
+
+        version = version or self.current_version(name)
+        if version is None:
+            return model_class(name)()
+
+        meta = self.metadata(name, version)
+        cls = model_class(name, meta.get("learning_mode", "batch"))
+        predictor = cls()
+        if meta["features"] != list(cls.FEATURES):
+            raise ValueError(
+                f"Feature schema of {name} {version} does not match {cls.__name__}.FEATURES"
+            )
+
+        version_dir = os.path.join(self._model_dir(name), version)
+        if cls.LEARNING_MODE == "online":
+            # A few coefficients that partial_fit updates in place: loaded, not memory-mapped
+            predictor.model = joblib.load(os.path.join(version_dir, "model.joblib"))
+            predictor.scaler = joblib.load(os.path.join(version_dir, "scaler.joblib"))
+            predictor.residuals = joblib.load(os.path.join(version_dir, "residuals.joblib"))
+            predictor.is_trained = True
+            predictor.version = version
+            predictor.base_version = meta.get("base_version", version)
+            return predictor
+
+        predictor.model = None
+        predictor.model_loader = partial(joblib.load, os.path.join(version_dir, "model.joblib"))
+        predictor.scaler = joblib.load(os.path.join(version_dir, "scaler.joblib"))
+        predictor.is_trained = True
+        predictor.version = version
+        predictor.base_version = meta.get("base_version", version)
+
+        if settings.inference_backend == "compiled":
+            # Plain .npy files: the mapping is shared across workers
+            compiled_dir = os.path.join(version_dir, "compiled")
+            if os.path.isdir(compiled_dir):
+                predictor.compiled = CompiledForest.load(compiled_dir, mmap_mode="r")
+            else:
+                predictor.compile()
+        return predictor
+
+    def prune(self, name: str, keep: int) -> int:
+        """Delete all but the newest keep versions, never the current one; returns how many were removed"""
+        model_dir = self._model_dir(name)
+        if not os.path.isdir(model_dir):
+            return 0
+        current = self.current_version(name)
+        # Version names are UTC timestamps, so they sort by age
+        versions = sorted(
+            entry for entry in os.listdir(model_dir)
+            if not entry.startswith(".") and os.path.isdir(os.path.join(model_dir, entry))
+        )
+        removed = 0
+        for version in versions[:-keep] if keep > 0 else versions:
+            if version != current:
+                shutil.rmtree(os.path.join(model_dir, version), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def get(self, name: str):
+        """Current predictor for a model, loading or hot-swapping it if needed
+
+        Callers keep the object they were handed, so a swap never affects
+        requests already scoring with the previous version.
+        """
+        loaded = self._loaded.get(name)
+        now = time.monotonic()
+        if loaded is not None and now - self._checked_at.get(name, 0.0) < self.reload_interval:
+            return loaded[1]
+
+        with self._lock:
+            loaded = self._loaded.get(name)
+            if loaded is not None and now - self._checked_at.get(name, 0.0) < self.reload_interval:
+                return loaded[1]
+
+            self._checked_at[name] = now
+            version = self.current_version(name)
+            if loaded is not None and loaded[0] == version:
+                return loaded[1]
+
+            try:
+                predictor = self.load(name, version)
+            except Exception:
+                logger.exception("Failed to load %s version %s", name, version)
+                if loaded is not None:
+                    return loaded[1]
+                version, predictor = None, model_class(name)()
+
+            self._loaded[name] = (version, predictor)
+            logger.info("Serving %s version %s", name, version or "rule-based")
+            return predictor
+
+    def versions(self) -> Dict[str, Optional[str]]:
+        """Versions currently held in memory"""
+        return {name: loaded[0] for name, loaded in self._loaded.items()}
+
+_model_registries: Dict[Optional[str], ModelRegistry] = {}
+_model_registries_lock = threading.Lock()
+
+def get_model_registry(shard: Optional[str] = None) -> ModelRegistry:
+    """Return the process-wide model registry for a shard (nothing is loaded until first use)
+
+    Each shard's models are trained on its own users and stored under
+    model_dir/shards/<name>; shard=None is the unsharded model_dir.
+    """
+    registry = _model_registries.get(shard)
+    if registry is None:
+        with _model_registries_lock:
+            registry = _model_registries.get(shard)
+            if registry is None:
+                root = settings.model_dir if shard is None else os.path.join(settings.model_dir, "shards", shard)
+                registry = ModelRegistry(root, reload_interval=settings.model_reload_interval)
+                _model_registries[shard] = registry
+    return registry
+
+def get_serving_registry(shard: Optional[str] = None):
+    """Registry that scoring reads from: the model-server sidecar when configured, else in-process
+
+    The sidecar holds one set of models, so sharded deployments score in-process.
+    """
+    if settings.model_server_socket and shard is None:
+        from .model_server import get_remote_registry
+
+        return get_remote_registry()
+    return get_model_registry(shard)
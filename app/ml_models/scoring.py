@@ -0,0 +1,209 @@
+import logging
+import time
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Task
+from ..response_cache import invalidate_user
+from ..sharding import get_shards
+from .history_cache import UserHistoryStats, get_user_history_stats
+from .model_server import ModelServerUnavailable
+from .registry import ModelRegistry, get_serving_registry
+
+logger = logging.getLogger(__name__)
+
+def model_version_tag(prioritizer, deadline_predictor) -> str:
+    """Identifies the pair of model versions a score was produced with
+
+    Online versions are tagged with the full fit they descend from, so
+    publishing an incremental update does not make every open task stale;
+    run_online_update flags the tasks of the users it learned from instead.
+    """
+    def tag(predictor):
+        return predictor.base_version or predictor.version or "rules"
+
+    return f"{tag(prioritizer)}/{tag(deadline_predictor)}"
+
+def compute_scores(
+    tasks: Sequence[Task],
+    user_id: int,
+    db: Optional[Session] = None,
+    history: Optional[UserHistoryStats] = None,
+    registry: Optional[ModelRegistry] = None
+) -> List[Dict]:
+    """Score one user's tasks with one batched call per model
+
+    Returns, per task, the values of the persisted AI columns. Without a
+    registry, the models of the user's shard are used. If the model server
+    goes away mid-request, the registry has switched to the rules, which
+    score the batch instead.
+    """
+    registry = registry or get_serving_registry(get_shards().name_for(user_id))
+    prioritizer = registry.get("prioritizer")
+    deadline_predictor = registry.get("deadline_predictor")
+    version = model_version_tag(prioritizer, deadline_predictor)
+    scored_at = datetime.utcnow()
+
+    try:
+        priorities = prioritizer.predict_priorities(tasks, user_id, db=db, history=history)
+        predictions = deadline_predictor.predict_deadlines(tasks, user_id, db=db, history=history)
+    except ModelServerUnavailable:
+        logger.warning("Model server unavailable; scoring %s tasks with the rules", len(tasks))
+        return compute_scores(tasks, user_id, db, history, registry)
+
+    return [
+        {
+            "priority": priority,
+            "priority_confidence": priority_confidence,
+            "predicted_hours": predicted_hours,
+            "prediction_confidence": prediction_confidence,
+            "model_version": version,
+            "scored_at": scored_at,
+            "needs_rescore": False,
+        }
+        for (priority, priority_confidence), (predicted_hours, prediction_confidence)
+        in zip(priorities, predictions)
+    ]
+
+def explain_scores(
+    tasks: Sequence[Task],
+    user_id: int,
+    db: Optional[Session] = None,
+    history: Optional[UserHistoryStats] = None,
+    registry: Optional[ModelRegistry] = None
+) -> List[Dict]:
+    """Explain both models' outputs for one user's tasks, one batched pass per model
+
+    Returns, per task, each model's base value, per-feature contributions
+    and spread (None while a model falls back to its rules). With the model
+    server, the forests are explained there like they are scored there.
+    """
+    if not tasks:
+        return []
+    registry = registry or get_serving_registry(get_shards().name_for(user_id))
+    prioritizer = registry.get("prioritizer")
+    deadline_predictor = registry.get("deadline_predictor")
+    version = model_version_tag(prioritizer, deadline_predictor)
+    if history is None:
+        history = get_user_history_stats(user_id, db)
+
+    try:
+        priorities = prioritizer.explain_matrix(prioritizer.extract_feature_matrix(tasks, history), user_id)
+        predictions = deadline_predictor.explain_matrix(
+            deadline_predictor.extract_feature_matrix(tasks, history), user_id
+        )
+    except ModelServerUnavailable:
+        return explain_scores(tasks, user_id, db, history, registry)
+    return [
+        {"priority": priority, "predicted_hours": predicted_hours, "model_version": version}
+        for priority, predicted_hours in zip(priorities, predictions)
+    ]
+
+def apply_scores(
+    tasks: Sequence[Task],
+    user_id: int,
+    db: Optional[Session] = None,
+    history: Optional[UserHistoryStats] = None,
+    registry: Optional[ModelRegistry] = None
+):
+    """Score tasks and write the results onto the Task rows"""
+    for task, scores in zip(tasks, compute_scores(tasks, user_id, db, history, registry)):
+        for field, value in scores.items():
+            setattr(task, field, value)
+
+def warm_up_models(registry: Optional[ModelRegistry] = None) -> str:
+    """Load the current models and score one throwaway task
+
+    Pays the scikit-learn import, model load and first-call costs up front,
+    so the first real request does not. Returns the version tag now served
+    (the first shard's when sharded; every shard's models are loaded).
+    """
+    if registry is None and get_shards().sharded:
+        versions = [warm_up_models(get_serving_registry(shard.name)) for shard in get_shards()]
+        return versions[0]
+    registry = registry or get_serving_registry()
+    task = Task(title="warm-up", estimated_hours=1.0, created_at=datetime.utcnow())
+    return compute_scores([task], user_id=0, history=UserHistoryStats(), registry=registry)[0]["model_version"]
+
+def stale_condition(version: str, now: Optional[datetime] = None):
+    """Open tasks whose stored scores no longer match their inputs
+
+    A task is stale when it was never scored, an input was edited, the
+    serving model version changed, or it was scored before today (the day
+    boundary moves days_to_deadline and task_age).
+    """
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return (Task.completed == False) & or_(
+        Task.scored_at.is_(None),
+        Task.scored_at < today,
+        Task.needs_rescore == True,
+        Task.model_version != version
+    )
+
+def rescore_stale_tasks(
+    db: Optional[Session] = None,
+    registry: Optional[ModelRegistry] = None,
+    batch_size: Optional[int] = None,
+    max_tasks: Optional[int] = None
+) -> Dict:
+    """Incrementally recompute stored scores for stale tasks
+
+    Work is bounded per run (max_tasks) and paced between batches, so a new
+    model version or the day rollover is absorbed over several runs instead
+    of one burst.
+    """
+    registry = registry or get_serving_registry()
+    batch_size = batch_size or settings.rescore_batch_size
+    max_tasks = max_tasks or settings.rescore_max_per_run
+    version = model_version_tag(registry.get("prioritizer"), registry.get("deadline_predictor"))
+    started = time.perf_counter()
+
+    own_session = db is None
+    db = db or SessionLocal()
+    rescored = batches = 0
+    last_id = 0
+    try:
+        while rescored < max_tasks:
+            tasks = db.scalars(
+                select(Task)
+                .where(stale_condition(version), Task.id > last_id)
+                .order_by(Task.id)
+                .limit(min(batch_size, max_tasks - rescored))
+            ).all()
+            if not tasks:
+                break
+            last_id = tasks[-1].id
+
+            # History features are per user, so score each user's tasks together
+            user_ids = []
+            for user_id, user_tasks in groupby(sorted(tasks, key=lambda t: t.user_id), key=lambda t: t.user_id):
+                apply_scores(list(user_tasks), user_id, db=db, registry=registry)
+                user_ids.append(user_id)
+            db.commit()
+            
+            # Stored priorities feed the insights and analytics responses
+            for user_id in user_ids:
+                invalidate_user(user_id)
+
+            rescored += len(tasks)
+            batches += 1
+            if settings.rescore_batch_pause:
+                time.sleep(settings.rescore_batch_pause)
+    finally:
+        if own_session:
+            db.close()
+
+    report = {
+        "model_version": version,
+        "rescored": rescored,
+        "batches": batches,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    if rescored:
+        logger.info("Rescoring run: %s", report)
+    return report
@@ -0,0 +1,168 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Union
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models import TaskCompletion, ProductivityLog
+from .columnar import ColumnSet, load_snapshot, load_training_columns, save_snapshot
+from .history_cache import UserHistoryStats
+from .registry import MODEL_CLASSES, ModelRegistry, get_model_registry, model_class
+
+logger = logging.getLogger(__name__)
+
+def load_history_stats_by_user(db: Session, user_ids=None) -> Dict[int, UserHistoryStats]:
+    """History aggregates for every user (or those in user_ids), in one grouped query per table"""
+    stats: Dict[int, UserHistoryStats] = {}
+
+    completion_query = select(
+        TaskCompletion.user_id,
+        func.count(TaskCompletion.actual_hours),
+        func.sum(TaskCompletion.actual_hours),
+        func.sum(TaskCompletion.actual_hours * TaskCompletion.actual_hours)
+    ).group_by(TaskCompletion.user_id)
+    log_query = select(
+        ProductivityLog.user_id,
+        func.count(ProductivityLog.id),
+        func.sum(ProductivityLog.productivity_score),
+        func.sum(ProductivityLog.tasks_completed)
+    ).group_by(ProductivityLog.user_id)
+    if user_ids is not None:
+        completion_query = completion_query.where(TaskCompletion.user_id.in_(user_ids))
+        log_query = log_query.where(ProductivityLog.user_id.in_(user_ids))
+
+    completion_rows = db.execute(completion_query)
+    for user_id, count, total, total_sq in completion_rows:
+        mean = total / count if count else 0.0
+        m2 = max(0.0, (total_sq or 0.0) - count * mean * mean) if count else 0.0
+        stats[user_id] = UserHistoryStats(count, mean, m2)
+
+    log_rows = db.execute(log_query)
+    for user_id, count, productivity_sum, tasks_completed_sum in log_rows:
+        user_stats = stats.setdefault(user_id, UserHistoryStats())
+        user_stats.log_count = count
+        user_stats.productivity_sum = productivity_sum or 0.0
+        user_stats.tasks_completed_sum = tasks_completed_sum or 0
+
+    return stats
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+@contextmanager
+def _peak_rss(report: Dict, key: str, interval: float = 0.01):
+    """Store the highest resident set size seen while the block runs, in MB
+
+    Sampled on a thread rather than read from ru_maxrss, which only grows
+    over a long-lived scheduler or Celery worker, so every report after a
+    large run would repeat that run's peak.
+    """
+    peak = _rss_mb()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, _rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True) if peak is not None else None
+    if sampler is not None:
+        sampler.start()
+    try:
+        yield
+    finally:
+        if sampler is not None:
+            done.set()
+            sampler.join()
+            peak = max(peak, _rss_mb())
+        report[key] = round(peak, 1) if peak is not None else None
+
+def _fit_model(name: str, training_data: Union[ColumnSet, str]):
+    """Fit one model; runs in a worker process, given columns or a snapshot path to memory-map"""
+    started = time.perf_counter()
+    memory = {}
+    with _peak_rss(memory, "peak_rss_mb"):
+        if isinstance(training_data, str):
+            training_data = load_snapshot(training_data)
+        predictor = model_class(name)()
+        trained = predictor.train(training_data)
+    return name, predictor if trained else None, time.perf_counter() - started, memory["peak_rss_mb"]
+
+def run_training(
+    db: Optional[Session] = None,
+    registry: Optional[ModelRegistry] = None,
+    chunk_size: Optional[int] = None
+) -> Dict:
+    """Load training data, fit both models off the request path and publish them"""
+    registry = registry or get_model_registry()
+    chunk_size = chunk_size or settings.training_chunk_size
+    report = {"started_at": datetime.utcnow().isoformat(), "status": "skipped"}
+    started = time.perf_counter()
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        # Completions after this id are left to online updates (settings.learning_mode == "online")
+        last_completion_id = db.scalar(select(func.max(TaskCompletion.id))) or 0
+        with _peak_rss(report, "load_peak_rss_mb"):
+            training_data = load_training_columns(db, chunk_size, TaskCompletion.id <= last_completion_id)
+    finally:
+        if own_session:
+            db.close()
+
+    report["rows"] = len(training_data)
+    report["chunks"] = -(-len(training_data) // chunk_size)
+    report["load_seconds"] = round(time.perf_counter() - started, 3)
+
+    if len(training_data) < settings.min_data_points:
+        logger.info("Skipping training: %d rows < min_data_points", len(training_data))
+        report["total_seconds"] = round(time.perf_counter() - started, 3)
+        return report
+
+    # Daemonic processes (e.g. Celery prefork children) cannot start a pool
+    if multiprocessing.current_process().daemon:
+        results = [_fit_model(name, training_data) for name in MODEL_CLASSES]
+    else:
+        # With a snapshot, fit workers memory-map the columns instead of receiving a pickled copy each
+        shared = training_data
+        if settings.training_snapshot_dir:
+            shared = save_snapshot(training_data, settings.training_snapshot_dir, settings.training_snapshot_format)
+            report["snapshot"] = shared
+        with ProcessPoolExecutor(max_workers=len(MODEL_CLASSES)) as pool:
+            futures = [pool.submit(_fit_model, name, shared) for name in MODEL_CLASSES]
+            results = [future.result() for future in futures]
+
+    report["models"] = {}
+    for name, predictor, fit_seconds, peak_rss_mb in results:
+        model_report = {"fit_seconds": round(fit_seconds, 3), "peak_rss_mb": peak_rss_mb}
+        if predictor is not None:
+            model_report["version"] = registry.save(name, predictor, {
+                "rows": len(training_data),
+                "fit_seconds": model_report["fit_seconds"],
+                "last_completion_id": last_completion_id,
+            })
+        report["models"][name] = model_report
+
+    report["status"] = "published"
+    report["total_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("Training run: %s", json.dumps(report))
+    return report
+
+if __name__ == "__main__":
+    from ..sharding import run_on_each_shard
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run_on_each_shard(run_training), indent=2))
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from .config import settings
+from .database import Base
+from .sharding import next_row_id
 
-Base = declarative_base()
+# Sharded databases draw ids from per-shard counters, so they stay unique when users move
+_sharded_id = next_row_id if settings.shard_urls else None
 
 class User(Base):
     __tablename__ = "users"
@@ -19,7 +22,7 @@ class User(Base):
 class Task(Base):
     __tablename__ = "tasks"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, default=_sharded_id)
     title = Column(String, index=True)
     description = Column(Text)
     priority = Column(Integer, default=1)  # AI-calculated priority
@@ -29,26 +32,66 @@ class Task(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
     
+    # Persisted AI analysis, refreshed by the rescoring job
+    predicted_hours = Column(Float, nullable=True)
+    priority_confidence = Column(Float, nullable=True)
+    prediction_confidence = Column(Float, nullable=True)
+    model_version = Column(String, nullable=True)
+    scored_at = Column(DateTime, nullable=True)
+    needs_rescore = Column(Boolean, default=True)
+    
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User", back_populates="tasks")
     
 class ProductivityLog(Base):
     __tablename__ = "productivity_logs"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, default=_sharded_id)
     user_id = Column(Integer, ForeignKey("users.id"))
-    date = Column(DateTime)
+    date = Column(DateTime)  # UTC day start; one row per user and day
     tasks_completed = Column(Integer, default=0)
+    tasks_on_time = Column(Integer, default=0)
     hours_worked = Column(Float, default=0.0)
-    productivity_score = Column(Float, default=0.0)
+    productivity_score = Column(Float, default=0.0)  # share of the day's completions made by their deadline
     
     user = relationship("User", back_populates="productivity_logs")
 
 class TaskCompletion(Base):
     __tablename__ = "task_completions"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, default=_sharded_id)
     task_id = Column(Integer, ForeignKey("tasks.id"))
     actual_hours = Column(Float)
     completion_date = Column(DateTime, default=datetime.utcnow)
-    user_id = Column(Integer, ForeignKey("users.id"))
\ No newline at end of file
+    user_id = Column(Integer, ForeignKey("users.id"))
+    idempotency_key = Column(String, nullable=True)  # Idempotency-Key of the completing request
+
+# Composite indexes for the per-user filters used by the routers
+Index("ix_tasks_user_completed_completed_at", Task.user_id, Task.completed, Task.completed_at)
+Index(
+    "ix_tasks_user_open_deadline",
+    Task.user_id,
+    Task.deadline,
+    postgresql_where=Task.completed == False,
+    sqlite_where=Task.completed == False
+)
+Index("ix_tasks_user_priority_id", Task.user_id, Task.priority, Task.id)
+Index(
+    "ix_tasks_open_scored_at",
+    Task.scored_at,
+    postgresql_where=Task.completed == False,
+    sqlite_where=Task.completed == False
+)
+Index("ix_task_completions_task_id", TaskCompletion.task_id)
+Index("ix_task_completions_user_id", TaskCompletion.user_id)
+Index("ix_task_completions_completion_date", TaskCompletion.completion_date)
+Index("ux_task_completions_idempotency_key", TaskCompletion.idempotency_key, unique=True)
+Index("ux_productivity_logs_user_date", ProductivityLog.user_id, ProductivityLog.date, unique=True)
+
+# Editing a model input flags the task for the rescoring job
+def _mark_for_rescore(target, value, oldvalue, initiator):
+    if value != oldvalue:
+        target.needs_rescore = True
+
+for _attribute in (Task.title, Task.description, Task.deadline, Task.estimated_hours):
+    event.listen(_attribute, "set", _mark_for_rescore)
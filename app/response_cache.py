@@ -0,0 +1,230 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class InMemoryResponseCache:
+    """Process-local LRU of rendered JSON responses, with per-user version counters
+
+    Every key embeds the user's current version, so invalidating a user is a
+    counter bump and stale entries simply age out.
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: int = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, Tuple[float, str, bytes]]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self.invalidations += 1
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, key: str, etag: str, body: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "size": size
+        }
+
+class RedisResponseCache:
+    """Rendered JSON responses and per-user version counters shared across workers in Redis
+
+    Redis errors are logged and treated as misses, so an outage degrades to
+    uncached responses rather than failed requests.
+    """
+
+    backend = "redis"
+
+    def __init__(self, redis_url: str, ttl_seconds: int = 300, prefix: str = "response:"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.errors = (redis.RedisError,)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def _version_key(self, user_id: int) -> str:
+        return f"{self.prefix}version:{user_id}"
+
+    def version(self, user_id: int) -> int:
+        try:
+            return int(self.client.get(self._version_key(user_id)) or 0)
+        except self.errors:
+            logger.warning("Response cache version lookup failed", exc_info=True)
+            return -1
+
+    def bump(self, user_id: int):
+        try:
+            self.client.incr(self._version_key(user_id))
+            self.invalidations += 1
+        except self.errors:
+            logger.warning("Response cache invalidation failed for user %s", user_id, exc_info=True)
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        try:
+            value = self.client.get(self.prefix + key)
+        except self.errors:
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        etag, body = value.split(b"\n", 1)
+        return etag.decode(), body
+
+    def set(self, key: str, etag: str, body: bytes):
+        try:
+            self.client.set(self.prefix + key, etag.encode() + b"\n" + body, ex=self.ttl_seconds)
+        except self.errors:
+            logger.warning("Response cache write failed", exc_info=True)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations
+        }
+
+_response_cache = None
+
+def get_response_cache():
+    """Return the process-wide response cache, falling back to memory if Redis is unreachable"""
+    global _response_cache
+    if _response_cache is None:
+        if settings.response_cache_backend == "redis":
+            cache = RedisResponseCache(settings.redis_url, ttl_seconds=settings.response_cache_ttl)
+            try:
+                cache.client.ping()
+                _response_cache = cache
+            except cache.errors:
+                logger.warning("Redis unavailable, using the in-process response cache")
+        if _response_cache is None:
+            _response_cache = InMemoryResponseCache(
+                max_entries=settings.response_cache_max_entries,
+                ttl_seconds=settings.response_cache_ttl
+            )
+    return _response_cache
+
+def invalidate_user(user_id: int):
+    """Drop a user's cached responses; call after the write has committed"""
+    if settings.response_cache_backend != "off":
+        get_response_cache().bump(user_id)
+
+def _cache_key(cache, endpoint: str, user_id: int, params: Dict) -> Optional[str]:
+    version = cache.version(user_id)
+    if version < 0:
+        return None
+    return f"{endpoint}:{user_id}:{version}:{urlencode(sorted(params.items()))}"
+
+def _render(payload: Any) -> Tuple[str, bytes]:
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+    return f'"{hashlib.sha1(body).hexdigest()[:20]}"', body
+
+def _respond(cache, request: Request, etag: str, body: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            cache.not_modified += 1
+            return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def cached_json(
+    request: Request,
+    endpoint: str,
+    user_id: int,
+    params: Dict,
+    compute: Callable[[], Any]
+) -> Response:
+    """Serve compute()'s JSON from the cache, with ETag / If-None-Match support
+
+    The user's version is read before computing, so a write committed
+    meanwhile files the result under a version nobody asks for any more.
+    """
+    cache = get_response_cache()
+    if settings.response_cache_backend == "off":
+        return _respond(cache, request, *_render(compute()))
+
+    key = _cache_key(cache, endpoint, user_id, params)
+    entry = cache.get(key) if key is not None else None
+    if entry is None:
+        entry = _render(compute())
+        if key is not None:
+            cache.set(key, *entry)
+    return _respond(cache, request, *entry)
+
+async def cached_json_async(
+    request: Request,
+    endpoint: str,
+    user_id: int,
+    params: Dict,
+    compute: Callable[[], Awaitable[Any]]
+) -> Response:
+    """cached_json for a coroutine compute()"""
+    cache = get_response_cache()
+    if settings.response_cache_backend == "off":
+        return _respond(cache, request, *_render(await compute()))
+
+    key = _cache_key(cache, endpoint, user_id, params)
+    entry = cache.get(key) if key is not None else None
+    if entry is None:
+        entry = _render(await compute())
+        if key is not None:
+            cache.set(key, *entry)
+    return _respond(cache, request, *entry)
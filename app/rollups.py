@@ -0,0 +1,175 @@
+import argparse
+import logging
+from datetime import date, datetime, time
+from typing import Optional, Tuple, Union
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from .aggregates import _count_where
+from .models import ProductivityLog, Task, TaskCompletion
+
+logger = logging.getLogger(__name__)
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _as_day(value) -> datetime:
+    # func.date() yields a string on SQLite and a date on PostgreSQL
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d")
+    if isinstance(value, datetime):
+        return day_start(value)
+    return datetime.combine(value, time())
+
+def _upsert_insert(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+def record_daily_completion(
+    db: Session,
+    user_id: int,
+    completed_at: datetime,
+    actual_hours: float,
+    on_time: Union[bool, int],
+    count: int = 1
+) -> Tuple[float, int, Optional[Tuple[float, int]]]:
+    """Fold one completion into the user's ProductivityLog row for that day
+
+    Runs in the caller's transaction as a single upsert. Returns the day's
+    new (productivity_score, tasks_completed) plus the values it replaced,
+    or None when the row is new, for the history cache write-through.
+    Several completions on one day fold in at once with count, the summed
+    actual_hours and the number of them that were on time.
+    """
+    day = day_start(completed_at)
+    on_time = int(on_time)
+    tasks_on_time = func.coalesce(ProductivityLog.tasks_on_time, 0) + on_time
+    tasks_completed = func.coalesce(ProductivityLog.tasks_completed, 0) + count
+    changes = {
+        "tasks_completed": tasks_completed,
+        "tasks_on_time": tasks_on_time,
+        "hours_worked": func.coalesce(ProductivityLog.hours_worked, 0.0) + actual_hours,
+        "productivity_score": tasks_on_time * 1.0 / tasks_completed,
+    }
+    returning = (ProductivityLog.tasks_completed, ProductivityLog.tasks_on_time)
+
+    dialect_insert = _upsert_insert(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(ProductivityLog).values(
+            user_id=user_id,
+            date=day,
+            tasks_completed=count,
+            tasks_on_time=on_time,
+            hours_worked=actual_hours,
+            productivity_score=on_time / count
+        ).on_conflict_do_update(
+            index_elements=[ProductivityLog.user_id, ProductivityLog.date],
+            set_=changes
+        ).returning(*returning)
+        new_tasks, new_on_time = db.execute(stmt).one()
+    else:
+        row = db.execute(
+            update(ProductivityLog)
+            .where(ProductivityLog.user_id == user_id, ProductivityLog.date == day)
+            .values(changes)
+            .returning(*returning)
+        ).first()
+        if row is None:
+            db.add(ProductivityLog(
+                user_id=user_id,
+                date=day,
+                tasks_completed=count,
+                tasks_on_time=on_time,
+                hours_worked=actual_hours,
+                productivity_score=on_time / count
+            ))
+            row = (count, on_time)
+        new_tasks, new_on_time = row
+
+    replaces = None
+    if new_tasks > count:
+        old_tasks = new_tasks - count
+        replaces = ((new_on_time - on_time) / old_tasks, old_tasks)
+    return new_on_time / new_tasks, new_tasks, replaces
+
+def rebuild_daily_rollups(
+    db: Session,
+    user_id: Optional[int] = None,
+    since: Optional[date] = None,
+    batch_size: int = 5000
+) -> int:
+    """Recompute ProductivityLog rows from TaskCompletion history
+
+    Existing rollups in scope (one user and/or days from `since`) are
+    replaced in a single transaction; grouped rows are streamed and inserted
+    in batches. Returns the number of rollup rows written.
+    """
+    completed_on = func.date(TaskCompletion.completion_date)
+    scope = [TaskCompletion.completion_date.isnot(None)]
+    log_scope = []
+    if user_id is not None:
+        scope.append(TaskCompletion.user_id == user_id)
+        log_scope.append(ProductivityLog.user_id == user_id)
+    if since is not None:
+        since_day = datetime.combine(since, time())
+        scope.append(TaskCompletion.completion_date >= since_day)
+        log_scope.append(ProductivityLog.date >= since_day)
+
+    db.execute(delete(ProductivityLog).where(*log_scope))
+
+    result = db.execute(
+        select(
+            TaskCompletion.user_id,
+            completed_on.label("day"),
+            func.count(TaskCompletion.id).label("tasks_completed"),
+            func.coalesce(func.sum(TaskCompletion.actual_hours), 0.0).label("hours_worked"),
+            _count_where(or_(
+                Task.deadline.is_(None),
+                TaskCompletion.completion_date <= Task.deadline
+            )).label("tasks_on_time")
+        )
+        .outerjoin(Task, Task.id == TaskCompletion.task_id)
+        .where(*scope)
+        .group_by(TaskCompletion.user_id, completed_on)
+        .execution_options(yield_per=batch_size)
+    )
+
+    written = 0
+    for partition in result.partitions(batch_size):
+        db.execute(insert(ProductivityLog), [
+            {
+                "user_id": r.user_id,
+                "date": _as_day(r.day),
+                "tasks_completed": r.tasks_completed,
+                "tasks_on_time": r.tasks_on_time,
+                "hours_worked": float(r.hours_worked),
+                "productivity_score": r.tasks_on_time / r.tasks_completed,
+            }
+            for r in partition
+        ])
+        written += len(partition)
+
+    db.commit()
+    return written
+
+if __name__ == "__main__":
+    from .sharding import get_shards
+
+    parser = argparse.ArgumentParser(description="Backfill daily productivity rollups")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    shards = get_shards()
+    shards.upgrade()
+    written = 0
+    for shard in ([shards.for_user(args.user_id)] if args.user_id is not None else shards):
+        with shard.session() as db:
+            written += rebuild_daily_rollups(db, user_id=args.user_id, since=args.since)
+    # Cached history features pick the new rollups up as their entries expire
+    logger.info("Wrote %d daily rollup rows", written)
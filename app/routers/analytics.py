@@ -1,89 +1,76 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import Dict
+from ..aggregates import completion_summary, daily_completions, priority_distribution, recent_completion_summary
+from ..config import settings
 from ..database import get_db
-from ..models import Task, TaskCompletion, ProductivityLog
+from ..response_cache import cached_json
+from ..rollups import day_start
 
 router = APIRouter()
 
 @router.get("/productivity/{user_id}")
 def get_productivity_analytics(
     user_id: int,
+    request: Request,
     days: int = 30,
     db: Session = Depends(get_db)
 ):
     """Get productivity analytics for a user"""
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Task completion trends
-    daily_completions = db.query(
-        func.date(Task.completed_at).label("date"),
-        func.count(Task.id).label("completed")
-    ).filter(
-        Task.user_id == user_id,
-        Task.completed == True,
-        Task.completed_at >= start_date
-    ).group_by(func.date(Task.completed_at)).all()
+    return cached_json(
+        request, "productivity", user_id, {"days": days},
+        lambda: productivity_analytics(db, user_id, days)
+    )
+
+def productivity_analytics(db: Session, user_id: int, days: int) -> Dict:
+    start_date = day_start(datetime.utcnow() - timedelta(days=days))
     
-    # Average completion time
-    avg_completion = db.query(
-        func.avg(TaskCompletion.actual_hours)
-    ).filter(
-        TaskCompletion.user_id == user_id
-    ).scalar() or 0
+    # Task completion trends, one pre-aggregated row per day
+    completions = daily_completions(db, user_id, start_date)
     
-    # Task distribution by priority
-    priority_dist = db.query(
-        Task.priority,
-        func.count(Task.id).label("count")
-    ).filter(
-        Task.user_id == user_id
-    ).group_by(Task.priority).all()
+    # Average completion time and task distribution by priority
+    avg_completion = completion_summary(db, user_id)["avg_hours"]
+    priority_dist = priority_distribution(db, user_id)
     
     return {
         "period_days": days,
-        "daily_completions": [{"date": str(d.date), "completed": d.completed} for d in daily_completions],
+        "daily_completions": completions,
         "average_completion_hours": round(avg_completion, 2),
-        "priority_distribution": [{"priority": p.priority, "count": p.count} for p in priority_dist]
+        "priority_distribution": priority_dist
     }
 
 @router.get("/predictions/{user_id}")
 def get_ai_predictions(
     user_id: int,
+    request: Request,
+    lookback: int = Query(settings.analytics_lookback, ge=5, le=settings.analytics_max_lookback),
     db: Session = Depends(get_db)
 ):
     """Get AI predictions for user performance"""
-    # Get recent task patterns
-    recent_tasks = db.query(Task).filter(
-        Task.user_id == user_id,
-        Task.completed == True
-    ).order_by(Task.completed_at.desc()).limit(20).all()
+    return cached_json(
+        request, "predictions", user_id, {"lookback": lookback},
+        lambda: ai_predictions(db, user_id, lookback)
+    )
+
+def ai_predictions(db: Session, user_id: int, lookback: int) -> Dict:
+    # Recent task patterns and their completion hours in a single query
+    recent = recent_completion_summary(db, user_id, lookback)
     
-    if len(recent_tasks) < 5:
+    if recent["tasks"] < 5:
         return {"message": "Insufficient data for predictions", "status": "collecting_data"}
     
-    # Calculate patterns
-    completion_times = []
-    for task in recent_tasks:
-        completion = db.query(TaskCompletion).filter(
-            TaskCompletion.task_id == task.id
-        ).first()
-        if completion:
-            completion_times.append(completion.actual_hours)
-    
-    if not completion_times:
+    if not recent["completions"]:
         return {"message": "No completion data available", "status": "no_data"}
     
-    avg_completion_time = sum(completion_times) / len(completion_times)
+    avg_completion_time = recent["avg_hours"]
     
     # Predict next week capacity
     next_week_capacity = 40 / avg_completion_time  # Assuming 40-hour work week
     
     return {
         "status": "ready",
-        "data_points": len(recent_tasks),
+        "data_points": recent["tasks"],
         "average_completion_time": round(avg_completion_time, 2),
         "predicted_weekly_capacity": round(next_week_capacity, 1),
         "recommendations": [
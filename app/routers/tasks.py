@@ -1,16 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import json
+import logging
+from tempfile import SpooledTemporaryFile
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-from pydantic import BaseModel
-from ..database import get_db
+from pydantic import BaseModel, ValidationError
+from ..aggregates import task_summary
+from ..bulk_import import chunked, iter_records, upload_format
+from ..completion_queue import TASK_PENDING, completion_event, get_completion_queue
+from ..config import settings
+from ..database import get_async_db, get_db
 from ..models import Task, TaskCompletion
-from ..ml_models.prioritizer import TaskPrioritizer
-from ..ml_models.deadline_predictor import DeadlinePredictor
+from ..response_cache import cached_json, cached_json_async, invalidate_user
+from ..rollups import record_daily_completion
+from ..scheduling import PlanCache, PlanItem, Schedule, WorkCalendar, replan
+from ..sharding import session_for_user
+from ..task_parser import get_task_parser
+from ..ml_models.history_cache import (
+    UserHistoryStats, get_history_cache, get_user_history_stats, get_user_history_stats_async
+)
+from ..ml_models.scoring import apply_scores, compute_scores, explain_scores
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-prioritizer = TaskPrioritizer()
-deadline_predictor = DeadlinePredictor()
+async_router = APIRouter()  # asyncio variants served over the async engine
 
 class TaskCreate(BaseModel):
     title: str
@@ -18,12 +39,18 @@ class TaskCreate(BaseModel):
     deadline: Optional[datetime] = None
     estimated_hours: Optional[float] = None
 
+class TaskUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    deadline: Optional[datetime] = None
+    estimated_hours: Optional[float] = None
+
 class TaskResponse(BaseModel):
     id: int
     title: str
     description: Optional[str]
     priority: int
-    estimated_hours: float
+    estimated_hours: Optional[float]
     deadline: Optional[datetime]
     completed: bool
     created_at: datetime
@@ -36,6 +63,41 @@ class TaskWithAI(TaskResponse):
     priority_confidence: float
     predicted_hours: float
     prediction_confidence: float
+    model_version: Optional[str] = None
+    explanation: Optional[Dict] = None  # Only with explain=true
+    
+    class Config:
+        protected_namespaces = ()
+
+def _task_with_ai(task: Task, scores: Optional[Dict] = None, explanation: Optional[Dict] = None) -> TaskWithAI:
+    """Build the API view from the stored AI columns, or from fresh scores"""
+    fields = {**task.__dict__, **(scores or {})}
+    return TaskWithAI(**fields, ai_priority=fields["priority"], explanation=explanation)
+
+def _tasks_with_ai(
+    tasks: List[Task],
+    user_id: int,
+    db: Optional[Session] = None,
+    history: Optional[UserHistoryStats] = None,
+    explain: bool = False
+) -> List[TaskWithAI]:
+    """Serve stored predictions; only never-scored tasks are scored inline (not persisted)
+    
+    With explain, every task also gets the current models' per-feature
+    contributions and spread, computed in one batched pass per model.
+    """
+    unscored = [task for task in tasks if task.scored_at is None]
+    if explain and history is None:
+        history = get_user_history_stats(user_id, db)
+    fresh = dict(zip(
+        (task.id for task in unscored),
+        compute_scores(unscored, user_id, db=db, history=history) if unscored else []
+    ))
+    explanations = explain_scores(tasks, user_id, db=db, history=history) if explain else [None] * len(tasks)
+    return [
+        _task_with_ai(task, fresh.get(task.id), explanation)
+        for task, explanation in zip(tasks, explanations)
+    ]
 
 @router.post("/", response_model=TaskWithAI)
 def create_task(
@@ -49,68 +111,318 @@ def create_task(
         description=task.description,
         deadline=task.deadline,
         estimated_hours=task.estimated_hours,
-        user_id=user_id
+        user_id=user_id,
+        created_at=datetime.utcnow()
     )
     
     db.add(db_task)
+    db.flush()
+    
+    # AI analysis, stored on the row in the same transaction
+    apply_scores([db_task], user_id, db=db)
+    task_with_ai = _task_with_ai(db_task)
     db.commit()
-    db.refresh(db_task)
+    invalidate_user(user_id)
+    
+    return task_with_ai
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+    )
+
+def _insert_scored(db: Session, user_id: int, tasks: List[TaskCreate], history: UserHistoryStats) -> List[Tuple[int, Dict]]:
+    """Score a chunk with one call per model and insert it with one executemany"""
+    created_at = datetime.utcnow()
+    rows = [
+        {**task.model_dump(), "user_id": user_id, "created_at": created_at}
+        for task in tasks
+    ]
+    # Transient rows only carry the model inputs; they are never added to the session
+    scores = compute_scores([Task(**row) for row in rows], user_id, history=history)
+    
+    for row, row_scores in zip(rows, scores):
+        row.update(row_scores)
+    ids = db.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), rows).all()
+    return list(zip(ids, scores))
+
+def _import_tasks(db: Session, user_id: int, upload: SpooledTemporaryFile, fmt: str):
+    """Yield one NDJSON result per uploaded row, committing chunk by chunk; closes db when done"""
+    created = failed = 0
+    try:
+        history = get_user_history_stats(user_id, db)
+        for chunk in chunked(iter_records(upload, fmt, settings.bulk_max_row_chars), settings.bulk_chunk_size):
+            results = {}
+            valid = []
+            for row, record, error in chunk:
+                if error is None:
+                    try:
+                        valid.append((row, TaskCreate.model_validate(record)))
+                        continue
+                    except ValidationError as exc:
+                        error = _validation_message(exc)
+                results[row] = {"row": row, "error": error}
+            
+            if valid:
+                try:
+                    inserted = _insert_scored(db, user_id, [task for _, task in valid], history)
+                    db.commit()
+                    invalidate_user(user_id)
+                    for (row, _), (task_id, scores) in zip(valid, inserted):
+                        results[row] = {
+                            "row": row,
+                            "id": task_id,
+                            "priority": scores["priority"],
+                            "predicted_hours": scores["predicted_hours"],
+                        }
+                except SQLAlchemyError as exc:
+                    db.rollback()
+                    for row, _ in valid:
+                        results[row] = {"row": row, "error": f"Insert failed: {exc.__class__.__name__}"}
+            
+            created += sum("id" in result for result in results.values())
+            failed += sum("error" in result for result in results.values())
+            yield "".join(json.dumps(results[row]) + "\n" for row in sorted(results))
+    finally:
+        db.close()
+        upload.close()
+    
+    yield json.dumps({"created": created, "failed": failed}) + "\n"
+
+@router.post("/bulk")
+async def bulk_import_tasks(user_id: int, request: Request):
+    """Import many tasks from a JSON array, NDJSON or CSV upload
     
-    # AI analysis
-    priority, priority_confidence = prioritizer.predict_priority(db_task, user_id)
-    predicted_hours, prediction_confidence = deadline_predictor.predict_deadline(db_task, user_id)
+    The body is spooled to a temporary file (spilling to disk past
+    bulk_spool_max_memory) and parsed lazily. Every bulk_chunk_size rows
+    are scored with one call per model, inserted with one executemany and
+    committed, so memory stays bounded whatever the upload size. The
+    response is NDJSON: one {"row", "id", ...} or {"row", "error"} line per
+    row, then a {"created", "failed"} summary.
+    """
+    fmt = upload_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Upload must be application/json, application/x-ndjson or text/csv"
+        )
     
-    # Update with AI insights
-    db_task.priority = priority
+    upload = SpooledTemporaryFile(max_size=settings.bulk_spool_max_memory)
+    async for data in request.stream():
+        upload.write(data)
+    upload.seek(0)
+    
+    # Opened before the response starts, so a user being moved gets a 503 rather than a cut-off stream
+    db = session_for_user(user_id)
+    return StreamingResponse(_import_tasks(db, user_id, upload, fmt), media_type="application/x-ndjson")
+
+class TaskParseRequest(BaseModel):
+    texts: List[str]
+    create: bool = False
+
+@router.post("/parse")
+def parse_tasks(request: TaskParseRequest, user_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Extract title, deadline and estimated hours from free text
+    
+    "Finish the quarterly report by Friday at 5pm" becomes a title and a
+    deadline. Rules and a date grammar handle most texts; an optional local
+    transformer (task_parser_model_dir) tags the uncertain ones in batches.
+    Deadlines are read as UTC. With create=true the parsed tasks are also
+    scored and created for user_id.
+    """
+    if not 1 <= len(request.texts) <= settings.task_parser_max_texts:
+        raise HTTPException(status_code=422, detail=f"Send 1 to {settings.task_parser_max_texts} texts")
+    if request.create and user_id is None:
+        raise HTTPException(status_code=400, detail="user_id is required to create tasks")
+    
+    parsed = get_task_parser().parse(request.texts)
+    if request.create:
+        tasks = [
+            TaskCreate(
+                title=item["title"],
+                description=item["text"] if item["text"].strip() != item["title"] else None,
+                deadline=item["deadline"],
+                estimated_hours=item["estimated_hours"]
+            )
+            for item in parsed
+        ]
+        inserted = _insert_scored(db, user_id, tasks, get_user_history_stats(user_id, db))
+        db.commit()
+        invalidate_user(user_id)
+        for item, (task_id, scores) in zip(parsed, inserted):
+            item.update(id=task_id, priority=scores["priority"], predicted_hours=scores["predicted_hours"])
+    return {"parsed": parsed}
+
+@router.patch("/{task_id}", response_model=TaskWithAI)
+def update_task(
+    task_id: int,
+    user_id: int,
+    changes: TaskUpdate,
+    db: Session = Depends(get_db)
+):
+    """Edit a task; changed inputs are picked up by the rescoring job"""
+    task = db.query(Task).filter(
+        Task.id == task_id,
+        Task.user_id == user_id
+    ).first()
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    for field, value in changes.model_dump(exclude_unset=True).items():
+        setattr(task, field, value)
+    
+    task_with_ai = _task_with_ai(task)
     db.commit()
+    invalidate_user(user_id)
     
-    return TaskWithAI(
-        **db_task.__dict__,
-        ai_priority=priority,
-        priority_confidence=priority_confidence,
-        predicted_hours=predicted_hours,
-        prediction_confidence=prediction_confidence
-    )
+    return task_with_ai
+
+def _encode_cursor(task: Task) -> str:
+    return base64.urlsafe_b64encode(f"{task.priority}:{task.id}".encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        priority, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(priority), int(task_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _task_statement(
+    user_id: int,
+    completed: Optional[bool],
+    after: Optional[Tuple[int, int]] = None,
+    limit: Optional[int] = None
+):
+    """Select a user's tasks; with a limit, one keyset page in (priority, id) descending order"""
+    stmt = select(Task).where(Task.user_id == user_id)
+    
+    if completed is not None:
+        stmt = stmt.where(Task.completed == completed)
+    if after is not None:
+        priority, task_id = after
+        stmt = stmt.where(or_(
+            Task.priority < priority,
+            and_(Task.priority == priority, Task.id < task_id)
+        ))
+    if limit is not None:
+        stmt = stmt.order_by(Task.priority.desc(), Task.id.desc()).limit(limit)
+    return stmt
+
+def _stream_tasks(
+    db: Session,
+    user_id: int,
+    completed: Optional[bool],
+    after: Optional[Tuple[int, int]],
+    limit: Optional[int],
+    explain: bool = False
+):
+    """Yield NDJSON lines, flushing one chunk of tasks at a time; closes db when done"""
+    try:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            chunk_size = settings.task_stream_chunk_size
+            if remaining is not None:
+                chunk_size = min(chunk_size, remaining)
+                remaining -= chunk_size
+            
+            tasks = db.scalars(_task_statement(user_id, completed, after, chunk_size)).all()
+            if not tasks:
+                break
+            yield "".join(t.model_dump_json() + "\n" for t in _tasks_with_ai(tasks, user_id, db, explain=explain))
+            if len(tasks) < chunk_size:
+                break
+            after = (tasks[-1].priority, tasks[-1].id)
+    finally:
+        db.close()
 
 @router.get("/", response_model=List[TaskWithAI])
 def get_tasks(
     user_id: int,
+    response: Response,
     completed: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    explain: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Get tasks with AI analysis"""
-    query = db.query(Task).filter(Task.user_id == user_id)
+    """Get tasks with AI analysis
     
-    if completed is not None:
-        query = query.filter(Task.completed == completed)
-    
-    tasks = query.all()
-    
-    tasks_with_ai = []
-    for task in tasks:
-        priority, priority_confidence = prioritizer.predict_priority(task, user_id)
-        predicted_hours, prediction_confidence = deadline_predictor.predict_deadline(task, user_id)
-        
-        tasks_with_ai.append(TaskWithAI(
-            **task.__dict__,
-            ai_priority=priority,
-            priority_confidence=priority_confidence,
-            predicted_hours=predicted_hours,
-            prediction_confidence=prediction_confidence
-        ))
+    With limit/cursor, tasks are paged by stored priority and the next
+    cursor is returned in the X-Next-Cursor header. stream=true returns
+    NDJSON, flushed chunk by chunk. Predictions are the ones stored on
+    the task rows, kept fresh by the rescoring job. explain=true adds
+    each task's per-feature contributions and model uncertainty.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    
+    if stream:
+        return StreamingResponse(
+            _stream_tasks(session_for_user(user_id), user_id, completed, after, limit, explain),
+            media_type="application/x-ndjson"
+        )
+    
+    if limit is not None or after is not None:
+        limit = limit or settings.task_page_size
+        tasks = db.scalars(_task_statement(user_id, completed, after, limit)).all()
+        if len(tasks) == limit:
+            response.headers["X-Next-Cursor"] = _encode_cursor(tasks[-1])
+        return _tasks_with_ai(tasks, user_id, db, explain=explain)
+    
+    tasks = db.scalars(_task_statement(user_id, completed)).all()
+    tasks_with_ai = _tasks_with_ai(tasks, user_id, db, explain=explain)
     
     # Sort by AI priority
     tasks_with_ai.sort(key=lambda x: x.ai_priority, reverse=True)
     return tasks_with_ai
 
+def _on_time(task: Task) -> bool:
+    return task.deadline is None or task.completed_at <= task.deadline
+
+def _queue_completion(queue, task_id: int, user_id: int, actual_hours: float, idempotency_key: Optional[str]) -> Optional[Dict]:
+    """Queue a completion for the writer; None when the queue fails and the request should write it itself"""
+    event = completion_event(task_id, user_id, actual_hours, idempotency_key)
+    try:
+        # A retry already queued (DUPLICATE) is acknowledged the same way
+        status = queue.append(event)
+    except Exception:
+        logger.warning("Completion queue unavailable; completing task %s synchronously", task_id, exc_info=True)
+        return None
+    if status == TASK_PENDING:
+        # The task is not marked completed until the writer flushes, but it is already on its way
+        raise HTTPException(status_code=409, detail="Task already completed")
+    return {"message": "Task completion queued", "idempotency_key": event["key"]}
+
+_COMPLETED = {"message": "Task completed successfully"}
+
+def _completion_exists(idempotency_key: Optional[str]):
+    return select(TaskCompletion.id).where(TaskCompletion.idempotency_key == idempotency_key)
+
+def _mark_completed(task_id: int, completed_at: datetime):
+    """Conditional, so of two concurrent completions of a task only one logs a TaskCompletion"""
+    return (
+        update(Task)
+        .where(Task.id == task_id, Task.completed == False)
+        .values(completed=True, completed_at=completed_at)
+    )
+
 @router.put("/{task_id}/complete")
 def complete_task(
     task_id: int,
     user_id: int,
     actual_hours: float,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Mark a task as complete and log actual hours"""
+    """Mark a task as complete and log actual hours
+    
+    With write-behind completions (settings.completion_queue) the completion
+    is queued and answered 202; the task shows it once the writer has
+    flushed the batch, normally within completion_flush_interval. An
+    Idempotency-Key header makes retries safe in either mode.
+    """
     task = db.query(Task).filter(
         Task.id == task_id,
         Task.user_id == user_id
@@ -119,46 +431,294 @@ def complete_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task.completed = True
-    task.completed_at = datetime.utcnow()
+    # A retry of the completion that did it is answered as before; anything else would count twice
+    if idempotency_key is not None and db.scalar(_completion_exists(idempotency_key)) is not None:
+        return _COMPLETED
+    if task.completed:
+        raise HTTPException(status_code=409, detail="Task already completed")
+    
+    queue = get_completion_queue()
+    if queue is not None:
+        queued = _queue_completion(queue, task_id, user_id, actual_hours, idempotency_key)
+        if queued is not None:
+            response.status_code = 202
+            return queued
+    
+    if not db.execute(_mark_completed(task_id, datetime.utcnow())).rowcount:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Task already completed")
     
     # Log completion for ML training
     completion = TaskCompletion(
         task_id=task_id,
         actual_hours=actual_hours,
-        user_id=user_id
+        completion_date=task.completed_at,
+        user_id=user_id,
+        idempotency_key=idempotency_key
     )
     
     db.add(completion)
-    db.commit()
     
-    return {"message": "Task completed successfully"}
+    # Daily analytics rollup, updated in the same transaction
+    rollup = record_daily_completion(db, user_id, task.completed_at, actual_hours, _on_time(task))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same Idempotency-Key committed first
+        db.rollback()
+        if idempotency_key is None:
+            raise
+        return _COMPLETED
+    invalidate_user(user_id)
+    
+    # Keep cached history features in step with the new completion
+    cache = get_history_cache()
+    cache.record_completion(user_id, actual_hours)
+    cache.record_productivity(user_id, *rollup)
+    
+    return _COMPLETED
 
 @router.get("/insights/{user_id}")
-def get_task_insights(user_id: int, db: Session = Depends(get_db)):
+def get_task_insights(user_id: int, request: Request, db: Session = Depends(get_db)):
     """Get AI-powered insights about user tasks"""
-    tasks = db.query(Task).filter(Task.user_id == user_id).all()
-    completed_tasks = db.query(Task).filter(
-        Task.user_id == user_id,
-        Task.completed == True
-    ).all()
+    return cached_json(request, "insights", user_id, {}, lambda: task_insights(db, user_id))
+
+def task_insights(db: Session, user_id: int) -> Dict:
+    summary = task_summary(db, user_id)
     
-    total_tasks = len(tasks)
-    completed_count = len(completed_tasks)
+    total_tasks = summary["total"]
+    completed_count = summary["completed"]
     completion_rate = (completed_count / total_tasks * 100) if total_tasks > 0 else 0
     
-    # Get overdue tasks
-    now = datetime.utcnow()
-    overdue = db.query(Task).filter(
-        Task.user_id == user_id,
-        Task.deadline < now,
-        Task.completed == False
-    ).count()
-    
     return {
         "total_tasks": total_tasks,
         "completed_tasks": completed_count,
         "completion_rate": round(completion_rate, 2),
-        "overdue_tasks": overdue,
-        "avg_priority": round(sum(t.priority for t in tasks) / len(tasks), 2) if tasks else 0
-    }
\ No newline at end of file
+        "overdue_tasks": summary["overdue"],
+        "avg_priority": round(summary["avg_priority"], 2)
+    }
+
+_plan_cache = PlanCache(settings.plan_cache_max_entries)
+
+def _plan_items(db: Session, user_id: int, calendar: WorkCalendar) -> Tuple[Dict[int, PlanItem], Dict[int, Tuple]]:
+    """Plan inputs for a user's open tasks, using the stored DeadlinePredictor hours"""
+    rows = db.execute(
+        select(Task.id, Task.title, Task.deadline, Task.priority, Task.predicted_hours)
+        .where(Task.user_id == user_id, Task.completed == False)
+    ).all()
+    
+    hours = {row.id: row.predicted_hours for row in rows}
+    unscored = [task_id for task_id, predicted in hours.items() if predicted is None]
+    if unscored:
+        tasks = db.scalars(select(Task).where(Task.id.in_(unscored))).all()
+        for task, scores in zip(tasks, compute_scores(tasks, user_id, db=db)):
+            hours[task.id] = scores["predicted_hours"]
+    
+    items = {
+        row.id: PlanItem(
+            task_id=row.id,
+            hours=max(0.0, hours[row.id]),
+            due=calendar.position(row.deadline) if row.deadline else float("inf"),
+            weight=row.priority or 1
+        )
+        for row in rows
+    }
+    details = {row.id: (row.title, row.deadline) for row in rows}
+    return items, details
+
+@router.get("/plan/{user_id}")
+def get_plan(
+    user_id: int,
+    hours_per_day: float = Query(settings.plan_hours_per_day, gt=0, le=24),
+    days: int = Query(settings.plan_horizon_days, ge=1, le=90),
+    db: Session = Depends(get_db)
+):
+    """Time-blocked plan of a user's open tasks that minimizes weighted lateness
+    
+    Tasks are laid end to end over working hours (Mon-Fri from
+    plan_workday_start), in deadline order improved by local search. Plans
+    are anchored at the start of the current hour and cached per user;
+    within the hour, a request splices in only the tasks that changed.
+    Only blocks starting within `days` are returned, the summary covers all.
+    """
+    calendar = WorkCalendar(hours_per_day, settings.plan_workday_start)
+    anchor = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    signature = (anchor, hours_per_day, settings.plan_workday_start)
+    items, details = _plan_items(db, user_id, calendar)
+    
+    schedule = _plan_cache.get(user_id, signature)
+    changes = None
+    if schedule is not None:
+        with schedule.lock:
+            changes = replan(schedule, items, max_changes=max(50, len(items) // 10))
+    if changes is None:
+        schedule = Schedule(
+            items.values(),
+            start=calendar.position(anchor),
+            search_budget_per_task=settings.plan_search_budget_per_task,
+            edit_search_budget=settings.plan_edit_search_budget
+        )
+        _plan_cache.set(user_id, signature, schedule)
+    
+    horizon = calendar.position(anchor + timedelta(days=days))
+    blocks = []
+    late_tasks = 0
+    max_lateness = 0.0
+    with schedule.lock:
+        for item, start, finish in schedule.entries():
+            lateness = finish - item.due
+            if lateness > 0:
+                late_tasks += 1
+                max_lateness = max(max_lateness, lateness)
+            if start < horizon:
+                title, deadline = details[item.task_id]
+                blocks.append({
+                    "task_id": item.task_id,
+                    "title": title,
+                    "start": calendar.moment(start),
+                    "end": calendar.moment(finish, end=True),
+                    "deadline": deadline,
+                    "predicted_hours": round(item.hours, 2),
+                    "late_hours": round(max(0.0, lateness), 2)
+                })
+        total_tardiness = schedule.total_tardiness()
+    
+    return {
+        "anchor": anchor,
+        "hours_per_day": hours_per_day,
+        "weekly_capacity_hours": hours_per_day * 5,
+        "tasks": len(items),
+        "planned_hours": round(sum(item.hours for item in items.values()), 2),
+        "late_tasks": late_tasks,
+        "max_lateness_hours": round(max_lateness, 2),
+        "weighted_tardiness": round(total_tardiness, 2),
+        "replanned": "full" if changes is None else f"incremental ({changes} changed)",
+        "blocks": blocks
+    }
+
+@async_router.post("/", response_model=TaskWithAI)
+async def create_task_async(
+    task: TaskCreate,
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create a new task with AI-powered analysis"""
+    db_task = Task(
+        title=task.title,
+        description=task.description,
+        deadline=task.deadline,
+        estimated_hours=task.estimated_hours,
+        user_id=user_id,
+        created_at=datetime.utcnow()
+    )
+    
+    db.add(db_task)
+    await db.flush()
+    
+    history = await get_user_history_stats_async(user_id, db)
+    await run_in_threadpool(apply_scores, [db_task], user_id, None, history)
+    
+    # AI analysis is stored in the same transaction
+    task_with_ai = _task_with_ai(db_task)
+    await db.commit()
+    invalidate_user(user_id)
+    
+    return task_with_ai
+
+@async_router.get("/", response_model=List[TaskWithAI])
+async def get_tasks_async(
+    user_id: int,
+    response: Response,
+    completed: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    explain: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get tasks with AI analysis"""
+    after = _decode_cursor(cursor) if cursor else None
+    paged = limit is not None or after is not None
+    if paged:
+        limit = limit or settings.task_page_size
+    
+    tasks = (await db.scalars(_task_statement(user_id, completed, after, limit))).all()
+    
+    if explain or any(task.scored_at is None for task in tasks):
+        # Model scoring is CPU-bound, keep it off the event loop
+        history = await get_user_history_stats_async(user_id, db)
+        tasks_with_ai = await run_in_threadpool(_tasks_with_ai, tasks, user_id, None, history, explain)
+    else:
+        tasks_with_ai = _tasks_with_ai(tasks, user_id)
+    
+    if paged:
+        if len(tasks) == limit:
+            response.headers["X-Next-Cursor"] = _encode_cursor(tasks[-1])
+        return tasks_with_ai
+    
+    tasks_with_ai.sort(key=lambda x: x.ai_priority, reverse=True)
+    return tasks_with_ai
+
+@async_router.put("/{task_id}/complete")
+async def complete_task_async(
+    task_id: int,
+    user_id: int,
+    actual_hours: float,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Mark a task as complete and log actual hours"""
+    task = (await db.scalars(
+        select(Task).where(Task.id == task_id, Task.user_id == user_id)
+    )).first()
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    if idempotency_key is not None and await db.scalar(_completion_exists(idempotency_key)) is not None:
+        return _COMPLETED
+    if task.completed:
+        raise HTTPException(status_code=409, detail="Task already completed")
+    
+    queue = get_completion_queue()
+    if queue is not None:
+        queued = await run_in_threadpool(_queue_completion, queue, task_id, user_id, actual_hours, idempotency_key)
+        if queued is not None:
+            response.status_code = 202
+            return queued
+    
+    if not (await db.execute(_mark_completed(task_id, datetime.utcnow()))).rowcount:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Task already completed")
+    db.add(TaskCompletion(
+        task_id=task_id,
+        actual_hours=actual_hours,
+        completion_date=task.completed_at,
+        user_id=user_id,
+        idempotency_key=idempotency_key
+    ))
+    rollup = await db.run_sync(
+        record_daily_completion, user_id, task.completed_at, actual_hours, _on_time(task)
+    )
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        if idempotency_key is None:
+            raise
+        return _COMPLETED
+    invalidate_user(user_id)
+    
+    cache = get_history_cache()
+    cache.record_completion(user_id, actual_hours)
+    cache.record_productivity(user_id, *rollup)
+    
+    return _COMPLETED
+
+@async_router.get("/insights/{user_id}")
+async def get_task_insights_async(user_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Get AI-powered insights about user tasks"""
+    return await cached_json_async(
+        request, "insights", user_id, {},
+        lambda: db.run_sync(task_insights, user_id)
+    )
\ No newline at end of file
@@ -1,8 +1,10 @@
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from ..database import get_db
 from ..models import User
+from ..sharding import get_shards
 
 router = APIRouter()
 
@@ -22,6 +24,9 @@ class UserResponse(BaseModel):
 @router.post("/", response_model=UserResponse)
 def create_user(user: UserCreate, db: Session = Depends(get_db)):
     """Create a new user"""
+    if get_shards().sharded:
+        return _create_sharded_user(user)
+    
     # Check if user already exists
     existing_user = db.query(User).filter(User.email == user.email).first()
     if existing_user:
@@ -38,6 +43,22 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     
     return db_user
 
+def _create_sharded_user(user: UserCreate) -> User:
+    """Emails are unique across shards and ids come from the directory, so the user lands on its routed shard"""
+    shards = get_shards()
+    for shard in shards:
+        with shard.session() as db:
+            if db.query(User).filter(User.email == user.email).first():
+                raise HTTPException(status_code=400, detail="User already exists")
+    
+    user_id = shards.allocate_user_id()
+    with shards.session(user_id) as db:
+        db_user = User(id=user_id, email=user.email, name=user.name)
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+    return db_user
+
 @router.get("/{user_id}", response_model=UserResponse)
 def get_user(user_id: int, db: Session = Depends(get_db)):
     """Get user by ID"""
@@ -0,0 +1,30 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class PeriodicJob:
+    """In-process stand-in for Celery beat: runs a job on a daemon thread"""
+
+    def __init__(self, name: str, interval_seconds: float, job: Callable[[], object]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.job = job
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.job()
+            except Exception:
+                logger.exception("Scheduled job %s failed", self.name)
@@ -0,0 +1,248 @@
+import heapq
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_EPOCH = date(2000, 1, 3)  # a Monday; work positions are counted from here
+_NO_DEADLINE = float("inf")
+
+class WorkCalendar:
+    """Maps datetimes to a continuous axis of working hours (Mon-Fri, fixed day)
+
+    Conversions are closed-form (whole weeks plus a remainder), so mapping
+    10k deadlines costs no more than 10k arithmetic expressions.
+    """
+
+    def __init__(self, hours_per_day: float = 8.0, day_start_hour: int = 9):
+        self.hours_per_day = hours_per_day
+        self.day_start = timedelta(hours=day_start_hour)
+
+    def _workdays_before(self, day: date) -> int:
+        weeks, remainder = divmod((day - _EPOCH).days, 7)
+        return weeks * 5 + min(remainder, 5)
+
+    def position(self, moment: datetime) -> float:
+        """Working hours between the epoch and moment"""
+        day = moment.date()
+        hours = self._workdays_before(day) * self.hours_per_day
+        if day.weekday() < 5:
+            into_day = (moment - datetime.combine(day, datetime.min.time()) - self.day_start).total_seconds() / 3600
+            hours += min(max(into_day, 0.0), self.hours_per_day)
+        return hours
+
+    def moment(self, position: float, end: bool = False) -> datetime:
+        """Inverse of position(); with end=True a day boundary maps to the previous evening"""
+        workday, hours = divmod(position, self.hours_per_day)
+        if end and hours == 0 and workday > 0:
+            workday, hours = workday - 1, self.hours_per_day
+        weeks, weekday = divmod(int(workday), 5)
+        day = _EPOCH + timedelta(days=weeks * 7 + weekday)
+        return datetime.combine(day, datetime.min.time()) + self.day_start + timedelta(hours=hours)
+
+class PlanItem(NamedTuple):
+    task_id: int
+    hours: float
+    due: float  # deadline as a work-hour position; inf when there is none
+    weight: int  # task priority; lateness of important tasks costs more
+
+def _key(item: PlanItem) -> Tuple:
+    # Earliest deadline first; ties go to higher priority, then shorter work
+    return (item.due, -item.weight, item.hours, item.task_id)
+
+def _tardiness(item: PlanItem, finish: float) -> float:
+    return item.weight * max(0.0, finish - item.due)
+
+class Schedule:
+    """Single-worker plan minimizing weighted tardiness
+
+    Tasks are dispatched from a heap in earliest-deadline order (optimal for
+    maximum lateness), or, when that is cheaper, with a heap-based
+    Moore-Hodgson pass that defers the least valuable work of an overloaded
+    backlog. A local search swaps adjacent tasks whenever
+    that lowers total weighted tardiness. The search works off a queue of
+    positions to check, so its cost follows the number of swaps rather than
+    whole passes, and is capped by a budget of checks. add/remove/update
+    splice one task in at its deadline position, re-time the plan from there
+    and re-run the search around the edit only.
+    """
+
+    def __init__(
+        self,
+        items: Iterable[PlanItem],
+        start: float = 0.0,
+        search_budget_per_task: int = 5,
+        edit_search_budget: int = 2000
+    ):
+        self.start = start
+        self.edit_search_budget = edit_search_budget
+        self.lock = threading.Lock()  # held by callers while replanning a shared schedule
+        self.items: Dict[int, PlanItem] = {item.task_id: item for item in items}
+
+        edf = self._dispatch()
+        self.order = min(edf, self._defer_late(edf), key=self._weighted_tardiness)
+        self.keys: List[Tuple] = [_key(self.items[task_id]) for task_id in self.order]
+        self.finish: List[float] = [0.0] * len(self.order)
+        self._retime(0)
+        self._improve(range(len(self.order)), search_budget_per_task * len(self.order))
+
+    def _dispatch(self) -> List[int]:
+        """Earliest-deadline-first order, popped from a heap"""
+        heap = [(_key(item), item.task_id) for item in self.items.values()]
+        heapq.heapify(heap)
+        return [heapq.heappop(heap)[1] for _ in range(len(heap))]
+
+    def _defer_late(self, edf: List[int]) -> List[int]:
+        """Moore-Hodgson with weights: for overloaded backlogs
+
+        Walks the EDF order keeping the kept tasks in a heap by weight per
+        hour; whenever a deadline is missed, the least valuable hour is
+        deferred. Kept tasks all finish on time, deferred ones follow in
+        weighted-shortest-processing-time order, undated tasks last.
+        """
+        kept: List[Tuple[float, int]] = []
+        deferred = set()
+        clock = self.start
+        for task_id in edf:
+            item = self.items[task_id]
+            if item.due == _NO_DEADLINE:
+                break
+            heapq.heappush(kept, (item.weight / max(item.hours, 1e-6), task_id))
+            clock += item.hours
+            while clock > item.due and kept:
+                _, dropped = heapq.heappop(kept)
+                deferred.add(dropped)
+                clock -= self.items[dropped].hours
+
+        on_time = [task_id for task_id in edf if task_id not in deferred and self.items[task_id].due != _NO_DEADLINE]
+        late = sorted(deferred, key=lambda t: -self.items[t].weight / max(self.items[t].hours, 1e-6))
+        undated = [task_id for task_id in edf if self.items[task_id].due == _NO_DEADLINE]
+        return on_time + late + undated
+
+    def _weighted_tardiness(self, order: List[int]) -> float:
+        clock, total = self.start, 0.0
+        for task_id in order:
+            item = self.items[task_id]
+            clock += item.hours
+            total += _tardiness(item, clock)
+        return total
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _retime(self, index: int):
+        """Recompute finish times from position index onwards"""
+        clock = self.finish[index - 1] if index > 0 else self.start
+        items, order, finish = self.items, self.order, self.finish
+        for i in range(index, len(order)):
+            clock += items[order[i]].hours
+            finish[i] = clock
+
+    def _improve(self, positions: Iterable[int], budget: int):
+        """Adjacent-interchange local search from the given positions, within a budget of checks"""
+        items, order, keys, finish = self.items, self.order, self.keys, self.finish
+        last = len(order) - 1
+        pending = deque(i for i in positions if 0 <= i < last)
+        queued = set(pending)
+
+        while pending and budget > 0:
+            i = pending.popleft()
+            queued.discard(i)
+            budget -= 1
+            a, b = items[order[i]], items[order[i + 1]]
+            if a.due == _NO_DEADLINE and b.due == _NO_DEADLINE:
+                continue  # neither can be late, so their order does not matter
+            begin = finish[i] - a.hours
+            current = _tardiness(a, finish[i]) + _tardiness(b, finish[i + 1])
+            swapped = _tardiness(b, begin + b.hours) + _tardiness(a, finish[i + 1])
+            if swapped < current - 1e-9:
+                order[i], order[i + 1] = order[i + 1], order[i]
+                keys[i], keys[i + 1] = keys[i + 1], keys[i]
+                finish[i] = begin + b.hours
+                # Only the neighbouring pairs can have changed
+                for j in (i - 1, i + 1):
+                    if 0 <= j < last and j not in queued:
+                        pending.append(j)
+                        queued.add(j)
+
+    def _position(self, task_id: int) -> int:
+        # keys are near-sorted, so bisect lands next to the task; scan outwards from there
+        key = _key(self.items[task_id])
+        guess = min(bisect_left(self.keys, key), len(self.order) - 1)
+        for distance in range(len(self.order)):
+            for i in (guess - distance, guess + distance):
+                if 0 <= i < len(self.order) and self.order[i] == task_id:
+                    return i
+        raise KeyError(task_id)
+
+    def add(self, item: PlanItem):
+        if item.task_id in self.items:
+            self.remove(item.task_id)
+        self.items[item.task_id] = item
+        key = _key(item)
+        index = bisect_left(self.keys, key)
+        self.order.insert(index, item.task_id)
+        self.keys.insert(index, key)
+        self.finish.insert(index, 0.0)
+        self._retime(index)
+        self._improve(range(index - 1, index + 1), self.edit_search_budget)
+
+    def remove(self, task_id: int):
+        index = self._position(task_id)
+        del self.order[index], self.keys[index], self.finish[index]
+        del self.items[task_id]
+        if self.order:
+            self._retime(min(index, len(self.order) - 1))
+            self._improve(range(index - 1, index + 1), self.edit_search_budget)
+
+    def update(self, item: PlanItem):
+        self.add(item)
+
+    def total_tardiness(self) -> float:
+        return sum(_tardiness(self.items[t], f) for t, f in zip(self.order, self.finish))
+
+    def entries(self) -> Iterable[Tuple[PlanItem, float, float]]:
+        """(item, start, finish) in plan order"""
+        for task_id, finish in zip(self.order, self.finish):
+            item = self.items[task_id]
+            yield item, finish - item.hours, finish
+
+class PlanCache:
+    """Per-user schedules kept for incremental replanning (process-local LRU)"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[Tuple, Schedule]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, signature: Tuple) -> Optional[Schedule]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id: int, signature: Tuple, schedule: Schedule):
+        with self._lock:
+            self._entries[user_id] = (signature, schedule)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+def replan(schedule: Schedule, items: Dict[int, PlanItem], max_changes: int) -> Optional[int]:
+    """Bring a cached schedule in line with the current items
+
+    Returns the number of tasks spliced in or out, or None when more than
+    max_changes differ and a full rebuild is cheaper.
+    """
+    removed = [task_id for task_id in schedule.items if task_id not in items]
+    changed = [item for task_id, item in items.items() if schedule.items.get(task_id) != item]
+    if len(removed) + len(changed) > max_changes:
+        return None
+    for task_id in removed:
+        schedule.remove(task_id)
+    for item in changed:
+        schedule.update(item)
+    return len(removed) + len(changed)
@@ -0,0 +1,495 @@
+"""Per-user sharding: which database holds a user's data, and moving users between them
+
+With settings.shard_urls unset there is one shard, the database_url
+database, and everything below reduces to SessionLocal. With shards, a
+pluggable ShardRouter maps each user id to a shard; users moved by
+`python -m app.sharding move` are recorded in the directory database,
+which overrides the router. Each shard has its own model registry.
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import Boolean, Column, Integer, MetaData, String, Table, delete, func, insert, select, update
+from sqlalchemy.orm import Session, sessionmaker
+from . import database
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+shard_metadata = MetaData()
+
+# Directory database: users living somewhere other than where the router would put them
+user_placements = Table(
+    "user_placements",
+    shard_metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("shard", String, nullable=False),
+    Column("moving", Boolean, nullable=False, default=False),
+)
+
+# Every database: the next primary key per table ("users" on the directory)
+id_counters = Table(
+    "id_counters",
+    shard_metadata,
+    Column("name", String, primary_key=True),
+    Column("next_id", Integer, nullable=False),
+)
+
+# Tables whose primary keys come from next_row_id when sharded
+SHARDED_ID_TABLES = ("tasks", "task_completions", "productivity_logs")
+
+class UserMovingError(RuntimeError):
+    """The user's rows are being copied to another shard; answered with 503 and Retry-After"""
+
+    def __init__(self, user_id: int):
+        super().__init__(f"User {user_id} is being moved to another shard")
+        self.user_id = user_id
+
+def next_row_id(context) -> int:
+    """Primary key default for sharded tables, drawn in the inserting transaction
+
+    Ids on shard n are n + shard_id_stride * k, so they are unique across
+    shards and a moved user's rows keep theirs. The first row of an INSERT
+    reserves ids for all of its rows with one counter UPDATE, so a flush or
+    bulk insert touches the hot counter row once, not once per row.
+    """
+    ids = getattr(context, "_sharded_row_ids", None)
+    if ids is None:
+        stride = settings.shard_id_stride
+        block = max(1, len(context.compiled_parameters)) * stride
+        end = context.connection.execute(
+            update(id_counters)
+            .where(id_counters.c.name == context.current_column.table.name)
+            .values(next_id=id_counters.c.next_id + block)
+            .returning(id_counters.c.next_id)
+        ).scalar_one()
+        ids = context._sharded_row_ids = iter(range(end - block, end, stride))
+    return next(ids)
+
+class ShardRouter:
+    """Maps a user id to the name of the shard holding that user's data
+
+    Subclass it to route by team or tenant and set settings.shard_router to
+    "module:Class"; it is constructed with the shard names in config order.
+    """
+
+    def __init__(self, shards: Sequence[str]):
+        self.shards = list(shards)
+
+    def shard_for(self, user_id: int) -> str:
+        raise NotImplementedError
+
+class HashShardRouter(ShardRouter):
+    """Rendezvous hashing: adding a shard only claims the users that now hash to it"""
+
+    def shard_for(self, user_id: int) -> str:
+        return max(
+            self.shards,
+            key=lambda shard: hashlib.blake2b(f"{shard}:{user_id}".encode(), digest_size=8).digest()
+        )
+
+def load_router(shards: Sequence[str], spec: Optional[str] = None) -> ShardRouter:
+    spec = spec or settings.shard_router
+    if spec == "hash":
+        return HashShardRouter(shards)
+    module, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module), attribute)(shards)
+
+class Shard:
+    """One database: its engine and session factories"""
+
+    def __init__(self, name: str, number: int, url: str, engine=None, session_factory=None):
+        self.name = name
+        self.number = number
+        self.url = url
+        self.engine = engine or database.create_db_engine(url)
+        self.session = session_factory or sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self._async_session = None
+        self._lock = threading.Lock()
+
+    def async_session(self):
+        """AsyncSession on this database, creating its asyncio engine on first use"""
+        if self._async_session is None:
+            with self._lock:
+                if self._async_session is None:
+                    self._async_session = database.create_async_db_engine(database._async_url(self.url))[1]
+        return self._async_session()
+
+class ShardSet:
+    """The databases user data is split across, and where each user lives
+
+    Placements are cached per process for shard_directory_ttl seconds; a
+    move waits that long before copying, so no process still routes the
+    user to the old shard.
+    """
+
+    def __init__(
+        self,
+        urls: Optional[Dict[str, str]] = None,
+        directory_url: Optional[str] = None,
+        router: Optional[ShardRouter] = None
+    ):
+        urls = settings.shard_urls if urls is None else urls
+        if urls:
+            # Shard numbers fix the id residues, so shards are only ever appended to shard_urls
+            self.shards = {name: Shard(name, number, url) for number, (name, url) in enumerate(urls.items())}
+            first = next(iter(self.shards.values()))
+            directory_url = directory_url or settings.shard_directory_url
+            self.directory = Shard("directory", -1, directory_url) if directory_url else first
+        else:
+            self.shards = {"default": Shard("default", 0, settings.database_url, database.engine, database.SessionLocal)}
+            self.directory = None
+        self.router = router or load_router(list(self.shards))
+        self._placements: "OrderedDict[int, Tuple[str, bool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def sharded(self) -> bool:
+        return self.directory is not None
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.shards)
+
+    def __iter__(self) -> Iterator[Shard]:
+        return iter(self.shards.values())
+
+    def __getitem__(self, name: str) -> Shard:
+        return self.shards[name]
+
+    def placement(self, user_id: int, cached: bool = True) -> Tuple[str, bool]:
+        """(shard name, moving) for a user: the directory row if there is one, else the router's choice"""
+        if not self.sharded:
+            return "default", False
+        now = time.monotonic()
+        if cached:
+            with self._lock:
+                entry = self._placements.get(user_id)
+                if entry is not None and entry[2] > now:
+                    self._placements.move_to_end(user_id)
+                    return entry[0], entry[1]
+
+        with self.directory.engine.connect() as conn:
+            row = conn.execute(
+                select(user_placements.c.shard, user_placements.c.moving)
+                .where(user_placements.c.user_id == user_id)
+            ).first()
+        shard, moving = (row.shard, bool(row.moving)) if row else (self.router.shard_for(user_id), False)
+
+        with self._lock:
+            self._placements[user_id] = (shard, moving, now + settings.shard_directory_ttl)
+            self._placements.move_to_end(user_id)
+            while len(self._placements) > settings.shard_directory_cache_size:
+                self._placements.popitem(last=False)
+        return shard, moving
+
+    def for_user(self, user_id: Optional[int]) -> Shard:
+        """Shard holding a user's data; the first shard when there is no user"""
+        if user_id is None or not self.sharded:
+            return next(iter(self.shards.values()))
+        shard, moving = self.placement(user_id)
+        if moving:
+            raise UserMovingError(user_id)
+        return self.shards[shard]
+
+    def name_for(self, user_id: int) -> Optional[str]:
+        """Shard name for per-shard state such as model registries; None when unsharded"""
+        return self.for_user(user_id).name if self.sharded else None
+
+    def session(self, user_id: Optional[int] = None) -> Session:
+        return self.for_user(user_id).session()
+
+    def async_session(self, user_id: Optional[int] = None):
+        if not self.sharded:
+            return database.get_async_sessionmaker()()
+        return self.for_user(user_id).async_session()
+
+    def allocate_user_id(self) -> int:
+        """Next user id, from the directory so it is unique across shards"""
+        with self.directory.engine.begin() as conn:
+            return conn.execute(
+                update(id_counters)
+                .where(id_counters.c.name == "users")
+                .values(next_id=id_counters.c.next_id + 1)
+                .returning(id_counters.c.next_id)
+            ).scalar_one() - 1
+
+    def place(self, user_id: int, shard: Optional[str], moving: bool = False):
+        """Record where a user lives; shard=None drops the row, leaving the user to the router"""
+        with self.directory.engine.begin() as conn:
+            conn.execute(delete(user_placements).where(user_placements.c.user_id == user_id))
+            if shard is not None:
+                conn.execute(insert(user_placements).values(user_id=user_id, shard=shard, moving=moving))
+        with self._lock:
+            self._placements.pop(user_id, None)
+
+    def upgrade(self):
+        """Bring every shard's schema up to date and seed the id counters"""
+        from .migrations import upgrade
+
+        for shard in self:
+            upgrade(shard.engine)
+        if not self.sharded:
+            return
+
+        stride = settings.shard_id_stride
+        if len(self.shards) > stride:
+            raise ValueError(f"{len(self.shards)} shards need shard_id_stride >= {len(self.shards)}")
+        max_user_id = 0
+        for shard in self:
+            shard_metadata.create_all(shard.engine)
+            with shard.engine.begin() as conn:
+                existing = set(conn.execute(select(id_counters.c.name)).scalars())
+                for name in SHARDED_ID_TABLES:
+                    if name in existing:
+                        continue
+                    table = database.Base.metadata.tables[name]
+                    max_id = conn.execute(select(func.max(table.c.id))).scalar() or 0
+                    # First id above every existing one in this shard's residue class
+                    conn.execute(insert(id_counters).values(
+                        name=name, next_id=(max_id // stride + 1) * stride + shard.number
+                    ))
+                users = database.Base.metadata.tables["users"]
+                max_user_id = max(max_user_id, conn.execute(select(func.max(users.c.id))).scalar() or 0)
+
+        shard_metadata.create_all(self.directory.engine)
+        with self.directory.engine.begin() as conn:
+            if conn.execute(select(id_counters.c.name).where(id_counters.c.name == "users")).first() is None:
+                conn.execute(insert(id_counters).values(name="users", next_id=max_user_id + 1))
+
+_shards = None
+_shards_lock = threading.Lock()
+
+def get_shards() -> ShardSet:
+    """Return the process-wide shard set (engines connect on first use)"""
+    global _shards
+    if _shards is None:
+        with _shards_lock:
+            if _shards is None:
+                _shards = ShardSet()
+    return _shards
+
+def session_for_user(user_id: Optional[int]) -> Session:
+    """Replaces SessionLocal() where a user is known: a session on that user's shard"""
+    return get_shards().session(user_id)
+
+def request_user_id(request) -> Optional[int]:
+    """user_id from the path or query string, which every per-user endpoint takes"""
+    value = request.path_params.get("user_id") or request.query_params.get("user_id")
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def run_on_each_shard(job: Callable[..., Dict]) -> Dict:
+    """Run a maintenance job (run_training, rescore_stale_tasks, ...) with each shard's session and models"""
+    shards = get_shards()
+    if not shards.sharded:
+        return job()
+    from .ml_models.registry import get_model_registry
+
+    reports = {}
+    for shard in shards:
+        db = shard.session()
+        try:
+            reports[shard.name] = job(db=db, registry=get_model_registry(shard.name))
+        except Exception:
+            logger.exception("%s failed on shard %s", getattr(job, "__name__", job), shard.name)
+            reports[shard.name] = {"status": "failed"}
+        finally:
+            db.close()
+    return reports
+
+def _user_tables():
+    from . import models  # noqa: F401 - registers the tables on Base.metadata
+
+    # Parents first: users, then tasks, then the rows that reference tasks
+    return [
+        table for table in database.Base.metadata.sorted_tables
+        if table.name == "users" or "user_id" in table.c
+    ]
+
+def _user_rows(table, user_id: int):
+    return (table.c.id if table.name == "users" else table.c.user_id) == user_id
+
+def _row_digest(row) -> int:
+    return hash(tuple(row))
+
+def _copy_user(
+    source: Shard, target: Shard, user_id: int, chunk_size: int, digests: Dict[str, Dict[int, int]]
+) -> Dict[str, int]:
+    """Copy a user's rows, ids included, to another shard in one transaction
+
+    The user's rows on the target, leftovers of an earlier attempt, are
+    deleted first. digests is filled with a digest of every row copied, per
+    table and id, for _copy_late_writes to compare against.
+    """
+    copied = {}
+    tables = _user_tables()
+    with source.engine.connect() as reader, target.engine.begin() as writer:
+        for table in reversed(tables):
+            writer.execute(delete(table).where(_user_rows(table, user_id)))
+        for table in tables:
+            copied[table.name] = 0
+            table_digests = digests[table.name] = {}
+            result = reader.execution_options(yield_per=chunk_size).execute(
+                select(table).where(_user_rows(table, user_id)).order_by(table.c.id)
+            )
+            for partition in result.partitions(chunk_size):
+                writer.execute(insert(table), [dict(row._mapping) for row in partition])
+                table_digests.update((row.id, _row_digest(row)) for row in partition)
+                copied[table.name] += len(partition)
+    return copied
+
+def _copy_late_writes(
+    source: Shard, target: Shard, user_id: int, chunk_size: int, digests: Dict[str, Dict[int, int]]
+) -> Dict[str, int]:
+    """Apply to the target the writes requests that outlasted the grace period made on the source
+
+    Rows the source inserted, changed or deleted since the copy are
+    applied, unless the target changed the same row after the placement
+    flipped: that later write is kept and the conflict logged. Daily
+    rollups are rebuilt from the completions rather than compared, so
+    increments made on both shards add up.
+    """
+    from .rollups import rebuild_daily_rollups
+
+    carried = {}
+    with source.engine.connect() as reader, target.engine.begin() as writer:
+        for table in _user_tables():
+            if table.name == "productivity_logs":
+                continue
+            copied = digests[table.name]
+            changed, seen = {}, set()
+            result = reader.execution_options(yield_per=chunk_size).execute(
+                select(table).where(_user_rows(table, user_id))
+            )
+            for partition in result.partitions(chunk_size):
+                for row in partition:
+                    seen.add(row.id)
+                    if copied.get(row.id) != _row_digest(row):
+                        changed[row.id] = dict(row._mapping)
+            deleted = set(copied) - seen
+
+            current = {
+                row.id: _row_digest(row)
+                for row in writer.execute(select(table).where(table.c.id.in_(list(changed) + list(deleted))))
+            }
+            conflicts = [row_id for row_id in current if current[row_id] != copied.get(row_id)]
+            conflicts += [row_id for row_id in copied.keys() & changed.keys() if row_id not in current]
+            if conflicts:
+                logger.warning(
+                    "Keeping the target's %s rows %s for user %s over late writes on the source",
+                    table.name, sorted(conflicts), user_id
+                )
+            for row_id in conflicts:
+                changed.pop(row_id, None)
+                deleted.discard(row_id)
+
+            for row_id, row in changed.items():
+                if row_id in current:
+                    writer.execute(update(table).where(table.c.id == row_id).values(row))
+                else:
+                    writer.execute(insert(table).values(row))
+            if deleted:
+                writer.execute(delete(table).where(table.c.id.in_(deleted)))
+            carried[table.name] = len(changed) + len(deleted)
+
+    if carried.get("task_completions"):
+        with target.session() as db:
+            carried["productivity_logs"] = rebuild_daily_rollups(db, user_id=user_id)
+    return carried
+
+def _delete_user(shard: Shard, user_id: int):
+    with shard.engine.begin() as conn:
+        for table in reversed(_user_tables()):
+            conn.execute(delete(table).where(_user_rows(table, user_id)))
+
+def move_user(user_id: int, target: str, shards: Optional[ShardSet] = None, chunk_size: int = 5000) -> Dict:
+    """Move a user's rows to another shard while the service keeps running
+
+    The user is marked moving, and the move waits out every process's
+    placement cache plus shard_move_grace for in-flight requests. Requests
+    for the user then get 503 with Retry-After until the rows are copied
+    (ids unchanged) and the placement flips; other users are unaffected.
+    """
+    shards = shards or get_shards()
+    if not shards.sharded:
+        raise ValueError("Sharding is not configured (settings.shard_urls)")
+    if target not in shards.shards:
+        raise ValueError(f"Unknown shard {target!r}; shards are {shards.names}")
+    source, moving = shards.placement(user_id, cached=False)
+    if moving:
+        raise UserMovingError(user_id)
+    report = {"user_id": user_id, "source": source, "target": target, "status": "skipped"}
+    if source == target:
+        return report
+
+    shards.place(user_id, source, moving=True)
+    started = time.perf_counter()
+    try:
+        time.sleep(settings.shard_directory_ttl + settings.shard_move_grace)
+        frozen = time.perf_counter()
+        digests: Dict[str, Dict[int, int]] = {}
+        report["rows"] = _copy_user(shards[source], shards[target], user_id, chunk_size, digests)
+        # Users on the router's own choice need no directory row
+        shards.place(user_id, None if shards.router.shard_for(user_id) == target else target)
+    except Exception:
+        logger.exception("Moving user %s to %s failed; leaving them on %s", user_id, target, source)
+        try:
+            _delete_user(shards[target], user_id)
+        finally:
+            shards.place(user_id, None if shards.router.shard_for(user_id) == source else source)
+        raise
+    report["unavailable_seconds"] = round(time.perf_counter() - started, 3)
+    report["copy_seconds"] = round(time.perf_counter() - frozen, 3)
+
+    # Writes by requests that outlasted the grace period are carried over before the source is cleared
+    report["late_rows"] = _copy_late_writes(shards[source], shards[target], user_id, chunk_size, digests)
+    _delete_user(shards[source], user_id)
+    report["status"] = "moved"
+    logger.info("Moved user: %s", json.dumps(report))
+    return report
+
+def shard_sizes(shards: Optional[ShardSet] = None, top: int = 10) -> Dict:
+    """Tasks per shard and each shard's largest users, for deciding what to move"""
+    from .models import Task
+
+    shards = shards or get_shards()
+    sizes = {}
+    for shard in shards:
+        with shard.session() as db:
+            largest = db.execute(
+                select(Task.user_id, func.count(Task.id).label("tasks"))
+                .group_by(Task.user_id)
+                .order_by(func.count(Task.id).desc())
+                .limit(top)
+            ).all()
+            sizes[shard.name] = {
+                "tasks": db.scalar(select(func.count(Task.id))),
+                "largest_users": {user_id: count for user_id, count in largest},
+            }
+    return sizes
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect shards and move users between them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sizes_parser = commands.add_parser("sizes", help="tasks per shard and the largest users")
+    sizes_parser.add_argument("--top", type=int, default=10)
+    move_parser = commands.add_parser("move", help="move a user to another shard, online")
+    move_parser.add_argument("user_id", type=int)
+    move_parser.add_argument("shard")
+    args = parser.parse_args()
+
+    if args.command == "sizes":
+        print(json.dumps(shard_sizes(top=args.top), indent=2))
+    else:
+        print(json.dumps(move_user(args.user_id, args.shard), indent=2))
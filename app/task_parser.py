@@ -0,0 +1,468 @@
+import calendar
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "a couple of": 2, "a few": 3, "half an": 0.5, "half a": 0.5,
+}
+_WORD_NUMBER = r"an?|one|two|three|four|five|six|seven|eight|nine|ten|a\s+couple\s+of|a\s+few"
+_NUMBER = rf"\d+(?:\.\d+)?|{_WORD_NUMBER}"
+_MONTH = (
+    r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+)
+_WEEKDAY = (
+    r"mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?"
+    r"|fri(?:day)?|sat(?:urday)?|sun(?:day)?"
+)
+_LEAD = r"(?:(?P<lead>due(?:\s+(?:on|by))?|by|before|on|until|till|no\s+later\s+than)\s+)?"
+
+_DAY = re.compile(
+    rf"\b{_LEAD}(?:"
+    r"(?P<rel_day>today|tonight|tomorrow|tmrw)"
+    rf"|(?:(?P<mod>this|next|coming|the)\s+)?(?:(?P<weekday>{_WEEKDAY})|(?P<weekend>weekend))"
+    r"|(?:the\s+)?end\s+of\s+(?:the\s+)?(?P<end_of>day|week|month)|(?P<end_abbr>eod|eow|eom)"
+    r"|next\s+(?P<next_period>week|month)"
+    rf"|in\s+(?P<in_n>{_NUMBER})\s+(?P<in_unit>hours?|days?|weeks?|months?)"
+    r"|(?P<iso>\d{4}-\d{1,2}-\d{1,2})"
+    rf"|(?P<m_name>{_MONTH})\.?\s+(?P<m_day>\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(?P<m_year>\d{{4}}))?"
+    rf"|(?:the\s+)?(?P<d_day>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<d_name>{_MONTH})(?:,?\s+(?P<d_year>\d{{4}}))?"
+    r"|(?P<slash>\d{1,2}/\d{1,2}(?:/\d{2,4})?)"
+    r")\b",
+    re.IGNORECASE
+)
+_TIME = re.compile(
+    r"\b(?:(?:at|by|before|until)\s+|@\s*)?(?:"
+    r"(?P<h12>\d{1,2})(?::(?P<m12>[0-5]\d))?\s*(?P<ampm>[ap])\.?m\b\.?"
+    r"|(?P<h24>[01]?\d|2[0-3]):(?P<m24>[0-5]\d)\b"
+    r"|(?P<named>noon|midday|midnight|(?:in\s+the\s+)?(?:morning|afternoon|evening)\b)"
+    r")",
+    re.IGNORECASE
+)
+_DURATION = re.compile(
+    r"(?:\b(?:takes?|taking|needs?|for|about|around|approx(?:imately)?\.?|est(?:imated)?\.?:?)\s+|~\s*)*"
+    rf"\b(?P<n>half\s+an?|{_NUMBER})"
+    r"(?:\s*(?:-|to)\s*(?P<n2>\d+(?:\.\d+)?))?"
+    r"\s*(?P<unit>h|hrs?|hours?|m|mins?|minutes?|d|days?)\b",
+    re.IGNORECASE
+)
+_GAP = re.compile(r"^[\s,]*$")
+_DANGLING = re.compile(
+    r"^(?:[\s,;:\-–—(]|\b(?:by|at|on|due|for|until|till|before|and|to)\b)+"
+    r"|(?:[\s,;:\-–—(]|\b(?:by|at|on|due|for|until|till|before|and|to|which|that|it)\b)+$",
+    re.IGNORECASE
+)
+_NAMED_HOURS = {"noon": 12, "midday": 12, "morning": 9, "afternoon": 15, "evening": 18}
+
+def _number(text: str) -> float:
+    text = re.sub(r"\s+", " ", text.lower())
+    return float(_NUMBERS[text]) if text in _NUMBERS else float(text)
+
+def _month(name: str) -> int:
+    return [m.lower() for m in calendar.month_abbr].index(name[:3].lower())
+
+def _weekday(name: str) -> int:
+    return [d.lower() for d in calendar.day_abbr].index(name[:3].lower())
+
+def _end_of_workday() -> time:
+    # A deadline without a time of day falls at the end of the planning workday
+    end = settings.plan_workday_start + settings.plan_hours_per_day
+    return time(min(int(end), 23), int((end % 1) * 60))
+
+class DeadlineExpr(NamedTuple):
+    """A deadline as written, resolved against the current time on each use
+
+    Parses are cached by text, so "tomorrow" must not be frozen into a date.
+    """
+    kind: str  # today, tomorrow, weekday, end_of_week, end_of_month, offset, date or time
+    weekday: Optional[int] = None
+    weeks_ahead: int = 0  # "next friday" is the Friday of next (Monday-based) week
+    months_ahead: int = 0
+    offset: Optional[timedelta] = None  # "in 3 hours", "in 1.5 days" are exact; whole days fall at the deadline time
+    day: Optional[Tuple[Optional[int], int, int]] = None  # (year or None, month, day)
+    at: Optional[time] = None
+    tonight: bool = False
+
+    @property
+    def exact(self) -> bool:
+        """An offset of less than a day or of a fraction of days, which resolves to now plus it"""
+        return self.kind == "offset" and (self.offset < timedelta(days=1) or bool(self.offset % timedelta(days=1)))
+
+    def resolve(self, now: datetime) -> datetime:
+        at = self.at or (time(20, 0) if self.tonight else _end_of_workday())
+        today = now.date()
+
+        if self.exact:
+            return now + self.offset
+        if self.kind == "offset":
+            day = today + self.offset
+        elif self.kind == "tomorrow":
+            day = today + timedelta(days=1)
+        elif self.kind == "weekday" and self.weeks_ahead:
+            day = today + timedelta(days=self.weekday - today.weekday(), weeks=self.weeks_ahead)
+        elif self.kind == "weekday":
+            day = today + timedelta(days=(self.weekday - today.weekday()) % 7)
+            if datetime.combine(day, at) <= now:
+                day += timedelta(days=7)
+        elif self.kind == "end_of_week" and self.weeks_ahead:
+            # Friday of the (Monday-based) week weeks_ahead after this one, as for "next friday"
+            day = today + timedelta(days=4 - today.weekday(), weeks=self.weeks_ahead)
+        elif self.kind == "end_of_week":
+            day = today + timedelta(days=(4 - today.weekday()) % 7)
+            if datetime.combine(day, at) <= now:
+                day += timedelta(days=7)
+        elif self.kind == "end_of_month":
+            year, month = divmod(today.month - 1 + self.months_ahead, 12)
+            year, month = today.year + year, month + 1
+            day = date(year, month, calendar.monthrange(year, month)[1])
+        elif self.kind == "date":
+            year, month, day_of_month = self.day
+            day = date(year or today.year, month, min(day_of_month, calendar.monthrange(year or today.year, month)[1]))
+            if year is None and day < today:
+                day = day.replace(year=today.year + 1)
+        else:  # "today" and a bare time: today, or tomorrow once that time has passed
+            day = today
+            if self.kind == "time" and datetime.combine(day, at) <= now:
+                day += timedelta(days=1)
+        return datetime.combine(day, at)
+
+def _day_expr(match: re.Match) -> Optional[DeadlineExpr]:
+    g = match.groupdict()
+    if g["rel_day"]:
+        word = g["rel_day"].lower()
+        if word in ("tomorrow", "tmrw"):
+            return DeadlineExpr("tomorrow")
+        return DeadlineExpr("today", tonight=word == "tonight")
+    if g["weekday"] or g["weekend"]:
+        weekday = _weekday(g["weekday"]) if g["weekday"] else 6  # a weekend lasts until Sunday
+        return DeadlineExpr("weekday", weekday=weekday, weeks_ahead=int((g["mod"] or "").lower() == "next"))
+    end_of = (g["end_of"] or "").lower() or {"eod": "day", "eow": "week", "eom": "month"}.get((g["end_abbr"] or "").lower())
+    if end_of:
+        return DeadlineExpr({"day": "today", "week": "end_of_week", "month": "end_of_month"}[end_of])
+    if g["next_period"]:
+        if g["next_period"].lower() == "week":
+            return DeadlineExpr("end_of_week", weeks_ahead=1)
+        return DeadlineExpr("end_of_month", months_ahead=1)
+    if g["in_n"]:
+        n, unit = _number(g["in_n"]), g["in_unit"].lower().rstrip("s")
+        if unit == "month":
+            return DeadlineExpr("end_of_month", months_ahead=int(n)) if n >= 1 else None
+        return DeadlineExpr("offset", offset=timedelta(**{unit + "s": n}))
+    try:
+        if g["iso"]:
+            year, month, day = (int(part) for part in g["iso"].split("-"))
+            date(year, month, day)
+            return DeadlineExpr("date", day=(year, month, day))
+        if g["m_name"] or g["d_name"]:
+            month = _month(g["m_name"] or g["d_name"])
+            day = int(g["m_day"] or g["d_day"])
+            year = g["m_year"] or g["d_year"]
+            date(int(year) if year else 2000, month, day)  # validates; 2000 is a leap year
+            return DeadlineExpr("date", day=(int(year) if year else None, month, day))
+        if g["slash"]:
+            parts = [int(part) for part in g["slash"].split("/")]
+            year = (parts[2] + 2000 if parts[2] < 100 else parts[2]) if len(parts) == 3 else None
+            date(year or 2000, parts[0], parts[1])  # month/day, as in US English
+            return DeadlineExpr("date", day=(year, parts[0], parts[1]))
+    except ValueError:
+        return None
+    return None
+
+def _time_of_day(match: re.Match) -> Optional[time]:
+    g = match.groupdict()
+    if g["h12"]:
+        hour, minute = int(g["h12"]), int(g["m12"] or 0)
+        if not 1 <= hour <= 12:
+            return None
+        return time(hour % 12 + (12 if g["ampm"].lower() == "p" else 0), minute)
+    if g["h24"]:
+        return time(int(g["h24"]), int(g["m24"]))
+    named = re.sub(r"^in\s+the\s+", "", g["named"].lower())
+    return time(23, 59) if named == "midnight" else time(_NAMED_HOURS[named], 0)
+
+def parse_deadline(text: str) -> Tuple[Optional[DeadlineExpr], List[Tuple[int, int]]]:
+    """Find the deadline in text: a day phrase, a time of day next to it, or a time alone
+
+    When several day phrases match, one introduced by "by", "due", "on"...
+    wins over a bare one. A three-letter weekday ("sat", "sun") is read
+    only after one of those or "this", "next", "coming"; otherwise it is
+    left in the title ("Plan the sat trip"). Returns the expression and
+    the character spans it was read from.
+    """
+    candidates = []
+    for match in _DAY.finditer(text):
+        expr = _day_expr(match)
+        weekday, mod = match.group("weekday"), (match.group("mod") or "").lower()
+        if weekday and len(weekday) <= 3 and match.group("lead") is None and mod in ("", "the"):
+            continue
+        if expr is not None:
+            candidates.append(((match.group("lead") is None, match.start()), expr, match))
+
+    if candidates:
+        _, expr, day_match = min(candidates, key=lambda candidate: candidate[0])
+        spans = [day_match.span()]
+        if not expr.exact:
+            for time_match in _TIME.finditer(text):
+                start, end = time_match.span()
+                before = end <= day_match.start() and _GAP.match(text[end:day_match.start()])
+                after = start >= day_match.end() and _GAP.match(text[day_match.end():start])
+                at = (before or after) and _time_of_day(time_match)
+                if at:
+                    expr = expr._replace(at=at)
+                    spans.append(time_match.span())
+                    break
+        return expr, spans
+
+    for time_match in _TIME.finditer(text):
+        at = _time_of_day(time_match)
+        if at:
+            return DeadlineExpr("time", at=at), [time_match.span()]
+    return None, []
+
+def parse_duration(text: str) -> Tuple[Optional[float], Optional[Tuple[int, int]]]:
+    """Estimated hours written in text ("2h", "about 30 minutes", "2-3 days"), working days of plan_hours_per_day"""
+    for match in _DURATION.finditer(text):
+        try:
+            amount = _number(match.group("n"))
+        except ValueError:
+            continue
+        if match.group("n2"):
+            amount = (amount + float(match.group("n2"))) / 2
+        unit = match.group("unit").lower()
+        if unit.startswith("m"):
+            hours = amount / 60
+        elif unit.startswith("d"):
+            hours = amount * settings.plan_hours_per_day
+        else:
+            hours = amount
+        if hours > 0:
+            return round(hours, 2), match.span()
+    return None, None
+
+def _strip_spans(text: str, spans: Sequence[Tuple[int, int]]) -> str:
+    pieces, last = [], 0
+    for start, end in sorted(spans):
+        pieces.append(text[last:start])
+        last = max(last, end)
+    pieces.append(text[last:])
+    return " ".join(pieces)
+
+def clean_title(text: str) -> str:
+    title = re.sub(r"\(\s*\)", " ", text)
+    title = re.sub(r"\s+", " ", title).strip()
+    while True:
+        stripped = _DANGLING.sub("", title).strip(" .!?")
+        if stripped == title:
+            break
+        title = stripped
+    return title[:1].upper() + title[1:]
+
+class ParsedText(NamedTuple):
+    """Text-only part of a parse; cached, and resolved against the clock per request"""
+    title: str
+    deadline: Optional[DeadlineExpr]
+    estimated_hours: Optional[float]
+    confidence: float
+    source: str  # "rules" or "model"
+
+def parse_rules(text: str) -> ParsedText:
+    """Rule and date-grammar parse: deadline first, then a duration in what is left"""
+    deadline, spans = parse_deadline(text)
+    remainder = _strip_spans(text, spans)
+    hours, hours_span = parse_duration(remainder)
+    if hours_span is not None:
+        remainder = _strip_spans(remainder, [hours_span])
+    title = clean_title(remainder) or clean_title(text) or text.strip()
+    confidence = 0.5 + 0.3 * (deadline is not None) + 0.15 * (hours is not None)
+    return ParsedText(title, deadline, hours, round(confidence, 2), "rules")
+
+class TransformerTagger:
+    """Local token-classification model tagging TITLE, DATE and DURATION spans (BIO labels)
+
+    Loaded once from a directory with local_files_only, so nothing is ever
+    downloaded, and run on CPU in batches of sentences per forward pass.
+    Requires torch and transformers.
+    """
+
+    def __init__(self, model_dir: str, batch_size: int = 32):
+        import torch
+        from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+        self.torch = torch
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True, use_fast=True)
+        self.model = AutoModelForTokenClassification.from_pretrained(model_dir, local_files_only=True)
+        self.model.to("cpu").eval()
+        self.labels = {int(i): label.upper() for i, label in self.model.config.id2label.items()}
+
+    def tag(self, texts: Sequence[str]) -> List[Dict[str, str]]:
+        """First span of each entity type per text, e.g. {"TITLE": ..., "DATE": ...}"""
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            encoded = self.tokenizer(
+                batch, padding=True, truncation=True, max_length=128,
+                return_offsets_mapping=True, return_tensors="pt"
+            )
+            offsets = encoded.pop("offset_mapping").tolist()
+            with self.torch.inference_mode():
+                predictions = self.model(**encoded).logits.argmax(-1).tolist()
+            for text, token_labels, token_offsets in zip(batch, predictions, offsets):
+                results.append(self._spans(text, token_labels, token_offsets))
+        return results
+
+    def _spans(self, text: str, token_labels: List[int], token_offsets: List[List[int]]) -> Dict[str, str]:
+        spans: Dict[str, List[int]] = {}
+        current = None
+        for label_id, (start, end) in zip(token_labels, token_offsets):
+            if start == end:
+                continue  # special or padding token
+            label = self.labels.get(label_id, "O")
+            prefix, _, entity = label.partition("-")
+            if prefix == "I" and current == entity and entity in spans:
+                spans[entity][1] = end
+            elif prefix in ("B", "I") and entity not in spans:
+                spans[entity] = [start, end]
+                current = entity
+            else:
+                current = None
+        return {entity: text[start:end] for entity, (start, end) in spans.items()}
+
+class ParseCache:
+    """Process-local LRU of parses keyed by a hash of the normalized text"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, ParsedText]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[ParsedText]:
+        with self._lock:
+            parsed = self._entries.get(key)
+            if parsed is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return parsed
+
+    def set(self, key: str, parsed: ParsedText):
+        with self._lock:
+            self._entries[key] = parsed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self._entries)
+        }
+
+def normalize(text: str) -> str:
+    # Case is kept: it carries through to the title
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+def cache_key(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode()).hexdigest()
+
+class TaskParser:
+    """Free text to title, deadline and estimated hours
+
+    Every text goes through the rules; those whose rule parse is below
+    model_threshold confidence are tagged by the transformer, when one is
+    configured, in batches. The model's DATE and DURATION spans are read
+    with the same grammar, so the model only has to find them.
+    """
+
+    def __init__(
+        self,
+        tagger: Optional[TransformerTagger] = None,
+        cache: Optional[ParseCache] = None,
+        model_threshold: float = 0.6
+    ):
+        self.tagger = tagger
+        self.cache = cache or ParseCache()
+        self.model_threshold = model_threshold
+
+    def _merge(self, parsed: ParsedText, spans: Dict[str, str]) -> ParsedText:
+        deadline = parsed.deadline
+        if deadline is None and spans.get("DATE"):
+            deadline = parse_deadline(spans["DATE"])[0]
+        hours = parsed.estimated_hours
+        if hours is None and spans.get("DURATION"):
+            hours = parse_duration(spans["DURATION"])[0]
+        title = clean_title(spans["TITLE"]) if spans.get("TITLE") else parsed.title
+        if (deadline, hours, title) == (parsed.deadline, parsed.estimated_hours, parsed.title):
+            return parsed
+        confidence = 0.5 + 0.3 * (deadline is not None) + 0.15 * (hours is not None)
+        return ParsedText(title or parsed.title, deadline, hours, round(confidence, 2), "model")
+
+    def parse_texts(self, texts: Sequence[str]) -> List[ParsedText]:
+        keys = [cache_key(text) for text in texts]
+        results: List[Optional[ParsedText]] = [self.cache.get(key) for key in keys]
+        misses = [i for i, parsed in enumerate(results) if parsed is None]
+        for i in misses:
+            results[i] = parse_rules(normalize(texts[i]))
+
+        uncertain = [i for i in misses if results[i].confidence < self.model_threshold]
+        if self.tagger is not None and uncertain:
+            tagged = self.tagger.tag([normalize(texts[i]) for i in uncertain])
+            for i, spans in zip(uncertain, tagged):
+                results[i] = self._merge(results[i], spans)
+
+        for i in misses:
+            self.cache.set(keys[i], results[i])
+        return results
+
+    def parse(self, texts: Sequence[str], now: Optional[datetime] = None) -> List[Dict]:
+        """Parsed fields per text, with deadlines resolved against now (UTC)"""
+        now = now or datetime.utcnow()
+        return [
+            {
+                "text": text,
+                "title": parsed.title,
+                "deadline": parsed.deadline.resolve(now) if parsed.deadline else None,
+                "estimated_hours": parsed.estimated_hours,
+                "confidence": parsed.confidence,
+                "source": parsed.source,
+            }
+            for text, parsed in zip(texts, self.parse_texts(texts))
+        ]
+
+_task_parser = None
+_task_parser_lock = threading.Lock()
+
+def get_task_parser() -> TaskParser:
+    """Return the process-wide parser, loading the optional model once"""
+    global _task_parser
+    if _task_parser is None:
+        with _task_parser_lock:
+            if _task_parser is None:
+                tagger = None
+                if settings.task_parser_model_dir:
+                    try:
+                        tagger = TransformerTagger(settings.task_parser_model_dir, settings.task_parser_batch_size)
+                    except Exception:
+                        logger.warning("Task parser model unavailable, parsing with rules only", exc_info=True)
+                _task_parser = TaskParser(
+                    tagger,
+                    ParseCache(settings.task_parser_cache_size),
+                    model_threshold=settings.task_parser_model_threshold
+                )
+    return _task_parser
@@ -0,0 +1,227 @@
+"""End-to-end API load benchmark with JSON output and baseline comparison
+
+    python -m benchmarks.api_load --users 200 --tasks-per-user 5000 --concurrency 1 16 64
+    python -m benchmarks.api_load --output results.json
+    python -m benchmarks.api_load --baseline results.json --tolerance 0.15
+
+Seeds a database (a temporary SQLite file unless --url points at Postgres),
+trains and publishes both models into a temporary model store, then drives
+each scenario through an in-process ASGI client. Reports p50/p95/p99
+latency, RPS, errors and peak RSS per scenario and concurrency level. With
+--baseline, exits non-zero when p95 or RPS regress beyond the tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SCENARIOS = ["create_task", "get_tasks", "complete_task", "insights", "productivity", "predictions"]
+
+def percentile(sorted_values, q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+class RequestFactory:
+    """Builds the i-th request of a scenario; completions consume distinct open tasks"""
+
+    def __init__(self, users: int, open_tasks, seed: int):
+        self.users = users
+        self.open_tasks = open_tasks
+        self.rng = random.Random(seed)
+
+    def __call__(self, scenario: str, i: int):
+        user_id = i % self.users + 1
+        if scenario == "create_task":
+            deadline = datetime.utcnow() + timedelta(days=self.rng.randint(1, 30))
+            return "POST", "/api/tasks/", {
+                "params": {"user_id": user_id},
+                "json": {
+                    "title": f"Benchmark task {i}",
+                    "description": "x" * self.rng.randint(0, 400),
+                    "deadline": deadline.isoformat(),
+                    "estimated_hours": round(self.rng.uniform(0.5, 16), 1),
+                },
+            }
+        if scenario == "get_tasks":
+            return "GET", "/api/tasks/", {"params": {"user_id": user_id, "completed": False, "limit": 50}}
+        if scenario == "complete_task":
+            task_user_id, task_id = self.open_tasks.pop()
+            return "PUT", f"/api/tasks/{task_id}/complete", {
+                "params": {"user_id": task_user_id, "actual_hours": round(self.rng.uniform(0.5, 16), 2)}
+            }
+        if scenario == "insights":
+            return "GET", f"/api/tasks/insights/{user_id}", {}
+        if scenario == "productivity":
+            return "GET", f"/api/analytics/productivity/{user_id}", {"params": {"days": 30}}
+        return "GET", f"/api/analytics/predictions/{user_id}", {}
+
+async def drive(client, make_request, scenario: str, concurrency: int, total: int, offset: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        method, url, kwargs = make_request(scenario, offset + i)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "errors": errors,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def open_task_pool(engine, needed: int, seed: int):
+    from sqlalchemy import select
+    from app.models import Task
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(Task.user_id, Task.id).where(Task.completed == False).limit(needed)
+        ).all()
+    pool = [tuple(row) for row in rows]
+    random.Random(seed).shuffle(pool)
+    return pool
+
+async def run(args) -> dict:
+    import httpx
+    from fastapi import FastAPI
+    from app.database import engine
+    from app.migrations import upgrade
+    from app.ml_models.training import run_training
+    from app.routers import analytics, tasks
+    from .seed import seed_database
+
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("baseline", "output")}}
+
+    upgrade(engine)
+    started = time.perf_counter()
+    report["rows"] = seed_database(
+        engine,
+        users=args.users,
+        tasks_per_user=args.tasks_per_user,
+        completed_ratio=args.completed_ratio,
+        seed=args.seed
+    )
+    report["seed_seconds"] = round(time.perf_counter() - started, 1)
+    report["training"] = run_training() if not args.skip_training else {"status": "skipped"}
+
+    scenarios = args.scenarios
+    # Every completion (including warm-ups) needs its own open task
+    needed = (args.requests + args.warmup) * len(args.concurrency) if "complete_task" in scenarios else 0
+    make_request = RequestFactory(args.users, open_task_pool(engine, needed, args.seed), args.seed)
+
+    app = FastAPI()
+    app.include_router(tasks.router, prefix="/api/tasks")
+    app.include_router(analytics.router, prefix="/api/analytics")
+
+    results = {}
+    offset = 0
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in scenarios:
+            for concurrency in args.concurrency:
+                if scenario == "complete_task" and len(make_request.open_tasks) < args.requests + args.warmup:
+                    results[f"{scenario}@{concurrency}"] = {"skipped": "not enough open tasks"}
+                    continue
+                if args.warmup:
+                    await drive(client, make_request, scenario, concurrency, args.warmup, offset)
+                    offset += args.warmup
+                results[f"{scenario}@{concurrency}"] = await drive(
+                    client, make_request, scenario, concurrency, args.requests, offset
+                )
+                offset += args.requests
+
+    report["results"] = results
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def compare(report: dict, baseline: dict, tolerance: float) -> dict:
+    """Per-scenario p95 and RPS ratios against a baseline report, flagging regressions"""
+    comparison = {}
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "rps" not in base or "rps" not in result:
+            continue
+        p95_ratio = result["p95_ms"] / max(base["p95_ms"], 1e-6)
+        rps_ratio = result["rps"] / max(base["rps"], 1e-6)
+        comparison[name] = {
+            "p95_ratio": round(p95_ratio, 3),
+            "rps_ratio": round(rps_ratio, 3),
+            "regressed": p95_ratio > 1 + tolerance or rps_ratio < 1 - tolerance,
+        }
+    return comparison
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks-per-user", type=int, default=200)
+    parser.add_argument("--completed-ratio", type=float, default=0.6)
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario and concurrency")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-training", action="store_true", help="serve the rule-based fallbacks")
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    # Settings are read at import, so point the app at the benchmark database and model store first
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = args.url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MODEL_DIR"] = os.path.join(workdir, "model_store")
+    os.environ["SCHEDULER"] = "off"
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_BACKEND"] = "off"
+
+    report = asyncio.run(run(args))
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+        regressed = any(c["regressed"] for c in report["comparison"].values())
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    if regressed:
+        sys.exit("performance regressed against the baseline")
+
+if __name__ == "__main__":
+    main()
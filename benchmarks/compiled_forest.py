@@ -0,0 +1,99 @@
+"""Parity and latency of the compiled forest against scikit-learn inference
+
+    python -m benchmarks.compiled_forest --train-rows 5000 --batch-sizes 1 10 100 1000 10000
+
+Exits non-zero if any compiled prediction differs from scikit-learn's.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import numpy as np
+from app.ml_models.compiled_forest import CompiledForest
+from app.ml_models.deadline_predictor import DeadlinePredictor
+from app.ml_models.prioritizer import TaskPrioritizer
+
+def synthetic_rows(n: int, rng: np.random.Generator) -> list:
+    """Training rows with both models' features and labels"""
+    rows = []
+    for _ in range(n):
+        estimated = float(rng.gamma(2.0, 2.0))
+        days = int(rng.integers(-5, 60))
+        rows.append({
+            "days_to_deadline": days,
+            "task_age": int(rng.integers(0, 30)),
+            "estimated_hours": estimated,
+            "avg_completion_time": float(rng.uniform(0.5, 10.0)),
+            "productivity_score": float(rng.uniform(0.0, 1.0)),
+            "tasks_per_day": float(rng.uniform(0.0, 8.0)),
+            "task_length": int(rng.integers(0, 500)),
+            "title_length": int(rng.integers(3, 80)),
+            "completion_variance": float(rng.uniform(0.0, 5.0)),
+            "was_completed_on_time": bool(days > estimated / 8 + rng.normal(0, 2)),
+            "actual_hours_taken": max(0.1, estimated * float(rng.lognormal(0, 0.4))),
+        })
+    return rows
+
+def timed(fn, X: np.ndarray, repeat: int) -> float:
+    fn(X)  # warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(X)
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 4)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--train-rows", type=int, default=5000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rows = synthetic_rows(args.train_rows, rng)
+    prioritizer, predictor = TaskPrioritizer(), DeadlinePredictor()
+    prioritizer.train(rows)
+    predictor.train(rows)
+
+    models = {
+        "prioritizer": (
+            prioritizer,
+            lambda X: prioritizer.model.predict_proba(prioritizer.scaler.transform(X)),
+            CompiledForest.from_sklearn(prioritizer.model, prioritizer.scaler).predict_proba,
+        ),
+        "deadline_predictor": (
+            predictor,
+            lambda X: predictor.model.predict(predictor.scaler.transform(X)),
+            CompiledForest.from_sklearn(predictor.model, predictor.scaler).predict,
+        ),
+    }
+
+    results, mismatches = {}, 0
+    for name, (model, sklearn_fn, compiled_fn) in models.items():
+        pool = np.array(
+            [[row[f] for f in model.FEATURES] for row in synthetic_rows(max(args.batch_sizes), rng)],
+            dtype=float
+        )
+        parity = bool(np.array_equal(sklearn_fn(pool), compiled_fn(pool)))
+        mismatches += not parity
+
+        results[name] = {"parity": parity, "batches": {}}
+        for size in args.batch_sizes:
+            X = pool[:size]
+            sklearn_ms, compiled_ms = timed(sklearn_fn, X, args.repeat), timed(compiled_fn, X, args.repeat)
+            results[name]["batches"][size] = {
+                "sklearn_ms": sklearn_ms,
+                "compiled_ms": compiled_ms,
+                "speedup": round(sklearn_ms / max(compiled_ms, 1e-6), 1),
+            }
+
+    print(json.dumps(results, indent=2))
+    if mismatches:
+        sys.exit("compiled forest predictions differ from scikit-learn")
+
+if __name__ == "__main__":
+    main()
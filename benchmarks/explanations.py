@@ -0,0 +1,143 @@
+"""Cost of prediction explanations over plain scoring, per model and through GET /api/tasks/
+
+    python -m benchmarks.explanations --train-rows 5000 --batch-sizes 1 10 100 1000
+    python -m benchmarks.explanations --max-overhead 3 --limits 20 100
+
+Trains both forests on synthetic rows and times _score_matrix against
+explain_matrix on the compiled backend (for every batch size) and on the
+scikit-learn one. Then seeds a temporary SQLite database (its tasks are
+unscored, so plain requests score inline) and times GET /api/tasks/ with
+and without explain=true.
+
+Exits non-zero if an explanation does not add up to its prediction, or
+explaining costs more than --max-overhead times plain compiled scoring.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+def additivity_error(explanations) -> float:
+    """Largest |base + sum(contributions) - value| over the explanations"""
+    return max(
+        abs(e["base"] + sum(e["contributions"].values()) - e["value"]) for e in explanations
+    )
+
+def model_benchmark(args, rows, rng) -> dict:
+    from app.config import settings
+    from .compiled_forest import synthetic_rows, timed
+    from app.ml_models.deadline_predictor import DeadlinePredictor
+    from app.ml_models.prioritizer import TaskPrioritizer
+
+    # Like for like: the compiled backend scores every batch size, as explanations do
+    settings.compiled_max_batch = max(args.batch_sizes)
+    results = {}
+    for model in (TaskPrioritizer(), DeadlinePredictor()):
+        name = type(model).__name__
+        model.train(rows)
+        pool = np.array(
+            [[row[f] for f in model.FEATURES] for row in synthetic_rows(max(args.batch_sizes), rng)],
+            dtype=float
+        )
+        results[name] = {"additivity_error": round(additivity_error(model.explain_matrix(pool)), 6)}
+        for backend in ("compiled", "sklearn"):
+            if backend == "compiled":
+                model.compile()
+            else:
+                model.compiled = None
+            batches = {}
+            for size in args.batch_sizes:
+                X = pool[:size]
+                score_ms = timed(model._score_matrix, X, args.repeat)
+                explain_ms = timed(model.explain_matrix, X, args.repeat)
+                batches[size] = {
+                    "score_ms": score_ms,
+                    "explain_ms": explain_ms,
+                    "overhead": round(explain_ms / max(score_ms, 1e-6), 2),
+                }
+            results[name][backend] = batches
+    return results
+
+def endpoint_benchmark(args) -> dict:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.database import engine
+    from app.migrations import upgrade
+    from app.ml_models.training import run_training
+    from app.routers import tasks
+    from .seed import seed_database
+
+    upgrade(engine)
+    seed_database(engine, users=args.users, tasks_per_user=args.tasks_per_user, completed_ratio=0.5)
+    training = run_training()
+
+    app = FastAPI()
+    app.include_router(tasks.router, prefix="/api/tasks")
+    results = {"training": training["status"]}
+    with TestClient(app) as client:
+        for limit in args.limits:
+            timings = {}
+            for explain in (False, True):
+                latencies = []
+                for i in range(args.requests):
+                    params = {"user_id": i % args.users + 1, "limit": limit, "completed": False}
+                    if explain:
+                        params["explain"] = True
+                    started = time.perf_counter()
+                    response = client.get("/api/tasks/", params=params)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    response.raise_for_status()
+                    if explain and response.json() and response.json()[0]["explanation"] is None:
+                        sys.exit("explain=true returned no explanation")
+                timings["explain_ms" if explain else "plain_ms"] = round(statistics.median(latencies), 2)
+            timings["overhead"] = round(timings["explain_ms"] / timings["plain_ms"], 2)
+            results[f"limit={limit}"] = timings
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--train-rows", type=int, default=5000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks-per-user", type=int, default=200)
+    parser.add_argument("--limits", type=int, nargs="+", default=[20, 100])
+    parser.add_argument("--requests", type=int, default=100, help="requests per limit and mode")
+    parser.add_argument("--max-overhead", type=float, default=4.0,
+                        help="allowed explain_ms / score_ms on the compiled backend")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Settings are read at import, so point the app at the benchmark database and model store first
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MODEL_DIR"] = os.path.join(workdir, "model_store")
+    os.environ["SCHEDULER"] = "off"
+    from .compiled_forest import synthetic_rows
+
+    rng = np.random.default_rng(args.seed)
+    report = {
+        "config": vars(args),
+        "models": model_benchmark(args, synthetic_rows(args.train_rows, rng), rng),
+        "endpoint": endpoint_benchmark(args),
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    for name, result in report["models"].items():
+        # Every term is rounded to 4 decimals
+        if result["additivity_error"] > 1e-3:
+            failures.append(f"{name}: contributions miss the prediction by {result['additivity_error']}")
+        for size, batch in result["compiled"].items():
+            if batch["overhead"] > args.max_overhead:
+                failures.append(f"{name}: explaining {size} rows costs {batch['overhead']}x scoring")
+    if failures:
+        sys.exit("Explanation checks failed: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
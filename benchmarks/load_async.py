@@ -0,0 +1,95 @@
+"""Throughput of the sync vs async task routes under concurrent clients
+
+    python -m benchmarks.load_async --concurrency 50 200 1000 --requests 2000
+
+Sync routes hold their pooled connection until the response has been
+validated on the threadpool, so past pool_size + max_overflow concurrent
+requests they queue on the pool; requests that hit DB_POOL_TIMEOUT are
+reported as errors rather than aborting the run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+ROUTES = {
+    "sync": "/api/tasks/",
+    "async": "/api/async/tasks/",
+}
+
+async def drive(client, path: str, users: int, concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, params={"user_id": i % users + 1, "limit": 50})
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "errors": errors,
+    }
+
+async def run(args) -> dict:
+    import httpx
+    from fastapi import FastAPI
+    from app.database import engine
+    from app.migrations import upgrade
+    from app.routers import tasks
+    from .seed import seed_database
+
+    upgrade(engine)
+    seed_database(engine, users=args.users, tasks_per_user=args.tasks_per_user)
+
+    app = FastAPI()
+    app.include_router(tasks.router, prefix="/api/tasks")
+    app.include_router(tasks.async_router, prefix="/api/async/tasks")
+
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for concurrency in args.concurrency:
+            for name, path in ROUTES.items():
+                await drive(client, path, args.users, concurrency, min(args.requests, 100))  # warm-up
+                results[f"{name}@{concurrency}"] = await drive(
+                    client, path, args.users, concurrency, args.requests
+                )
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks-per-user", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--pool-timeout", type=int, default=5)
+    args = parser.parse_args()
+
+    # Settings are read at import, so point the app at the benchmark database first
+    os.environ["DATABASE_URL"] = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ["DB_POOL_TIMEOUT"] = str(args.pool_timeout)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""In-process scoring vs the model-server sidecar, across several worker processes
+
+    python -m benchmarks.model_server --workers 4 --threads 8 --calls 500 --max-wait-us 500
+
+Trains both models on synthetic rows into a temporary model store, then
+runs the same single-row scoring load against models loaded in every
+worker and against one sidecar shared by all workers. Reports throughput,
+latency, per-worker model memory and the sidecar's mean batch size. Exits
+non-zero if the sidecar's results differ from in-process scoring.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+MODELS = ["prioritizer", "deadline_predictor"]
+
+def rss_mb(pid: str = "self") -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+def feature_pool(n: int, seed: int) -> dict:
+    from app.ml_models.registry import model_class
+    from .compiled_forest import synthetic_rows
+
+    rows = synthetic_rows(n, np.random.default_rng(seed))
+    return {
+        name: np.array([[row[f] for f in model_class(name).FEATURES] for row in rows], dtype=float)
+        for name in MODELS
+    }
+
+def serving_registry():
+    from app.ml_models.registry import get_serving_registry
+
+    return get_serving_registry()
+
+def worker(threads: int, calls: int, seed: int, results):
+    """One web worker: loads (or connects to) the models, then scores single rows from several threads"""
+    before = rss_mb()
+    registry = serving_registry()
+    predictors = {name: registry.get(name) for name in MODELS}
+    pool = feature_pool(1000, seed)
+    for name, predictor in predictors.items():
+        predictor._score_matrix(pool[name][:1])
+    model_mb = rss_mb() - before
+
+    latencies = []
+    start = threading.Barrier(threads)
+
+    def run(offset: int):
+        start.wait()
+        own = []
+        for i in range(calls):
+            name = MODELS[i % 2]
+            row = pool[name][(offset + i) % len(pool[name])][None, :]
+            started = time.perf_counter()
+            predictors[name]._score_matrix(row)
+            own.append((time.perf_counter() - started) * 1000)
+        latencies.extend(own)
+
+    pool_threads = [threading.Thread(target=run, args=(t * calls,)) for t in range(threads)]
+    started = time.perf_counter()
+    for thread in pool_threads:
+        thread.start()
+    for thread in pool_threads:
+        thread.join()
+    results.put({"latencies": latencies, "seconds": time.perf_counter() - started, "model_mb": model_mb})
+
+def run_load(args) -> dict:
+    context = multiprocessing.get_context("spawn")  # children read settings from the environment
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(args.threads, args.calls, args.seed + i, results))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for report in reports for latency in report["latencies"])
+    return {
+        "calls": len(latencies),
+        "calls_per_second": round(len(latencies) / max(report["seconds"] for report in reports), 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "model_mb_per_worker": round(statistics.mean(report["model_mb"] for report in reports), 1),
+    }
+
+def wait_for_socket(path: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"model server did not start on {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="web worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent requests per worker")
+    parser.add_argument("--calls", type=int, default=500, help="single-row scoring calls per thread")
+    parser.add_argument("--train-rows", type=int, default=5000)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-wait-us", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    socket_path = os.path.join(workdir, "models.sock")
+    os.environ["MODEL_DIR"] = os.path.join(workdir, "model_store")
+
+    from app.ml_models.registry import ModelRegistry, model_class
+    from .compiled_forest import synthetic_rows
+
+    rows = synthetic_rows(args.train_rows, np.random.default_rng(args.seed))
+    store = ModelRegistry(os.environ["MODEL_DIR"])
+    for name in MODELS:
+        predictor = model_class(name)()
+        predictor.train(rows)
+        store.save(name, predictor)
+
+    report = {"config": vars(args), "in_process": run_load(args)}
+
+    server = subprocess.Popen([
+        sys.executable, "-m", "app.ml_models.model_server", "--socket", socket_path,
+        "--max-batch", str(args.max_batch), "--max-wait-us", str(args.max_wait_us)
+    ], env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    try:
+        wait_for_socket(socket_path)
+        os.environ["MODEL_SERVER_SOCKET"] = socket_path
+        from app.ml_models.model_server import ModelServerClient
+
+        # Parity: the sidecar must return exactly what in-process scoring does
+        client = ModelServerClient(socket_path, timeout=30.0)
+        pool = feature_pool(2000, args.seed)
+        mismatches = 0
+        for name in MODELS:
+            local = store.load(name)
+            _, remote = client.score(name, pool[name])
+            mismatches += sum(tuple(r) != l for r, l in zip(remote, local._score_matrix(pool[name])))
+        report["parity_mismatches"] = mismatches
+
+        client.info()  # loads the models into the server
+        report["sidecar"] = run_load(args)
+        report["sidecar"]["server_model_mb"] = rss_mb(str(server.pid))
+        report["sidecar"]["server_stats"] = client.info()["stats"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(json.dumps(report, indent=2))
+    if report["parity_mismatches"]:
+        sys.exit(f"{report['parity_mismatches']} sidecar predictions differ from in-process scoring")
+
+if __name__ == "__main__":
+    main()
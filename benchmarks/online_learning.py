@@ -0,0 +1,228 @@
+"""Online SGD models vs batch-trained random forests: update cost, latency and accuracy
+
+    python -m benchmarks.online_learning --rows 50000 --users 200 --drift 1.5
+    python -m benchmarks.online_learning --history 100000 --new 500
+
+Stream: synthetic completions with per-user effects (some users are always
+late, some always underestimate) and, halfway through the stream, drift in
+how long tasks take. Both kinds of model are trained on the first part;
+the rest arrives in mini-batches that are scored before they are learned
+(test-then-train). The forest is not retrained during the stream, which is
+what serving sees between weekly runs; on the final holdout it is compared
+fully retrained on everything before it.
+
+Database: seeds --history completions into a temporary SQLite file and times
+a full run_training against run_online_update on --new fresh completions.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import numpy as np
+
+PRIORITIZER = "was_completed_on_time"
+DEADLINE = "actual_hours_taken"
+
+def synthetic_stream(n: int, users: int, drift: float, rng: np.random.Generator):
+    """Rows in completion order, with a user id, per-user effects and drift after the midpoint"""
+    from app.ml_models.columnar import ColumnSet
+    from .compiled_forest import synthetic_rows
+
+    columns = ColumnSet.from_rows(synthetic_rows(n, rng))
+    user_ids = rng.integers(1, users + 1, n)
+    lateness = rng.normal(0, 2.0, users + 1)  # days of slack each user effectively loses
+    underestimate = rng.lognormal(0, 0.35, users + 1)
+    hours_drift = np.where(np.arange(n) >= n // 2, drift, 1.0)
+
+    estimated = columns["estimated_hours"]
+    slack = columns["days_to_deadline"] - estimated / 8 - lateness[user_ids] + rng.normal(0, 2, n)
+    columns.columns.update({
+        "user_id": user_ids,
+        PRIORITIZER: slack > 0,
+        DEADLINE: np.maximum(0.1, estimated * underestimate[user_ids] * hours_drift * rng.lognormal(0, 0.3, n)),
+    })
+    return columns
+
+def take(columns, start: int, end: int):
+    from app.ml_models.columnar import ColumnSet
+
+    return ColumnSet({name: values[start:end] for name, values in columns.columns.items()})
+
+def online_scores(predictor, X: np.ndarray, user_ids: np.ndarray) -> np.ndarray:
+    """What _score_matrix computes per user, as raw probabilities / hours for scoring the stream"""
+    corrections = np.array([predictor.residuals.correction(u) for u in user_ids.tolist()])
+    if hasattr(predictor, "_probability"):
+        return np.clip(predictor._probability(X) + corrections, 0.0, 1.0)
+    return np.maximum(0.0, predictor._hours(X) + corrections)
+
+def forest_scores(predictor, X: np.ndarray) -> np.ndarray:
+    X_scaled = predictor.scaler.transform(X)
+    if hasattr(predictor.model, "predict_proba"):
+        return predictor.model.predict_proba(X_scaled)[:, 1]
+    return predictor.model.predict(X_scaled)
+
+def metrics(label: str, y: np.ndarray, scores: np.ndarray) -> dict:
+    if label == PRIORITIZER:
+        p = np.clip(scores, 1e-6, 1 - 1e-6)
+        return {
+            "accuracy": round(float(np.mean((scores >= 0.5) == y)), 4),
+            "log_loss": round(float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))), 4),
+        }
+    return {"mae_hours": round(float(np.mean(np.abs(scores - y))), 4)}
+
+def latency_us(fn, repeat: int = 2000) -> float:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1e6)
+    return round(statistics.median(timings), 1)
+
+def stream_benchmark(args) -> dict:
+    from app.config import settings
+    from app.ml_models.online import OnlineDeadlinePredictor, OnlinePrioritizer
+    from app.ml_models.registry import model_class
+
+    rng = np.random.default_rng(args.seed)
+    stream = synthetic_stream(args.rows, args.users, args.drift, rng)
+    initial = int(len(stream) * args.initial)
+    holdout = len(stream) - int(len(stream) * args.holdout)
+    report = {}
+
+    for name, label, online_class in [
+        ("prioritizer", PRIORITIZER, OnlinePrioritizer),
+        ("deadline_predictor", DEADLINE, OnlineDeadlinePredictor),
+    ]:
+        forest, online = model_class(name, "batch")(), online_class()
+        features = forest.FEATURES
+        started = time.perf_counter()
+        forest.train(take(stream, 0, initial))
+        forest_fit = time.perf_counter() - started
+        started = time.perf_counter()
+        online.train(take(stream, 0, initial))
+        online_fit = time.perf_counter() - started
+
+        # Test-then-train over the stream up to the holdout
+        y_all, forest_all, online_all, update_ms = [], [], [], []
+        for start in range(initial, holdout, settings.online_batch_size):
+            batch = take(stream, start, min(start + settings.online_batch_size, holdout))
+            X, y = batch.matrix(features), batch[label]
+            y_all.append(y)
+            forest_all.append(forest_scores(forest, X))
+            online_all.append(online_scores(online, X, batch["user_id"]))
+            started = time.perf_counter()
+            online.partial_fit(batch)
+            update_ms.append((time.perf_counter() - started) * 1000)
+        y_all, forest_all, online_all = map(np.concatenate, (y_all, forest_all, online_all))
+
+        # Holdout: online as it stands vs a forest retrained on everything before it
+        tail = take(stream, holdout, len(stream))
+        X_tail, y_tail = tail.matrix(features), tail[label]
+        online_tail = online_scores(online, X_tail, tail["user_id"])
+        stale_tail = forest_scores(forest, X_tail)
+        started = time.perf_counter()
+        forest.train(take(stream, 0, holdout))
+        forest_refit = time.perf_counter() - started
+        forest.compile()
+
+        row = X_tail[:1]
+        user_id = int(tail["user_id"][0])
+        report[name] = {
+            "update_cost": {
+                "online_partial_fit_ms_per_batch": round(statistics.median(update_ms), 3),
+                "online_rows_per_second": round(settings.online_batch_size / statistics.median(update_ms) * 1000),
+                "online_initial_fit_seconds": round(online_fit, 3),
+                "forest_initial_fit_seconds": round(forest_fit, 3),
+                "forest_full_retrain_seconds": round(forest_refit, 3),
+            },
+            "prediction_latency_us": {
+                "online_1_row": latency_us(lambda: online._score_matrix(row, user_id)),
+                "forest_sklearn_1_row": latency_us(lambda: forest.model.predict(forest.scaler.transform(row)), 200),
+                "forest_compiled_1_row": latency_us(lambda: forest.compiled.predict(row)),
+                "online_100_rows": latency_us(lambda: online._score_matrix(X_tail[:100], user_id)),
+                "forest_compiled_100_rows": latency_us(lambda: forest.compiled.predict(X_tail[:100]), 500),
+            },
+            "stream_accuracy": {
+                "rows": len(y_all),
+                "forest_trained_once": metrics(label, y_all, forest_all),
+                "online": metrics(label, y_all, online_all),
+            },
+            "holdout_accuracy": {
+                "rows": len(y_tail),
+                "forest_trained_once": metrics(label, y_tail, stale_tail),
+                "forest_retrained": metrics(label, y_tail, forest_scores(forest, X_tail)),
+                "online": metrics(label, y_tail, online_tail),
+            },
+        }
+    return report
+
+def database_benchmark(args) -> dict:
+    """Full run_training vs run_online_update on a few new completions, against a seeded history"""
+    import math
+    from datetime import datetime
+    from sqlalchemy import insert, select
+    from app.database import SessionLocal, engine
+    from app.migrations import upgrade
+    from app.ml_models.online import run_online_update
+    from app.ml_models.training import run_training
+    from app.models import Task, TaskCompletion
+    from .seed import seed_database
+
+    upgrade(engine)
+    seed_database(engine, users=args.users, tasks_per_user=math.ceil(args.history / args.users / 0.6))
+    report = {}
+
+    started = time.perf_counter()
+    trained = run_training()
+    report["run_training_seconds"] = round(time.perf_counter() - started, 2)
+    report["history_rows"] = trained["rows"]
+
+    started = time.perf_counter()
+    run_online_update()  # fits the online models on all history, once
+    report["online_bootstrap_seconds"] = round(time.perf_counter() - started, 2)
+
+    with SessionLocal() as db:
+        now = datetime.utcnow()
+        tasks = db.scalars(select(Task).where(Task.completed == False).limit(args.new)).all()
+        for task in tasks:
+            task.completed, task.completed_at = True, now
+        db.execute(insert(TaskCompletion), [
+            {"task_id": task.id, "user_id": task.user_id, "actual_hours": 2.0, "completion_date": now}
+            for task in tasks
+        ])
+        db.commit()
+
+    started = time.perf_counter()
+    update = run_online_update()
+    report["online_update_seconds"] = round(time.perf_counter() - started, 3)
+    report["online_update_rows"] = {name: model["rows"] for name, model in update["models"].items()}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000, help="synthetic stream length")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--initial", type=float, default=0.3, help="share of the stream both models start from")
+    parser.add_argument("--holdout", type=float, default=0.1, help="share at the end used for the holdout")
+    parser.add_argument("--drift", type=float, default=1.5, help="factor on actual hours after the midpoint")
+    parser.add_argument("--history", type=int, default=20000, help="completions seeded for the database run")
+    parser.add_argument("--new", type=int, default=500, help="completions the online update learns")
+    parser.add_argument("--skip-db", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ["MODEL_DIR"] = os.path.join(workdir, "model_store")
+
+    report = {"config": vars(args), "stream": stream_benchmark(args)}
+    if not args.skip_db:
+        report["database"] = database_benchmark(args)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Planning cost and quality of the scheduling engine on synthetic backlogs
+
+    python -m benchmarks.scheduling --tasks 10000 --updates 200
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from app.scheduling import PlanItem, Schedule, WorkCalendar
+
+def horizon_days(hours: list, calendar: WorkCalendar, load: float) -> float:
+    """Calendar days over which the given work is `load` times the available working hours"""
+    return sum(hours) / load / calendar.hours_per_day * 7 / 5
+
+def synthetic_items(n: int, calendar: WorkCalendar, now: datetime, load: float, rng: random.Random) -> list:
+    """Backlog whose total work is `load` times the working hours until the last deadline"""
+    hours = [round(rng.lognormvariate(1.0, 0.6), 2) for _ in range(n)]
+    horizon = horizon_days(hours, calendar, load)
+    items = []
+    for task_id, task_hours in enumerate(hours, start=1):
+        deadline = now + timedelta(days=rng.uniform(-1, horizon))
+        items.append(PlanItem(
+            task_id=task_id,
+            hours=task_hours,
+            due=calendar.position(deadline) if rng.random() < 0.8 else float("inf"),
+            weight=rng.randint(1, 10)
+        ))
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--load", type=float, default=1.2, help="total work / available hours before the last deadline")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    calendar = WorkCalendar()
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = calendar.position(now)
+
+    started = time.perf_counter()
+    items = synthetic_items(args.tasks, calendar, now, args.load, rng)
+    calendar_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    edf = Schedule(items, start=start, search_budget_per_task=0)
+    edf_order = edf._dispatch()
+    edf_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    schedule = Schedule(items, start=start)
+    build_ms = (time.perf_counter() - started) * 1000
+    built_tardiness = schedule.total_tardiness()
+    horizon = horizon_days([item.hours for item in items], calendar, args.load)
+
+    # Edit one task at a time: new estimate, deadline and priority
+    update_ms = []
+    for _ in range(args.updates):
+        old = schedule.items[rng.randint(1, args.tasks)]
+        changed = old._replace(
+            hours=round(rng.lognormvariate(1.0, 0.6), 2),
+            due=calendar.position(now + timedelta(days=rng.uniform(-1, horizon))),
+            weight=rng.randint(1, 10)
+        )
+        started = time.perf_counter()
+        schedule.update(changed)
+        update_ms.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    rebuilt = Schedule(schedule.items.values(), start=start)
+    rebuild_ms = (time.perf_counter() - started) * 1000
+
+    print(json.dumps({
+        "tasks": args.tasks,
+        "load": args.load,
+        "calendar_mapping_ms": round(calendar_ms, 2),
+        "edf_only": {"weighted_tardiness": round(edf._weighted_tardiness(edf_order), 1)},
+        "dispatch_only": {"build_ms": round(edf_ms, 2), "weighted_tardiness": round(edf.total_tardiness(), 1)},
+        "dispatch_plus_local_search": {"build_ms": round(build_ms, 2), "weighted_tardiness": round(built_tardiness, 1)},
+        "incremental_update": {
+            "median_ms": round(statistics.median(update_ms), 3),
+            "max_ms": round(max(update_ms), 3),
+            "weighted_tardiness_after": round(schedule.total_tardiness(), 1),
+        },
+        "full_rebuild_after_updates": {"build_ms": round(rebuild_ms, 2), "weighted_tardiness": round(rebuilt.total_tardiness(), 1)},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
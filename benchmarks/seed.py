@@ -0,0 +1,91 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.models import User, Task, TaskCompletion
+from app.rollups import rebuild_daily_rollups
+
+def seed_database(
+    engine: Engine,
+    users: int = 100,
+    tasks_per_user: int = 1000,
+    completed_ratio: float = 0.6,
+    batch_size: int = 10000,
+    seed: int = 42
+) -> dict:
+    """Insert synthetic users, tasks and completions, then build the daily rollups
+
+    Rows go in through core executemany batches, so millions of rows seed
+    in minutes rather than hours. Returns the number of rows per table.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    counts = {"users": users, "tasks": 0, "task_completions": 0, "productivity_logs": 0}
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+
+        conn.execute(insert(User), [
+            {"id": u, "email": f"user{u}@example.com", "name": f"User {u}", "created_at": now}
+            for u in range(1, users + 1)
+        ])
+
+        task_id = 0
+        task_rows, completion_rows = [], []
+
+        def flush():
+            if task_rows:
+                conn.execute(insert(Task), task_rows)
+                task_rows.clear()
+            if completion_rows:
+                conn.execute(insert(TaskCompletion), completion_rows)
+                completion_rows.clear()
+
+        for user_id in range(1, users + 1):
+            for _ in range(tasks_per_user):
+                task_id += 1
+                created_at = now - timedelta(days=rng.randint(0, 365), minutes=rng.randint(0, 1440))
+                deadline = created_at + timedelta(days=rng.randint(1, 30)) if rng.random() < 0.8 else None
+                completed = rng.random() < completed_ratio
+                completed_at = created_at + timedelta(days=rng.randint(0, 35)) if completed else None
+                estimated_hours = round(rng.uniform(0.5, 16), 1)
+                task_rows.append({
+                    "id": task_id,
+                    "title": f"Task {task_id}",
+                    "description": "x" * rng.randint(0, 400),
+                    "priority": rng.randint(1, 10),
+                    "estimated_hours": estimated_hours,
+                    "deadline": deadline,
+                    "completed": completed,
+                    "created_at": created_at,
+                    "completed_at": completed_at,
+                    "user_id": user_id,
+                })
+                if completed:
+                    completion_rows.append({
+                        "task_id": task_id,
+                        "actual_hours": round(estimated_hours * rng.uniform(0.5, 2.0), 2),
+                        "completion_date": completed_at,
+                        "user_id": user_id,
+                    })
+                if len(task_rows) >= batch_size:
+                    counts["task_completions"] += len(completion_rows)
+                    flush()
+            counts["tasks"] = task_id
+
+        counts["task_completions"] += len(completion_rows)
+        flush()
+
+        if engine.dialect.name == "postgresql":
+            # Ids were inserted explicitly, so move the sequences past them for later inserts
+            for table in ("users", "tasks"):
+                conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+                )
+
+    with Session(engine) as db:
+        counts["productivity_logs"] = rebuild_daily_rollups(db)
+
+    return counts
@@ -0,0 +1,271 @@
+"""Several SQLite shards in one process: placement, isolation, online moves and per-shard models
+
+    python -m benchmarks.sharding --shards 3 --users 30 --whale-tasks 50000
+
+Sets SHARD_URLS to --shards SQLite files in a temporary directory and drives
+the API through an in-process client. Reports:
+  placement        users and tasks per shard, and routing cost per lookup
+  isolation        create_task latency for small users while one large
+                   tenant bulk-imports, on the tenant's shard vs the others
+  move             a user moved to another shard while other users keep
+                   sending requests: errors seen, ids kept, source emptied
+  training         run_training on every shard, each publishing its own models
+Exits non-zero when a check fails.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+def latency_ms(values) -> dict:
+    values = sorted(values)
+    return {
+        "n": len(values),
+        "p50": round(statistics.median(values), 2) if values else None,
+        "p95": round(values[int(0.95 * (len(values) - 1))], 2) if values else None,
+    }
+
+def create_task(client, user_id: int, i: int) -> float:
+    started = time.perf_counter()
+    response = client.post("/api/tasks/", params={"user_id": user_id}, json={
+        "title": f"Task {i}",
+        "deadline": (datetime.utcnow() + timedelta(days=i % 20 + 1)).isoformat(),
+        "estimated_hours": float(i % 8 + 1),
+    })
+    response.raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+def bulk_upload(user_id: int, rows: int) -> bytes:
+    deadline = (datetime.utcnow() + timedelta(days=7)).isoformat()
+    return "".join(
+        json.dumps({"title": f"Import {i}", "deadline": deadline, "estimated_hours": i % 8 + 1}) + "\n"
+        for i in range(rows)
+    ).encode()
+
+def placement_benchmark(client, shards, args) -> dict:
+    user_ids = []
+    for u in range(args.users):
+        response = client.post("/api/users/", json={"email": f"user{u}@example.com", "name": f"User {u}"})
+        response.raise_for_status()
+        user_ids.append(response.json()["id"])
+    for user_id in user_ids:
+        for i in range(args.tasks_per_user):
+            create_task(client, user_id, i)
+
+    by_shard = {name: [] for name in shards.names}
+    for user_id in user_ids:
+        by_shard[shards.name_for(user_id)].append(user_id)
+
+    cached = time.perf_counter()
+    for _ in range(args.lookups):
+        shards.for_user(user_ids[0])
+    cached = (time.perf_counter() - cached) / args.lookups * 1e6
+    uncached = time.perf_counter()
+    for i in range(args.lookups // 10):
+        shards.placement(user_ids[i % len(user_ids)], cached=False)
+    uncached = (time.perf_counter() - uncached) / (args.lookups // 10) * 1e6
+
+    return user_ids, by_shard, {
+        "users_per_shard": {name: len(users) for name, users in by_shard.items()},
+        "routing_us_cached": round(cached, 2),
+        "routing_us_directory_lookup": round(uncached, 1),
+    }
+
+def isolation_benchmark(client, shards, by_shard, args) -> dict:
+    """A large tenant imports tasks; small users on its shard share its write lock, the others do not"""
+    whale_shard = max(by_shard, key=lambda name: len(by_shard[name]))
+    whale = by_shard[whale_shard][0]
+    neighbours = by_shard[whale_shard][1:]
+    others = [user_id for name, users in by_shard.items() if name != whale_shard for user_id in users]
+    upload = bulk_upload(whale, args.whale_tasks)
+
+    def small_users(users, latencies):
+        i = 0
+        while importing.is_set():
+            latencies.append(create_task(client, users[i % len(users)], i))
+            i += 1
+
+    same_shard, other_shards = [], []
+    importing = threading.Event()
+    importing.set()
+    workers = [
+        threading.Thread(target=small_users, args=(neighbours, same_shard)),
+        threading.Thread(target=small_users, args=(others, other_shards)),
+    ]
+    for worker in workers:
+        worker.start()
+    started = time.perf_counter()
+    response = client.post(
+        "/api/tasks/bulk", params={"user_id": whale}, content=upload,
+        headers={"content-type": "application/x-ndjson"}
+    )
+    import_seconds = time.perf_counter() - started
+    importing.clear()
+    for worker in workers:
+        worker.join()
+    summary = json.loads(response.text.strip().splitlines()[-1])
+
+    return whale, {
+        "whale_user_id": whale,
+        "whale_shard": whale_shard,
+        "whale_import": {**summary, "seconds": round(import_seconds, 2)},
+        "create_task_ms_same_shard": latency_ms(same_shard),
+        "create_task_ms_other_shards": latency_ms(other_shards),
+    }
+
+def move_benchmark(client, shards, user_id: int, bystanders, label: str) -> dict:
+    """Move a user while bystanders and the user itself keep reading their tasks"""
+    from sqlalchemy import func, select
+    from app.models import Task
+    from app.sharding import move_user
+
+    source = shards.name_for(user_id)
+    target = next(name for name in shards.names if name != source)
+    with shards[source].session() as db:
+        ids_before = set(db.scalars(select(Task.id).where(Task.user_id == user_id)))
+
+    statuses = {"bystanders": {}, "moved_user": {}}
+    moving = threading.Event()
+    moving.set()
+
+    def reader(users, counts):
+        i = 0
+        while moving.is_set():
+            status = client.get("/api/tasks/", params={"user_id": users[i % len(users)], "limit": 20}).status_code
+            counts[status] = counts.get(status, 0) + 1
+            i += 1
+
+    workers = [
+        threading.Thread(target=reader, args=(bystanders, statuses["bystanders"])),
+        threading.Thread(target=reader, args=([user_id], statuses["moved_user"])),
+    ]
+    for worker in workers:
+        worker.start()
+    report = move_user(user_id, target, shards)
+    time.sleep(0.2)
+    moving.clear()
+    for worker in workers:
+        worker.join()
+
+    with shards[target].session() as db:
+        ids_after = set(db.scalars(select(Task.id).where(Task.user_id == user_id)))
+    with shards[source].session() as db:
+        left_behind = db.scalar(select(func.count(Task.id)).where(Task.user_id == user_id))
+    served = client.get("/api/tasks/", params={"user_id": user_id})
+
+    return {
+        "label": label,
+        **report,
+        "requests": statuses,
+        "tasks_before": len(ids_before),
+        "ids_preserved": ids_before == ids_after,
+        "left_on_source": left_behind,
+        "served_after_move": served.status_code == 200 and len(served.json()) == len(ids_before),
+        "routed_to_target": shards.name_for(user_id) == target,
+    }
+
+def seed_completions(shards, per_shard: int):
+    """Complete some open tasks on every shard, so each has its own training data"""
+    from sqlalchemy import select
+    from app.models import Task, TaskCompletion
+
+    now = datetime.utcnow()
+    for shard in shards:
+        with shard.session() as db:
+            tasks = db.scalars(select(Task).where(Task.completed == False).limit(per_shard)).all()
+            for i, task in enumerate(tasks):
+                task.completed = True
+                task.completed_at = now - timedelta(days=i % 10)
+                db.add(TaskCompletion(
+                    task_id=task.id, user_id=task.user_id, actual_hours=task.estimated_hours * (1 + i % 3 / 2),
+                    completion_date=task.completed_at
+                ))
+            db.commit()
+
+def training_benchmark(shards, args) -> dict:
+    from app.ml_models.registry import get_model_registry
+    from app.ml_models.training import run_training
+    from app.sharding import run_on_each_shard
+
+    seed_completions(shards, args.completions_per_shard)
+    started = time.perf_counter()
+    reports = run_on_each_shard(run_training)
+    versions = {name: get_model_registry(name).metadata("prioritizer") for name in shards.names}
+    return {
+        "seconds": round(time.perf_counter() - started, 2),
+        "status": {name: report["status"] for name, report in reports.items()},
+        "rows": {name: report.get("rows") for name, report in reports.items()},
+        "prioritizer_versions": {name: meta and meta["version"] for name, meta in versions.items()},
+        "prioritizer_rows": {name: meta and meta["training"]["rows"] for name, meta in versions.items()},
+        "model_dirs": {name: get_model_registry(name).root for name in shards.names},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--tasks-per-user", type=int, default=20)
+    parser.add_argument("--whale-tasks", type=int, default=20000, help="rows the large tenant bulk-imports")
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--completions-per-shard", type=int, default=200)
+    parser.add_argument("--move-whale", action="store_true", help="also move the large tenant")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["SHARD_URLS"] = json.dumps({
+        f"shard{n}": f"sqlite:///{os.path.join(workdir, f'shard{n}.db')}" for n in range(args.shards)
+    })
+    os.environ["MODEL_DIR"] = os.path.join(workdir, "model_store")
+    os.environ.setdefault("SHARD_DIRECTORY_TTL", "0.5")
+    os.environ.setdefault("SHARD_MOVE_GRACE", "0.5")
+    os.environ["MODEL_WARMUP"] = "off"
+    os.environ["SCHEDULER"] = "off"
+
+    from fastapi.testclient import TestClient
+    from app.config import settings
+    from app.main import app
+    from app.sharding import get_shards, shard_sizes
+
+    shards = get_shards()
+    report = {"config": vars(args)}
+    with TestClient(app) as client:
+        user_ids, by_shard, report["placement"] = placement_benchmark(client, shards, args)
+        whale, report["isolation"] = isolation_benchmark(client, shards, by_shard, args)
+        small_user = next(user_id for user_id in user_ids if user_id != whale)
+        bystanders = [user_id for user_id in user_ids if user_id not in (whale, small_user)]
+        report["moves"] = [move_benchmark(client, shards, small_user, bystanders, "small user")]
+        if args.move_whale:
+            report["moves"].append(move_benchmark(client, shards, whale, bystanders, "whale"))
+        report["placement"]["tasks_per_shard"] = {
+            name: sizes["tasks"] for name, sizes in shard_sizes(shards).items()
+        }
+        report["training"] = training_benchmark(shards, args)
+    print(json.dumps(report, indent=2, default=str))
+
+    failures = []
+    for move in report["moves"]:
+        label = move["label"]
+        if set(move["requests"]["bystanders"]) != {200}:
+            failures.append(f"{label}: bystanders saw {move['requests']['bystanders']}")
+        if set(move["requests"]["moved_user"]) - {200, 503}:
+            failures.append(f"{label}: moved user saw {move['requests']['moved_user']}")
+        if not (move["ids_preserved"] and move["served_after_move"] and move["routed_to_target"]):
+            failures.append(f"{label}: rows or routing wrong after the move")
+        if move["left_on_source"]:
+            failures.append(f"{label}: {move['left_on_source']} tasks left on the source shard")
+    training = report["training"]
+    for name, rows in training["rows"].items():
+        # Shards the hash left with too few users have nothing to train on
+        if rows is not None and rows >= settings.min_data_points and training["prioritizer_rows"][name] != rows:
+            failures.append(f"training: {name} does not serve models trained on its own {rows} rows")
+    if failures:
+        sys.exit("Sharding checks failed: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
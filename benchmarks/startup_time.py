@@ -0,0 +1,117 @@
+"""Cold-start budget: import time of app.main and time until /health and /ready
+
+    python -m benchmarks.startup_time --runs 5 --budget-ms 2000
+
+Each measurement runs in a fresh interpreter. Import time comes from
+`python -X importtime`; the report lists the slowest top-level packages
+and fails (non-zero exit) when the median import exceeds the budget or
+when a heavy ML package is imported along with the app.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from typing import Tuple
+
+HEAVY_MODULES = ["pandas", "sklearn", "scipy", "numpy", "joblib", "transformers", "tokenizers", "torch"]
+
+# Runs the lifespan (migration, warm-up thread) and polls /ready until the models are loaded
+LIFESPAN_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import app
+imported = time.perf_counter()
+with TestClient(app) as client:
+    client.get("/health").raise_for_status()
+    healthy = time.perf_counter()
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.005)
+    ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "health_ms": (healthy - started) * 1000,
+    "ready_ms": (ready - started) * 1000,
+}))
+"""
+
+def run_python(args, env) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+def import_profile(env) -> Tuple[int, Counter]:
+    """app.main's cumulative import microseconds, and self time per top-level package"""
+    stderr = run_python(["-X", "importtime", "-c", "import app.main"], env).stderr
+    self_us = Counter()
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, total, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        self_us[name.split(".")[0]] += int(own)
+        cumulative[name] = int(total)
+    return cumulative["app.main"], self_us
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000.0, help="maximum median import time of app.main")
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level packages to report")
+    parser.add_argument("--model-warmup", default="background", choices=["background", "blocking", "off"])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        MODEL_DIR=os.path.join(workdir, "model_store"),
+        SCHEDULER="off",
+        MODEL_WARMUP=args.model_warmup,
+        PYTHONPATH=os.getcwd(),
+    )
+
+    import_ms = []
+    packages = Counter()
+    for _ in range(args.runs):
+        total_us, self_us = import_profile(env)
+        import_ms.append(total_us / 1000)
+        packages.update(self_us)
+
+    loaded = json.loads(run_python(["-c", (
+        "import json, sys, app.main; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )], env).stdout)
+
+    lifespan = [json.loads(run_python(["-c", LIFESPAN_PROBE], env).stdout) for _ in range(args.runs)]
+
+    median_import = statistics.median(import_ms)
+    report = {
+        "runs": args.runs,
+        "import_app_main_ms": {"median": round(median_import, 1), "max": round(max(import_ms), 1)},
+        "slowest_packages_ms": {
+            name: round(us / args.runs / 1000, 1) for name, us in packages.most_common(args.top)
+        },
+        "heavy_modules_imported": loaded,
+        "model_warmup": args.model_warmup,
+        **{
+            f"{stage}_median": round(statistics.median(run[stage] for run in lifespan), 1)
+            for stage in ("import_ms", "health_ms", "ready_ms")
+        },
+        "budget_ms": args.budget_ms,
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if median_import > args.budget_ms:
+        failures.append(f"app.main imports in {median_import:.0f}ms, over the {args.budget_ms:.0f}ms budget")
+    if loaded:
+        failures.append(f"app.main imports heavy modules eagerly: {', '.join(loaded)}")
+    if failures:
+        sys.exit("; ".join(failures))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Sentences per second and accuracy of the natural-language task parser on CPU
+
+    python -m benchmarks.task_parser --sentences 20000
+    python -m benchmarks.task_parser --model-dir ./models/task-tagger --batch-sizes 1 8 32 64
+
+Sentences are generated from templates with known title, deadline and
+hours, parsed against a fixed "now". Reports rule-path throughput on
+uncached texts, throughput on cache hits, field accuracy and, when a
+local model is given, batched tagging throughput. Nothing is downloaded.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+from datetime import datetime
+from app.task_parser import ParseCache, TaskParser, TransformerTagger
+
+NOW = datetime(2026, 10, 14, 10, 30)  # a Wednesday
+
+VERBS = [
+    "Finish", "Review", "Write", "Prepare", "Update", "Send", "Fix", "Plan", "Draft", "Call",
+    "Email", "Book", "Organize", "Clean up", "Refactor", "Test", "Document", "Schedule", "Submit", "Renew",
+]
+OBJECTS = [
+    "the quarterly report", "the onboarding guide", "slides for the board meeting", "the release notes",
+    "invoices for Acme", "the login bug", "the team offsite", "the budget proposal", "the dentist",
+    "the hiring plan", "the API docs", "the design review", "the customer survey", "the sprint retro",
+    "the vendor contract", "the expense report", "the backup job", "the roadmap", "the security audit",
+    "the newsletter", "the migration script", "the demo environment", "the client follow-up",
+    "the training deck", "the support tickets", "the passport application", "the tax forms",
+    "the analytics dashboard", "the partner agreement", "the performance review",
+]
+DEADLINES = [
+    ("by Friday at 5pm", datetime(2026, 10, 16, 17, 0)),
+    ("tomorrow morning", datetime(2026, 10, 15, 9, 0)),
+    ("by end of month", datetime(2026, 10, 31, 17, 0)),
+    ("next Tuesday", datetime(2026, 10, 20, 17, 0)),
+    ("in 2 hours", datetime(2026, 10, 14, 12, 30)),
+    ("by Nov 3rd", datetime(2026, 11, 3, 17, 0)),
+    ("on 11/1", datetime(2026, 11, 1, 17, 0)),
+    ("before 2026-12-01", datetime(2026, 12, 1, 17, 0)),
+    ("by 3:30pm", datetime(2026, 10, 14, 15, 30)),
+    ("eod", datetime(2026, 10, 14, 17, 0)),
+    ("by the 20th of October", datetime(2026, 10, 20, 17, 0)),
+    ("this weekend", datetime(2026, 10, 18, 17, 0)),
+    ("due Monday at noon", datetime(2026, 10, 19, 12, 0)),
+    ("", None),
+]
+DURATIONS = [
+    ("", None),
+    ("takes about 30 minutes", 0.5),
+    ("(2-3 hours)", 2.5),
+    ("~4h", 4.0),
+    ("for 1.5 hours", 1.5),
+    ("2 days", 16.0),
+]
+
+def synthetic_sentences(n: int, seed: int) -> list:
+    """(text, expected title, expected deadline, expected hours), all distinct"""
+    combos = list(itertools.product(VERBS, OBJECTS, DEADLINES, DURATIONS))
+    random.Random(seed).shuffle(combos)
+    sentences = []
+    for verb, obj, (deadline_text, deadline), (duration_text, hours) in combos[:n]:
+        title = f"{verb} {obj}"
+        text = " ".join(part for part in (title, deadline_text) if part)
+        if duration_text:
+            text = f"{text}, {duration_text}"
+        sentences.append((text, title, deadline, hours))
+    return sentences
+
+def throughput(fn, texts: list) -> float:
+    started = time.perf_counter()
+    fn(texts)
+    return round(len(texts) / (time.perf_counter() - started), 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--model-dir", help="local token-classification model to benchmark as well")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sentences = synthetic_sentences(args.sentences, args.seed)
+    texts = [text for text, *_ in sentences]
+    task_parser = TaskParser(cache=ParseCache(max_entries=len(texts)))
+
+    report = {
+        "sentences": len(texts),
+        "rules_uncached_per_second": throughput(lambda batch: task_parser.parse(batch, now=NOW), texts),
+        "cache_hits_per_second": throughput(lambda batch: task_parser.parse(batch, now=NOW), texts),
+        "cache": task_parser.cache.stats(),
+    }
+
+    results = task_parser.parse(texts, now=NOW)
+    correct = {"title": 0, "deadline": 0, "estimated_hours": 0}
+    for (_, title, deadline, hours), result in zip(sentences, results):
+        correct["title"] += result["title"] == title
+        correct["deadline"] += result["deadline"] == deadline
+        correct["estimated_hours"] += result["estimated_hours"] == hours
+    report["accuracy"] = {field: round(count / len(texts), 4) for field, count in correct.items()}
+
+    if args.model_dir:
+        try:
+            tagger = TransformerTagger(args.model_dir)
+        except Exception as exc:
+            report["model"] = {"unavailable": f"{type(exc).__name__}: {exc}"}
+        else:
+            sample = texts[:max(args.batch_sizes) * 20]
+            report["model"] = {}
+            for batch_size in args.batch_sizes:
+                tagger.batch_size = batch_size
+                tagger.tag(sample[:batch_size])  # warm-up
+                report["model"][f"batch_{batch_size}_per_second"] = throughput(tagger.tag, sample)
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
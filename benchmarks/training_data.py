@@ -0,0 +1,187 @@
+"""Load time and memory of training data: row dicts vs NumPy columns vs a memory-mapped snapshot
+
+    python -m benchmarks.training_data --completions 1000000
+    python -m benchmarks.training_data --completions 10000000 --url postgresql://localhost/bench
+
+Seeds a database (a temporary SQLite file unless --url is given), then runs
+each path in a fresh process and reports seconds and peak RSS above the
+post-import baseline:
+  dict_rows        iter_training_rows + pd.DataFrame, the previous training input
+  columns          load_training_columns into typed NumPy columns
+  snapshot_reopen  load_snapshot of the columns written by the previous step
+Also checks that both loaders produce the same values (exits non-zero if not).
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+FEATURES = {
+    "prioritizer": ["days_to_deadline", "task_age", "estimated_hours", "avg_completion_time", "productivity_score", "tasks_per_day"],
+    "deadline_predictor": ["estimated_hours", "task_length", "title_length", "avg_completion_time", "completion_variance"],
+}
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def iter_training_rows(db, chunk_size: int = 5000):
+    """The previous training input: labelled rows for completed tasks in chunks, as dicts
+
+    Kept here as the baseline load_training_columns is compared against and
+    checked for parity with; run_training reads columns.
+    """
+    from sqlalchemy import select
+    from app.ml_models.history_cache import UserHistoryStats
+    from app.ml_models.training import load_history_stats_by_user
+    from app.models import Task, TaskCompletion
+
+    history = load_history_stats_by_user(db)
+    default_history = UserHistoryStats()
+
+    result = db.execute(
+        select(
+            Task.user_id,
+            Task.title,
+            Task.description,
+            Task.estimated_hours,
+            Task.deadline,
+            Task.created_at,
+            Task.completed_at,
+            TaskCompletion.actual_hours
+        )
+        .join(TaskCompletion, TaskCompletion.task_id == Task.id)
+        .where(Task.completed == True, TaskCompletion.actual_hours.isnot(None))
+        .execution_options(yield_per=chunk_size)
+    )
+
+    for partition in result.partitions(chunk_size):
+        rows = []
+        for r in partition:
+            user_history = history.get(r.user_id, default_history)
+            completed_at = r.completed_at or r.created_at
+            rows.append({
+                # TaskPrioritizer features
+                "days_to_deadline": (r.deadline - r.created_at).days if r.deadline else 30,
+                "task_age": 0,
+                "estimated_hours": r.estimated_hours or 1.0,
+                "avg_completion_time": user_history.avg_completion_time,
+                "productivity_score": user_history.productivity_score,
+                "tasks_per_day": user_history.tasks_per_day,
+                # DeadlinePredictor features
+                "task_length": len(r.description) if r.description else 0,
+                "title_length": len(r.title) if r.title else 0,
+                "completion_variance": user_history.completion_variance,
+                # Labels
+                "was_completed_on_time": r.deadline is None or completed_at <= r.deadline,
+                "actual_hours_taken": r.actual_hours,
+            })
+        yield rows
+
+def run_path(path: str, chunk_size: int, snapshot: str, snapshot_format: str, results):
+    import numpy as np
+    from app.database import SessionLocal
+    from app.ml_models import columnar
+
+    db = SessionLocal()
+    baseline = rss_mb()
+    started = time.perf_counter()
+    report = {}
+
+    if path == "dict_rows":
+        import pandas as pd
+
+        rows = []
+        for chunk in iter_training_rows(db, chunk_size):
+            rows.extend(chunk)
+        df = pd.DataFrame(rows)
+        matrices = [df[features].values for features in FEATURES.values()]
+    elif path == "columns":
+        columns = columnar.load_training_columns(db, chunk_size)
+        matrices = [columns.matrix(features) for features in FEATURES.values()]
+        report["seconds"] = time.perf_counter() - started
+        saved = time.perf_counter()
+        columnar.save_snapshot(columns, snapshot, snapshot_format)
+        report["snapshot_write_seconds"] = round(time.perf_counter() - saved, 2)
+    elif path == "snapshot_reopen":
+        columns = columnar.load_snapshot(snapshot)
+        report["open_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        matrices = [columns.matrix(features) for features in FEATURES.values()]
+    else:  # parity
+        rows = [row for chunk in iter_training_rows(db, chunk_size) for row in chunk]
+        columns = columnar.load_training_columns(db, chunk_size)
+        mismatches = {}
+        for name in columnar.TRAINING_COLUMNS:
+            if name in ("user_id", "completion_id"):
+                continue
+            expected = np.array([row[name] for row in rows], dtype=columns[name].dtype)
+            mismatches[name] = int(np.sum(expected != columns[name])) if len(expected) == len(columns) else -1
+        results.put({"mismatches": mismatches, "rows": len(rows)})
+        return
+
+    report.setdefault("seconds", time.perf_counter() - started)
+    report["seconds"] = round(report["seconds"], 2)
+    report["rows"] = len(matrices[0])
+    report["peak_rss_mb"] = round(peak_rss_mb() - baseline, 1)
+    results.put(report)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--completions", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--snapshot-format", choices=["npy", "parquet"], default="npy")
+    parser.add_argument("--skip-parity", action="store_true", help="parity loads both paths at once")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = args.url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    snapshot = os.path.join(workdir, "training_snapshot")
+
+    from app.database import engine
+    from app.migrations import upgrade
+    from .seed import seed_database
+
+    completed_ratio = 0.8
+    upgrade(engine)
+    started = time.perf_counter()
+    rows = seed_database(
+        engine,
+        users=args.users,
+        tasks_per_user=math.ceil(args.completions / args.users / completed_ratio),
+        completed_ratio=completed_ratio
+    )
+    report = {"config": vars(args), "rows": rows, "seed_seconds": round(time.perf_counter() - started, 1)}
+
+    context = multiprocessing.get_context("spawn")  # a fresh interpreter per path, for clean peak RSS
+    results = context.Queue()
+    paths = ["dict_rows", "columns", "snapshot_reopen"] + ([] if args.skip_parity else ["parity"])
+    for path in paths:
+        process = context.Process(
+            target=run_path, args=(path, args.chunk_size, snapshot, args.snapshot_format, results)
+        )
+        process.start()
+        report[path] = results.get()
+        process.join()
+
+    print(json.dumps(report, indent=2))
+    parity = report.get("parity", {}).get("mismatches", {})
+    if any(parity.values()):
+        sys.exit(f"columnar loader differs from iter_training_rows: {parity}")
+
+if __name__ == "__main__":
+    main()
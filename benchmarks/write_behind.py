@@ -0,0 +1,150 @@
+"""Task completions per second: synchronous commits vs the write-behind queue
+
+    python -m benchmarks.write_behind --requests 2000 --concurrency 1 16 64
+    python -m benchmarks.write_behind --url postgresql://localhost/bench --synchronous FULL
+
+Seeds a database (a temporary SQLite file unless --url is given) and drives
+PUT /api/tasks/{id}/complete through an in-process ASGI client, once per
+mode and concurrency level:
+  sync          read, update, insert and commit in the request
+  write_behind  queued in a local SQLite WAL file and answered 202; a
+                CompletionWriter flushes batches in the background
+For write_behind, "rps" is the acknowledgement rate and "end_to_end_per_s"
+counts until the writer has committed every completion.
+
+Every request sends an Idempotency-Key; --replay of them are then sent
+again. Exits non-zero if a key produced two TaskCompletion rows, or a
+write-behind completion was lost or failed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from .api_load import drive, open_task_pool
+
+def completion_requests(open_tasks, prefix: str):
+    """Request factory for api_load.drive: the i-th completion, with a stable Idempotency-Key"""
+    tasks = list(open_tasks)
+
+    def make_request(scenario: str, i: int):
+        user_id, task_id = tasks[i]
+        return "PUT", f"/api/tasks/{task_id}/complete", {
+            "params": {"user_id": user_id, "actual_hours": 1.0 + i % 8},
+            "headers": {"Idempotency-Key": f"{prefix}-{i}"},
+        }
+    return make_request
+
+async def run(args) -> dict:
+    import httpx
+    from fastapi import FastAPI
+    from app.completion_queue import CompletionWriter, get_completion_queue
+    from app.config import settings
+    from app.database import engine
+    from app.migrations import upgrade
+    from app.routers import tasks
+    from .seed import seed_database
+
+    upgrade(engine)
+    report = {"config": vars(args)}
+    report["rows"] = seed_database(engine, users=args.users, tasks_per_user=args.tasks_per_user, completed_ratio=0.0)
+
+    app = FastAPI()
+    app.include_router(tasks.router, prefix="/api/tasks")
+    runs = [(mode, concurrency) for mode in args.modes for concurrency in args.concurrency]
+    pool = open_task_pool(engine, args.requests * len(runs), seed=42)
+    if len(pool) < args.requests * len(runs):
+        sys.exit(f"Need {args.requests * len(runs)} open tasks, seeded {len(pool)}; raise --tasks-per-user")
+
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for n, (mode, concurrency) in enumerate(runs):
+            prefix = f"{mode}@{concurrency}"
+            make_request = completion_requests(pool[n * args.requests:(n + 1) * args.requests], prefix)
+            settings.completion_queue = "sqlite" if mode == "write_behind" else "off"
+            writer = None
+            if mode == "write_behind":
+                writer = CompletionWriter(get_completion_queue())
+                writer.start()
+
+            started = time.perf_counter()
+            result = await drive(client, make_request, "complete_task", concurrency, args.requests, 0)
+            if writer is not None:
+                while writer.queue.pending():
+                    await asyncio.sleep(0.005)
+                result["end_to_end_per_s"] = round(args.requests / (time.perf_counter() - started), 1)
+
+            # Replays: the same keys again, after the originals were written
+            replays = int(args.requests * args.replay)
+            if replays:
+                replayed = await drive(client, make_request, "complete_task", concurrency, replays, 0)
+                result["replay_errors"] = replayed["errors"]
+            if writer is not None:
+                writer.stop(drain=True)
+                result["writer"] = writer.stats()
+            results[prefix] = result
+
+    report["results"] = results
+    report["completions_per_key"] = completions_per_key(engine, results)
+    return report
+
+def completions_per_key(engine, results) -> dict:
+    from sqlalchemy import func, select
+    from app.models import TaskCompletion
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(TaskCompletion.idempotency_key, func.count())
+            .where(TaskCompletion.idempotency_key.isnot(None))
+            .group_by(TaskCompletion.idempotency_key)
+        ).all()
+    counts = {}
+    for prefix in results:
+        per_key = [count for key, count in rows if key.rsplit("-", 1)[0] == prefix]
+        counts[prefix] = {"keys": len(per_key), "max_rows_per_key": max(per_key, default=0)}
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks-per-user", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=1000, help="completions per mode and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--modes", nargs="+", choices=["sync", "write_behind"], default=["sync", "write_behind"])
+    parser.add_argument("--replay", type=float, default=0.2, help="share of requests sent again with the same key")
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous of the queue file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = args.url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["COMPLETION_QUEUE_PATH"] = os.path.join(workdir, "completion_queue.db")
+    os.environ["COMPLETION_QUEUE_SYNCHRONOUS"] = args.synchronous
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    # The synchronous path may fail requests under contention (SQLite: "database is locked");
+    # those are reported, not failures. No key may ever produce two rows.
+    failures = [
+        f"{prefix}: {counts['max_rows_per_key']} rows for one key"
+        for prefix, counts in report["completions_per_key"].items() if counts["max_rows_per_key"] > 1
+    ]
+    failures += [
+        f"{prefix}: {counts['keys']} of {args.requests} completions written"
+        for prefix, counts in report["completions_per_key"].items()
+        if prefix.startswith("write_behind") and counts["keys"] != args.requests
+    ]
+    failures += [
+        f"{prefix}: {result['errors']} errors" for prefix, result in report["results"].items()
+        if prefix.startswith("write_behind") and (result["errors"] or result.get("replay_errors"))
+    ]
+    if failures:
+        sys.exit("Write-behind checks failed: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
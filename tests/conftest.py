@@ -0,0 +1,89 @@
+"""Shared fixtures: the app against three SQLite shards in a temporary directory
+
+Settings are read at import, so the environment is set here, before
+anything from app is imported.
+"""
+
+import itertools
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="task-manager-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'default.db')}",
+    "SHARD_URLS": json.dumps({
+        f"shard{n}": f"sqlite:///{os.path.join(_workdir, f'shard{n}.db')}" for n in range(3)
+    }),
+    "SHARD_DIRECTORY_TTL": "60",  # placements stay cached; the move tests shorten it
+    "MODEL_DIR": os.path.join(_workdir, "model_store"),
+    "MODEL_WARMUP": "off",
+    "SCHEDULER": "off",
+    "RESPONSE_CACHE_BACKEND": "off",
+    "COMPLETION_QUEUE": "off",
+    "COMPLETION_QUEUE_PATH": os.path.join(_workdir, "completion_queue.db"),
+    "PROFILE_DIR": os.path.join(_workdir, "profiles"),
+})
+
+_emails = itertools.count()
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:  # startup migrates every shard
+        yield client
+
+@pytest.fixture(scope="session")
+def shards(client):
+    from app.sharding import get_shards
+
+    return get_shards()
+
+@pytest.fixture
+def make_user(client):
+    def make_user() -> int:
+        n = next(_emails)
+        response = client.post("/api/users/", json={"email": f"user{n}@example.com", "name": f"User {n}"})
+        response.raise_for_status()
+        return response.json()["id"]
+    return make_user
+
+@pytest.fixture
+def make_tasks(client):
+    def make_tasks(user_id: int, count: int, completed: int = 0) -> list:
+        ids = []
+        for i in range(count):
+            response = client.post("/api/tasks/", params={"user_id": user_id}, json={
+                "title": f"Task {i}",
+                "description": "x" * (i % 7),
+                "deadline": "2030-01-01T00:00:00",
+                "estimated_hours": float(i % 8 + 1),
+            })
+            response.raise_for_status()
+            ids.append(response.json()["id"])
+        for i, task_id in enumerate(ids[:completed]):
+            client.put(
+                f"/api/tasks/{task_id}/complete", params={"user_id": user_id, "actual_hours": float(i % 5 + 1)}
+            ).raise_for_status()
+        return ids
+    return make_tasks
+
+@contextmanager
+def count_statements(engine):
+    """Collect the SQL statements executed on an engine inside the block"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,49 @@
+"""JSON array uploads are decoded element by element with bounded memory"""
+
+import io
+import json
+import pytest
+from app.bulk_import import _iter_json_array
+
+class CountingReader(io.StringIO):
+    """StringIO that remembers how many characters were read from it"""
+
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.consumed = 0
+
+    def read(self, size: int = -1) -> str:
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+ELEMENTS = [
+    {"title": "Plain", "estimated_hours": 2},
+    {"title": "Escapes \" \\ é 😀", "description": "x" * 40},
+    {"title": "Numbers", "estimated_hours": -12.5e-3, "extra": [True, False, None]},
+    {"title": "Nested", "extra": {"deep": [{"a": 1}, {"b": "c"}]}},
+]
+
+@pytest.mark.parametrize("read_size", [1, 3, 7, 64, 1 << 16])
+def test_elements_spanning_read_boundaries(read_size):
+    text = json.dumps(ELEMENTS, ensure_ascii=True)
+    records = list(_iter_json_array(io.StringIO(text), read_size=read_size))
+    assert records == [(row, element, None) for row, element in enumerate(ELEMENTS, start=1)]
+
+def test_malformed_element_stops_reading():
+    good = json.dumps({"title": "ok"})
+    body = "[" + good + ', {"title" "missing colon"}, ' + ", ".join([good] * 100000) + "]"
+    reader = CountingReader(body)
+    records = list(_iter_json_array(reader, read_size=1024))
+    assert records[0] == (1, {"title": "ok"}, None)
+    assert records[1][0] == 2 and records[1][2].startswith("Invalid JSON")
+    assert len(records) == 2
+    assert reader.consumed <= 2 * 1024
+
+def test_element_longer_than_the_cap():
+    body = '[{"title": "ok"}, {"title": "' + "x" * 100000 + '"}]'
+    reader = CountingReader(body)
+    records = list(_iter_json_array(reader, read_size=1024, max_element=10000))
+    assert records[0] == (1, {"title": "ok"}, None)
+    assert records[1] == (2, None, "Row is longer than 10000 characters")
+    assert reader.consumed <= 10000 + 2 * 1024
@@ -0,0 +1,77 @@
+"""The compiled forest must return exactly what scikit-learn does"""
+
+import numpy as np
+import pytest
+from app.config import settings
+from app.ml_models.compiled_forest import CompiledForest
+from app.ml_models.deadline_predictor import DeadlinePredictor
+from app.ml_models.prioritizer import TaskPrioritizer
+from benchmarks.compiled_forest import synthetic_rows
+
+@pytest.fixture(scope="module")
+def rng():
+    return np.random.default_rng(11)
+
+@pytest.fixture(scope="module", params=[TaskPrioritizer, DeadlinePredictor])
+def trained(request, rng):
+    predictor = request.param()
+    assert predictor.train(synthetic_rows(2000, rng))
+    features = np.array(
+        [[row[f] for f in predictor.FEATURES] for row in synthetic_rows(500, rng)], dtype=float
+    )
+    return predictor, features
+
+def sklearn_output(predictor, features):
+    X = predictor.scaler.transform(features)
+    if isinstance(predictor, TaskPrioritizer):
+        return predictor.model.predict_proba(X)
+    return predictor.model.predict(X)
+
+def compiled_output(compiled, predictor, features):
+    if isinstance(predictor, TaskPrioritizer):
+        return compiled.predict_proba(features)
+    return compiled.predict(features)
+
+def test_compiled_matches_sklearn(trained):
+    predictor, features = trained
+    compiled = CompiledForest.from_sklearn(predictor.model, predictor.scaler)
+    assert np.array_equal(compiled_output(compiled, predictor, features), sklearn_output(predictor, features))
+
+def test_saved_forest_matches_sklearn(trained, tmp_path):
+    predictor, features = trained
+    CompiledForest.from_sklearn(predictor.model, predictor.scaler).save(str(tmp_path))
+    compiled = CompiledForest.load(str(tmp_path))
+    assert np.array_equal(compiled_output(compiled, predictor, features), sklearn_output(predictor, features))
+
+def test_scores_match_across_backends(trained, monkeypatch):
+    predictor, features = trained
+    monkeypatch.setattr(settings, "compiled_max_batch", len(features))
+    predictor.compiled = None
+    sklearn_scores = predictor._score_matrix(features)
+    predictor.compile()
+    try:
+        assert predictor._score_matrix(features) == sklearn_scores
+    finally:
+        predictor.compiled = None
+
+def test_registry_serves_the_shared_tables_without_the_pickle(trained, tmp_path):
+    from app.ml_models.registry import ModelRegistry
+
+    predictor, features = trained
+    name = "prioritizer" if isinstance(predictor, TaskPrioritizer) else "deadline_predictor"
+    registry = ModelRegistry(str(tmp_path))
+    registry.save(name, predictor)
+    loaded = registry.load(name)
+
+    # Larger than compiled_max_batch, which would otherwise unpickle a private copy of the forest
+    rows = np.tile(features, (2, 1))
+    assert len(rows) > settings.compiled_max_batch
+    predictor.compile()
+    try:
+        assert loaded._score_matrix(rows) == predictor._score_matrix(rows[:settings.compiled_max_batch]) + \
+            predictor._score_matrix(rows[settings.compiled_max_batch:])
+    finally:
+        predictor.compiled = None
+    assert loaded._model is None
+    assert any(isinstance(array, np.memmap) for array in vars(loaded.compiled).values())
+    assert loaded.model is not None  # still there for the sklearn backend, on first use
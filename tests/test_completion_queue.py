@@ -0,0 +1,102 @@
+"""Queued completions: one per task, dead-lettered when they keep failing, retried forever never
+
+Every test runs on both backends; Redis ones are skipped without a server at settings.redis_url.
+"""
+
+import uuid
+import pytest
+from app import completion_queue
+from app.completion_queue import (
+    DUPLICATE, QUEUED, TASK_PENDING, CompletionWriter, RedisCompletionQueue, SQLiteCompletionQueue, completion_event
+)
+from app.config import settings
+from .test_completions import complete, completions_of
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_queue(request, tmp_path):
+    queues = []
+
+    def make_queue(claim_timeout: float = 30.0):
+        if request.param == "sqlite":
+            queue = SQLiteCompletionQueue(str(tmp_path / f"queue{len(queues)}.db"), claim_timeout=claim_timeout)
+        else:
+            import redis
+
+            try:
+                redis.Redis.from_url(settings.redis_url).ping()
+            except redis.RedisError:
+                pytest.skip(f"no Redis server at {settings.redis_url}")
+            queue = RedisCompletionQueue(
+                settings.redis_url, stream=f"test-completions-{uuid.uuid4().hex}", claim_timeout=claim_timeout
+            )
+        queues.append(queue)
+        return queue
+
+    yield make_queue
+    for queue in queues:
+        if queue.backend == "redis":
+            queue.client.delete(queue.stream, queue.dead_stream, *queue.client.keys(f"{queue.stream}:*"))
+
+def test_failing_completion_is_dead_lettered(client, shards, make_user, make_tasks, make_queue):
+    user_id = make_user()
+    good, bad = make_tasks(user_id, 2)
+    queue = make_queue(claim_timeout=0)
+    queue.append(completion_event(good, user_id, 2.0))
+    queue.append(completion_event(bad, user_id, "two hours"))  # fails the rollup sum
+    writer = CompletionWriter(queue, max_attempts=3)
+
+    # The batch fails as a whole until the last attempt, which isolates the bad completion
+    for attempt in range(1, 4):
+        writer.flush()
+        assert completions_of(shards, user_id, good) == (attempt == 3)
+    assert completions_of(shards, user_id, bad) == 0
+    assert writer.stats()["failed_batches"] == 3
+    assert queue.pending() == 0 and queue.dead_letters() == 1
+    assert writer.flush() == 0
+
+def test_released_claims_are_not_attempts(make_queue):
+    queue = make_queue()
+    queue.append(completion_event(1, 1, 1.0))
+    for _ in range(3):
+        claimed = queue.claim(10)
+        assert [attempts for _, _, attempts in claimed] == [1]
+        queue.release(claimed)
+
+def test_one_queued_completion_per_task(make_queue):
+    queue = make_queue()
+    first = completion_event(1, 1, 1.0)
+    assert queue.append(first) == QUEUED
+    assert queue.append(first) == DUPLICATE
+    assert queue.append(completion_event(1, 1, 2.0)) == TASK_PENDING
+
+    # Once flushed, the database answers for the task
+    queue.ack(queue.claim(10))
+    assert queue.append(completion_event(1, 1, 2.0)) == QUEUED
+
+@pytest.mark.parametrize("prefix", ["/api/tasks", "/api/async/tasks"])
+def test_second_key_for_a_queued_task_is_rejected(client, shards, make_user, make_tasks, make_queue, monkeypatch, prefix):
+    queue = make_queue()
+    monkeypatch.setattr(settings, "completion_queue", queue.backend)
+    monkeypatch.setattr(completion_queue, "_completion_queue", queue)
+    user_id = make_user()
+    (task_id,) = make_tasks(user_id, 1)
+
+    assert complete(client, prefix, user_id, task_id, **{"Idempotency-Key": f"first-{task_id}"}).status_code == 202
+    assert complete(client, prefix, user_id, task_id, **{"Idempotency-Key": f"second-{task_id}"}).status_code == 409
+    assert complete(client, prefix, user_id, task_id).status_code == 409
+    assert complete(client, prefix, user_id, task_id, **{"Idempotency-Key": f"first-{task_id}"}).status_code == 202
+
+    writer = CompletionWriter(queue)
+    writer.flush()
+    assert completions_of(shards, user_id, task_id) == 1
+    assert complete(client, prefix, user_id, task_id).status_code == 409
+
+def test_completion_of_a_completed_task_is_counted(client, shards, make_user, make_tasks, make_queue):
+    user_id = make_user()
+    (task_id,) = make_tasks(user_id, 1, completed=1)
+    queue = make_queue()
+    queue.append(completion_event(task_id, user_id, 1.0))
+    writer = CompletionWriter(queue)
+    writer.flush()
+    assert writer.stats()["already_completed"] == 1 and writer.stats()["duplicates"] == 0
+    assert completions_of(shards, user_id, task_id) == 1
@@ -0,0 +1,50 @@
+"""A task is completed once: repeats neither log a second completion nor move the rollup"""
+
+from sqlalchemy import func, select
+from app.completion_queue import apply_completions, completion_event
+from app.models import TaskCompletion
+
+def completions_of(shards, user_id: int, task_id: int) -> int:
+    with shards.session(user_id) as db:
+        return db.scalar(select(func.count(TaskCompletion.id)).where(TaskCompletion.task_id == task_id))
+
+def completed_today(client, user_id: int) -> int:
+    response = client.get(f"/api/analytics/productivity/{user_id}", params={"days": 1})
+    response.raise_for_status()
+    return sum(day["completed"] for day in response.json()["daily_completions"])
+
+def complete(client, prefix: str, user_id: int, task_id: int, **headers):
+    return client.put(
+        f"{prefix}/{task_id}/complete", params={"user_id": user_id, "actual_hours": 2.0}, headers=headers
+    )
+
+def test_completing_twice_is_rejected(client, shards, make_user, make_tasks):
+    user_id = make_user()
+    first, second = make_tasks(user_id, 2)
+    for prefix, task_id in (("/api/tasks", first), ("/api/async/tasks", second)):
+        assert complete(client, prefix, user_id, task_id).status_code == 200
+        assert complete(client, prefix, user_id, task_id).status_code == 409
+        assert completions_of(shards, user_id, task_id) == 1
+    assert completed_today(client, user_id) == 2
+
+def test_retry_with_the_same_key_is_acknowledged(client, shards, make_user, make_tasks):
+    user_id = make_user()
+    (task_id,) = make_tasks(user_id, 1)
+    for _ in range(3):
+        response = complete(client, "/api/tasks", user_id, task_id, **{"Idempotency-Key": f"retry-{task_id}"})
+        assert response.status_code == 200
+    assert completions_of(shards, user_id, task_id) == 1
+    assert completed_today(client, user_id) == 1
+
+def test_write_behind_skips_completed_tasks(client, shards, make_user, make_tasks):
+    user_id = make_user()
+    (task_id,) = make_tasks(user_id, 1)
+    events = [completion_event(task_id, user_id, 1.0), completion_event(task_id, user_id, 3.0)]
+    with shards.session(user_id) as db:
+        result = apply_completions(db, events)
+        db.commit()
+    assert [event["key"] for event in result["applied"]] == [events[0]["key"]]
+    with shards.session(user_id) as db:
+        assert apply_completions(db, [completion_event(task_id, user_id, 5.0)])["applied"] == []
+    assert completions_of(shards, user_id, task_id) == 1
+    assert completed_today(client, user_id) == 1
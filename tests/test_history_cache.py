@@ -0,0 +1,82 @@
+"""History cache: Welford write-through matches the database, and the least recently used users are evicted
+
+Every test runs on both backends; Redis ones are skipped without a server at settings.redis_url.
+"""
+
+import uuid
+import numpy as np
+import pytest
+from app.config import settings
+from app.ml_models.history_cache import (
+    InMemoryHistoryCache, RedisHistoryCache, UserHistoryStats, load_user_history_stats
+)
+from .test_completions import complete
+
+@pytest.fixture(params=["memory", "redis"])
+def make_cache(request):
+    caches = []
+
+    def make_cache(max_entries: int = 10000):
+        if request.param == "memory":
+            cache = InMemoryHistoryCache(max_entries=max_entries)
+        else:
+            import redis
+
+            try:
+                redis.Redis.from_url(settings.redis_url).ping()
+            except redis.RedisError:
+                pytest.skip(f"no Redis server at {settings.redis_url}")
+            cache = RedisHistoryCache(
+                settings.redis_url, max_entries=max_entries, prefix=f"test-history-{uuid.uuid4().hex}:"
+            )
+        caches.append(cache)
+        return cache
+
+    yield make_cache
+    for cache in caches:
+        if cache.backend == "redis":
+            cache.client.delete(*cache.client.keys(f"{cache.prefix}*"))
+
+def test_welford_updates_match_the_batch_statistics(make_cache):
+    hours = [2.0, 0.5, 7.25, 3.0, 3.0, 11.5]
+    stats = UserHistoryStats()
+    for value in hours[:2]:
+        stats.add_completion(value)
+    cache = make_cache()
+    cache.set(1, stats)
+    for value in hours[2:]:
+        cache.record_completion(1, value)
+
+    cached = cache.get(1)
+    assert cached.completion_count == len(hours)
+    assert cached.avg_completion_time == pytest.approx(np.mean(hours))
+    assert cached.completion_variance == pytest.approx(np.var(hours))
+
+def test_write_through_matches_a_reload(client, shards, make_user, make_tasks, make_cache):
+    user_id = make_user()
+    task_ids = make_tasks(user_id, 6, completed=3)
+    cache = make_cache()
+    with shards.session(user_id) as db:
+        cache.set(user_id, load_user_history_stats(db, user_id))
+
+    for task_id in task_ids[3:]:
+        assert complete(client, "/api/tasks", user_id, task_id).status_code == 200
+        # What the completion endpoint writes through
+        cache.record_completion(user_id, 2.0)
+    with shards.session(user_id) as db:
+        reloaded = load_user_history_stats(db, user_id)
+    cached = cache.get(user_id)
+    assert cached.completion_count == reloaded.completion_count == 6
+    assert cached.avg_completion_time == pytest.approx(reloaded.avg_completion_time)
+    assert cached.completion_variance == pytest.approx(reloaded.completion_variance)
+
+def test_least_recently_used_user_is_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set(1, UserHistoryStats(completion_count=1))
+    cache.set(2, UserHistoryStats(completion_count=2))
+    assert cache.get(1) is not None
+
+    cache.set(3, UserHistoryStats(completion_count=3))
+    assert cache.get(2) is None
+    assert cache.get(1).completion_count == 1 and cache.get(3).completion_count == 3
+    assert cache.stats()["evictions"] == 1 and cache.stats()["size"] == 2
@@ -0,0 +1,20 @@
+"""upgrade() brings an older schema up to date"""
+
+from sqlalchemy import create_engine, inspect, text
+from app.migrations import upgrade
+
+def test_superseded_rollup_index_is_dropped(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE productivity_logs (id INTEGER PRIMARY KEY, user_id INTEGER, date DATETIME,"
+            " tasks_completed INTEGER, hours_worked FLOAT, productivity_score FLOAT)"
+        ))
+        conn.execute(text("CREATE INDEX ix_productivity_logs_user_date ON productivity_logs (user_id, date)"))
+
+    upgrade(engine)
+    indexes = {index["name"] for index in inspect(engine).get_indexes("productivity_logs")}
+    assert "ix_productivity_logs_user_date" not in indexes
+    assert "ux_productivity_logs_user_date" in indexes
+    assert "tasks_on_time" in {column["name"] for column in inspect(engine).get_columns("productivity_logs")}
+    upgrade(engine)  # idempotent
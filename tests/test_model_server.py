@@ -0,0 +1,93 @@
+"""With the model-server sidecar, workers score and explain through it and never load the forests themselves"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from app.ml_models.history_cache import UserHistoryStats
+from app.ml_models.model_server import ModelServer, ModelServerClient, ModelServerUnavailable, RemoteModelRegistry
+from app.ml_models.registry import MODEL_CLASSES, ModelRegistry, model_class
+from app.ml_models.scoring import compute_scores, explain_scores
+from app.models import Task
+from benchmarks.compiled_forest import synthetic_rows
+
+@pytest.fixture
+def model_server(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "models"))
+    rows = synthetic_rows(600, np.random.default_rng(5))
+    for name in MODEL_CLASSES:
+        predictor = model_class(name, "batch")()
+        predictor.model.set_params(n_estimators=10)
+        assert predictor.train(rows)
+        registry.save(name, predictor)
+
+    path = str(tmp_path / "models.sock")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(ModelServer(registry).serve(path), loop)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    async def shutdown():
+        # The listener, the batchers and open connections
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+        await asyncio.sleep(0.05)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    yield registry, path, stop
+    if thread.is_alive():
+        stop()
+
+def tasks():
+    now = datetime.utcnow()
+    return [
+        Task(title=f"Task {i}", description="x" * i, estimated_hours=float(i + 1),
+             deadline=now + timedelta(days=i), created_at=now)
+        for i in range(5)
+    ]
+
+def test_worker_scores_and_explains_remotely(model_server):
+    registry, path, _ = model_server
+    worker_store = ModelRegistry(registry.root)
+    remote = RemoteModelRegistry(ModelServerClient(path), worker_store)
+
+    history = UserHistoryStats()
+    for remote_scores, local_scores in zip(
+        compute_scores(tasks(), 1, history=history, registry=remote),
+        compute_scores(tasks(), 1, history=history, registry=registry)
+    ):
+        assert remote_scores["priority"] == local_scores["priority"]
+        assert remote_scores["predicted_hours"] == pytest.approx(local_scores["predicted_hours"])
+        assert remote_scores["model_version"] == local_scores["model_version"]
+    assert explain_scores(tasks(), 1, history=history, registry=remote) == \
+        explain_scores(tasks(), 1, history=history, registry=registry)
+    assert worker_store._loaded == {}
+
+def test_worker_uses_the_rules_while_the_server_is_down(model_server):
+    registry, path, stop = model_server
+    worker_store = ModelRegistry(registry.root)
+    remote = RemoteModelRegistry(ModelServerClient(path, timeout=0.5), worker_store)
+    prioritizer = remote.get("prioritizer")
+    assert prioritizer.remote is not None
+
+    stop()
+    # The request that hits the failure, and the ones after it, are scored by the rules
+    scores = compute_scores(tasks(), 1, history=UserHistoryStats(), registry=remote)
+    assert {score["model_version"] for score in scores} == {"rules/rules"}
+    with pytest.raises(ModelServerUnavailable):
+        prioritizer._score_matrix(prioritizer.extract_feature_matrix(tasks(), UserHistoryStats()))
+    assert explain_scores(tasks(), 1, history=UserHistoryStats(), registry=remote)[0]["priority"] is None
+    assert not remote.get("deadline_predictor").is_trained
+    assert worker_store._loaded == {}
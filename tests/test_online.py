@@ -0,0 +1,124 @@
+"""Online models: updates rescore only the users they learned from, and confidence comes from the residuals"""
+
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func, select, update
+from app.config import settings
+from app.ml_models.online import OnlineDeadlinePredictor, UserResiduals, run_online_update
+from app.ml_models.registry import ModelRegistry
+from app.ml_models.scoring import model_version_tag, rescore_stale_tasks
+from app.models import Task, TaskCompletion
+from benchmarks.compiled_forest import synthetic_rows
+
+def same_shard_users(make_user, shards):
+    first = make_user()
+    while True:
+        second = make_user()
+        if shards.name_for(second) == shards.name_for(first):
+            return first, second
+
+def test_online_update_rescores_only_learned_users(client, shards, make_user, make_tasks, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "online_min_rows", 1)
+    monkeypatch.setattr(settings, "rescore_batch_pause", 0)
+    learner, bystander = same_shard_users(make_user, shards)
+    learner_tasks = make_tasks(learner, 15, completed=12)
+    make_tasks(bystander, 2)
+
+    registry = ModelRegistry(str(tmp_path))
+    db = shards.session(learner)
+    try:
+        assert run_online_update(db, registry)["models"]["deadline_predictor"]["status"] == "published"
+        rescore_stale_tasks(db, registry, max_tasks=10_000)
+        tag = model_version_tag(registry.get("prioritizer"), registry.get("deadline_predictor"))
+
+        client.put(
+            f"/api/tasks/{learner_tasks[12]}/complete", params={"user_id": learner, "actual_hours": 2.0}
+        ).raise_for_status()
+        report = run_online_update(db, registry)
+        assert report["models"]["deadline_predictor"]["status"] == "published"
+        assert report["flagged_users"] == 1
+
+        # A new online version keeps the tag, so only the learner's open tasks are stale
+        registry.reload_interval = 0
+        assert model_version_tag(registry.get("prioritizer"), registry.get("deadline_predictor")) == tag
+        flagged = db.scalars(select(Task.user_id).where(Task.needs_rescore == True)).all()
+        assert sorted(flagged) == [learner, learner]
+        assert rescore_stale_tasks(db, registry, max_tasks=10_000)["rescored"] == 2
+    finally:
+        db.close()
+
+def test_completion_committed_late_is_learned_once(client, shards, make_user, make_tasks, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "online_min_rows", 1)
+    user_id = make_user()
+    task_ids = make_tasks(user_id, 15, completed=12)
+    registry = ModelRegistry(str(tmp_path))
+    db = shards.session(user_id)
+    try:
+        assert run_online_update(db, registry)["models"]["deadline_predictor"]["status"] == "published"
+
+        # Completed before the run but committed after it, with an id below every one it learned
+        completed_at = datetime.fromisoformat(registry.metadata("deadline_predictor")["training"]["learned_until"])
+        completed_at -= timedelta(minutes=1)
+        db.execute(update(Task).where(Task.id == task_ids[12]).values(completed=True, completed_at=completed_at))
+        db.add(TaskCompletion(
+            id=db.scalar(select(func.min(TaskCompletion.id))) - settings.shard_id_stride,
+            task_id=task_ids[12], user_id=user_id, actual_hours=3.0, completion_date=completed_at
+        ))
+        db.commit()
+
+        report = run_online_update(db, registry)
+        assert report["models"]["deadline_predictor"]["rows"] == 1 and report["flagged_users"] == 1
+        assert run_online_update(db, registry)["models"]["deadline_predictor"]["rows"] == 0
+    finally:
+        db.close()
+
+def test_deadline_confidence_follows_residual_spread():
+    rng = np.random.default_rng(3)
+    rows = synthetic_rows(3000, rng)
+    for i, row in enumerate(rows):
+        # User 2's completions land much further from the estimate than user 1's
+        row["user_id"] = 1 + i % 2
+        if row["user_id"] == 2:
+            row["actual_hours_taken"] *= float(rng.lognormal(0, 1.0))
+    predictor = OnlineDeadlinePredictor()
+    assert predictor.train(rows)
+    X = np.array([[row[f] for f in predictor.FEATURES] for row in rows[:50]], dtype=float)
+
+    steady = [confidence for _, confidence in predictor._score_matrix(X, user_id=1)]
+    noisy = [confidence for _, confidence in predictor._score_matrix(X, user_id=2)]
+    assert all(0 < n < s < 1 for s, n in zip(steady, noisy))
+
+    for explanation, (hours, confidence) in zip(predictor.explain_matrix(X, 2), predictor._score_matrix(X, 2)):
+        uncertainty = explanation["uncertainty"]
+        assert uncertainty["std"] > 0 and uncertainty["confidence"] == round(confidence, 4)
+        assert uncertainty["p10"] <= round(hours, 4) <= uncertainty["p90"]
+
+def test_residuals_published_without_variances_still_load():
+    residuals = UserResiduals()
+    residuals.update(np.array([7, 7]), np.array([1.0, 3.0]))
+    assert residuals.variance(7) == residuals.variance() == 1.0
+
+    # What unpickling a version saved before the spread was kept does
+    state = {key: vars(residuals)[key] for key in ("decay", "prior", "mean", "count")}
+    old = UserResiduals.__new__(UserResiduals)
+    old.__setstate__(state)
+    assert old.correction(7) == residuals.correction(7) and old.variance(7) is None
+
+def test_scaler_is_frozen_between_full_trains():
+    rng = np.random.default_rng(4)
+    predictor = OnlineDeadlinePredictor()
+    assert predictor.train(synthetic_rows(500, rng))
+    mean, scale = predictor.scaler.mean_.copy(), predictor.scaler.scale_.copy()
+    weights = predictor.model.coef_.copy()
+
+    # Rows from a shifted distribution move the coefficients, never the scaler under them
+    shifted = synthetic_rows(200, rng)
+    for row in shifted:
+        row["estimated_hours"] *= 5
+    predictor.partial_fit(shifted)
+    assert np.array_equal(predictor.scaler.mean_, mean) and np.array_equal(predictor.scaler.scale_, scale)
+    assert not np.array_equal(predictor.model.coef_, weights)
+
+    # A full retrain fits it again
+    predictor.train(shifted)
+    assert not np.array_equal(predictor.scaler.mean_, mean)
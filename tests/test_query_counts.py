@@ -0,0 +1,39 @@
+"""Statements per request must not grow with the number of tasks or completions"""
+
+import pytest
+from .conftest import count_statements
+
+SIZES = (5, 40)
+
+def statements_per_request(client, shards, user_id: int, path: str, params: dict) -> int:
+    engine = shards.for_user(user_id).engine
+    client.get(path, params=params).raise_for_status()  # placement and history caches warm
+    with count_statements(engine) as statements:
+        response = client.get(path, params=params)
+        response.raise_for_status()
+        response.read()
+    return len(statements)
+
+@pytest.mark.parametrize("path, params", [
+    ("/api/tasks/", {}),
+    ("/api/tasks/", {"limit": 1000}),
+    ("/api/tasks/", {"stream": True}),
+    ("/api/tasks/", {"explain": True}),
+])
+def test_task_listing_is_constant_in_tasks(client, shards, make_user, make_tasks, path, params):
+    counts = []
+    for size in SIZES:
+        user_id = make_user()
+        make_tasks(user_id, size, completed=size // 2)
+        counts.append(statements_per_request(client, shards, user_id, path, {"user_id": user_id, **params}))
+    assert counts[0] == counts[1], counts
+
+def test_predictions_are_constant_in_completions(client, shards, make_user, make_tasks):
+    counts = []
+    for size in SIZES:
+        user_id = make_user()
+        make_tasks(user_id, size, completed=size)
+        counts.append(statements_per_request(
+            client, shards, user_id, f"/api/analytics/predictions/{user_id}", {"lookback": size}
+        ))
+    assert counts[0] == counts[1], counts
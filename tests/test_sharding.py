@@ -0,0 +1,103 @@
+"""Users live on one of several SQLite shards: routing, ids unique across shards, and moving a user online"""
+
+import threading
+from sqlalchemy import func, select
+from app import sharding
+from app.completion_queue import apply_completions, completion_event
+from app.config import settings
+from app.models import Task
+from app.sharding import move_user
+from .conftest import count_statements
+from .test_completions import completed_today, completions_of
+
+def tasks_on(shard, user_id: int) -> list:
+    with shard.session() as db:
+        return sorted(db.scalars(select(Task.id).where(Task.user_id == user_id)))
+
+def user_per_shard(make_user, shards) -> dict:
+    users = {}
+    while len(users) < len(shards.names):
+        user_id = make_user()
+        users.setdefault(shards.name_for(user_id), user_id)
+    return users
+
+def test_rows_are_written_to_the_users_shard(client, shards, make_user, make_tasks):
+    for name, user_id in user_per_shard(make_user, shards).items():
+        task_ids = make_tasks(user_id, 3, completed=1)
+        for shard in shards:
+            assert tasks_on(shard, user_id) == (task_ids if shard.name == name else [])
+        response = client.get("/api/tasks/", params={"user_id": user_id})
+        assert sorted(task["id"] for task in response.json()) == task_ids
+
+def test_ids_are_unique_across_shards(client, shards, make_user, make_tasks):
+    for user_id in user_per_shard(make_user, shards).values():
+        make_tasks(user_id, 5, completed=2)
+    ids = []
+    for shard in shards:
+        with shard.session() as db:
+            shard_ids = db.scalars(select(Task.id)).all()
+        assert shard_ids and {task_id % settings.shard_id_stride for task_id in shard_ids} == {shard.number}
+        ids.extend(shard_ids)
+    assert len(ids) == len(set(ids))
+
+def test_flush_reserves_ids_with_one_counter_update(shards, make_user):
+    user_id = make_user()
+    shard = shards.for_user(user_id)
+    with shard.session() as db, count_statements(shard.engine) as statements:
+        db.add_all([Task(user_id=user_id, title=f"Task {i}") for i in range(20)])
+        db.commit()
+    assert sum("id_counters" in statement for statement in statements) == 1
+    ids = tasks_on(shard, user_id)
+    assert len(ids) == 20 and {task_id % settings.shard_id_stride for task_id in ids} == {shard.number}
+
+def test_move_user_while_serving(client, shards, make_user, make_tasks, monkeypatch):
+    monkeypatch.setattr(settings, "shard_directory_ttl", 0.2)
+    monkeypatch.setattr(settings, "shard_move_grace", 0.3)
+    user_id, other_id = make_user(), make_user()
+    task_ids = make_tasks(user_id, 4, completed=2)
+    make_tasks(other_id, 1)
+    source = shards[shards.name_for(user_id)]
+    target = next(shard for shard in shards if shard.name != source.name)
+
+    copy_user = sharding._copy_user
+
+    def copy_then_complete(*args):
+        copied = copy_user(*args)
+        # A queued completion that outlasted the grace period lands on the source after the copy
+        with source.session() as db:
+            apply_completions(db, [completion_event(task_ids[2], user_id, 3.0)])
+            db.commit()
+        return copied
+
+    monkeypatch.setattr(sharding, "_copy_user", copy_then_complete)
+    report = {}
+    mover = threading.Thread(target=lambda: report.update(move_user(user_id, target.name, shards)))
+    mover.start()
+    during, others = [], []
+    while mover.is_alive():
+        during.append(client.get("/api/tasks/", params={"user_id": user_id}))
+        others.append(client.get("/api/tasks/", params={"user_id": other_id}).status_code)
+    mover.join()
+
+    # The user is answered 503 with Retry-After while moving; other users are not affected
+    unavailable = [response for response in during if response.status_code == 503]
+    assert unavailable and all(response.headers["Retry-After"] for response in unavailable)
+    assert {response.status_code for response in during} <= {200, 503}
+    assert set(others) == {200}
+
+    assert report["status"] == "moved" and report["rows"]["tasks"] == 4
+    assert shards.name_for(user_id) == target.name
+    assert tasks_on(target, user_id) == task_ids and tasks_on(source, user_id) == []
+
+    # The late completion, the task it updated and the day's rollup all made it across
+    assert report["late_rows"]["task_completions"] == 1 and report["late_rows"]["tasks"] == 1
+    assert completions_of(shards, user_id, task_ids[2]) == 1 and completed_today(client, user_id) == 3
+
+    # Moved rows keep their ids; new ones come from the target's residue class
+    response = client.get("/api/tasks/", params={"user_id": user_id})
+    assert sorted(task["id"] for task in response.json()) == task_ids
+    assert [task["completed"] for task in response.json()].count(True) == 3
+    new_id = make_tasks(user_id, 1)[0]
+    assert new_id % settings.shard_id_stride == target.number
+    with target.session() as db:
+        assert db.scalar(select(func.count()).select_from(Task).where(Task.user_id == user_id)) == 5
@@ -0,0 +1,33 @@
+"""Relative deadlines resolve against the day they are read on"""
+
+from datetime import date, datetime
+import pytest
+from app.task_parser import parse_deadline, parse_rules
+
+def resolve(text: str, now: datetime) -> date:
+    expr, _ = parse_deadline(text)
+    return expr.resolve(now).date()
+
+# Mon 2026-10-12 .. Sun 2026-10-18; "next week" is always the Friday after, like "next friday"
+@pytest.mark.parametrize("day", range(12, 19))
+def test_next_week_is_fridays_of_the_following_week(day):
+    now = datetime(2026, 10, day, 10, 0)
+    assert resolve("finish the report next week", now) == date(2026, 10, 23)
+    assert resolve("finish the report next friday", now) == date(2026, 10, 23)
+
+def test_end_of_week_is_the_coming_friday():
+    assert resolve("finish the report by end of week", datetime(2026, 10, 14, 10, 0)) == date(2026, 10, 16)
+    assert resolve("finish the report by end of week", datetime(2026, 10, 17, 10, 0)) == date(2026, 10, 23)
+
+def test_bare_short_weekday_stays_in_the_title():
+    saturday = datetime(2026, 10, 17, 10, 0)
+    parsed = parse_rules("Plan the sat trip")
+    assert parsed.deadline is None and parsed.title == "Plan the sat trip"
+    assert resolve("Plan the trip by sat", saturday) == date(2026, 10, 17)
+    assert resolve("Plan the trip next sat", saturday) == date(2026, 10, 24)
+
+def test_fractional_day_offset_is_exact():
+    now = datetime(2026, 10, 17, 10, 0)
+    expr, _ = parse_deadline("Deploy in 1.5 days")
+    assert expr.resolve(now) == datetime(2026, 10, 18, 22, 0)
+    assert resolve("Deploy in 2 days", now) == date(2026, 10, 19)